@@ -1,7 +1,8 @@
 # web_app.py
 import streamlit as st
-import tempfile
-import os
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
 import json
 import sys
@@ -9,26 +10,102 @@ import sys
 # Добавляем пути для импорта
 sys.path.append(str(Path(__file__).parent.parent))
 
-from detection_services import DigitalInspector
-
-def pdf_to_images(pdf_path):
-    """Конвертирует PDF в изображения используя PyMuPDF"""
-    import fitz
-    from PIL import Image
-    import io
-    
-    doc = fitz.open(pdf_path)
-    images = []
-    
-    for page in doc:
-        mat = fitz.Matrix(2, 2)  # 2x масштаб для качества
-        pix = page.get_pixmap(matrix=mat)
-        img_data = pix.tobytes("ppm")
-        img = Image.open(io.BytesIO(img_data))
-        images.append(img)
-    
-    doc.close()
-    return images
+from services.fake_inspector import make_inspector
+from services.pipeline import PDF_ZOOM, count_pages, detect_page, iter_document_images
+from services.render_cache import document_key
+
+# Ширина превью на экране: полный рендер 2x (~2400 px) браузеру не нужен
+PREVIEW_WIDTH = 900
+# Сколько проанализированных документов держать в памяти между перезапусками скрипта
+MAX_JOBS = 16
+# Как часто перерисовывать страницу, пока анализ идет
+POLL_INTERVAL_S = 0.5
+
+rerun = getattr(st, "rerun", None) or st.experimental_rerun
+
+
+@st.cache_resource
+def load_inspector():
+    """Модели загружаются один раз на процесс Streamlit, а не на сессию"""
+    return make_inspector()
+
+
+@st.cache_resource
+def job_store():
+    """Задачи анализа по хешу файла, общие для всех перезапусков и сессий"""
+    return {"jobs": OrderedDict(), "lock": threading.Lock()}
+
+
+def make_preview(inspector, image, detections=None, width=PREVIEW_WIDTH):
+    """Уменьшенная страница; с detections - с рамками, пересчитанными в масштаб превью"""
+    scale = min(1.0, width / image.size[0])
+    preview = image.resize((round(image.size[0] * scale), round(image.size[1] * scale))) if scale < 1 else image
+    if detections is None:
+        return preview
+    scaled = [
+        {**det, 'bbox': [coord * scale for coord in det['bbox']]}
+        for group in detections.values() for det in group
+    ]
+    return inspector.draw_detections(preview, scaled)
+
+
+class AnalysisJob:
+    """Анализ одного документа в фоновом потоке; готовые страницы появляются в pages по одной"""
+
+    def __init__(self, inspector, name, content):
+        self.name = name
+        self.total_pages = count_pages(name, content)
+        self.pages = []
+        self.error = None
+        self.done = False
+        self._thread = threading.Thread(target=self._run, args=(inspector, content), daemon=True)
+        self._thread.start()
+
+    def _run(self, inspector, content):
+        try:
+            for page_number, image in enumerate(iter_document_images(self.name, content, PDF_ZOOM), start=1):
+                detections, timings = detect_page(inspector, image)
+                self.pages.append({
+                    "page_number": page_number,
+                    "original": make_preview(inspector, image),
+                    "result": make_preview(inspector, image, detections),
+                    "detections": detections,
+                    "timings": timings
+                })
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            self.done = True
+
+
+def get_job(inspector, name, content):
+    """Задача для файла: повторный запуск скрипта или повторная загрузка того же файла ее переиспользуют"""
+    store = job_store()
+    key = document_key(content)
+    with store["lock"]:
+        jobs = store["jobs"]
+        if key in jobs:
+            jobs.move_to_end(key)
+            return jobs[key]
+        jobs[key] = AnalysisJob(inspector, name, content)
+        finished = [old_key for old_key, job in jobs.items() if job.done]
+        while len(jobs) > MAX_JOBS and finished:
+            del jobs[finished.pop(0)]
+        return jobs[key]
+
+
+def show_page(page):
+    st.subheader(f"📄 Страница {page['page_number']}")
+    col1, col2 = st.columns(2)
+    with col1:
+        st.image(page["original"], caption=f"Оригинал - Страница {page['page_number']}", use_column_width=True)
+    with col2:
+        st.image(page["result"], caption=f"Результат анализа - Страница {page['page_number']}",
+                 use_column_width=True)
+        st.metric("Подписи", len(page["detections"]["signatures"]))
+        st.metric("QR-коды", len(page["detections"]["qr_codes"]))
+        st.metric("Штампы", len(page["detections"]["stamps"]))
+
 
 def main():
     st.set_page_config(
@@ -36,145 +113,85 @@ def main():
         page_icon="🔍",
         layout="wide"
     )
-    
+
     st.title("🔍 Digital Inspector")
     st.markdown("Автоматическая детекция подписей, QR-кодов и штампов в документах")
-    
+
     # Загружаем модель один раз
-    if 'inspector' not in st.session_state:
-        with st.spinner('Загрузка моделей...'):
-            st.session_state.inspector = DigitalInspector()
-    
+    with st.spinner('Загрузка моделей...'):
+        inspector = load_inspector()
+
     # Загрузка файла
     uploaded_file = st.file_uploader(
-        "Загрузите PDF документ", 
-        type=['pdf'],
+        "Загрузите PDF документ или скан",
+        type=['pdf', 'png', 'jpg', 'jpeg', 'tif', 'tiff'],
         help="Загрузите строительный документ для анализа"
     )
-    
-    if uploaded_file is not None:
-        # Сохраняем временный файл
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-            tmp_file.write(uploaded_file.getvalue())
-            tmp_path = tmp_file.name
-        
-        try:
-            # Конвертируем PDF
-            with st.spinner('Конвертация PDF...'):
-                images = pdf_to_images(tmp_path)
-            
-            st.success(f"✅ Документ загружен: {len(images)} страниц")
-            
-            # Обрабатываем каждую страницу
-            all_results = []
-            
-            for page_num, image in enumerate(images):
-                st.subheader(f"📄 Страница {page_num + 1}")
-                
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    # Показываем оригинал
-                    st.image(image, caption=f"Оригинал - Страница {page_num + 1}", use_column_width=True)
-                
-                with col2:
-                    # Детектируем и показываем результат
-                    with st.spinner(f'Анализ страницы {page_num + 1}...'):
-                        signatures = st.session_state.inspector.detect_signatures(image)
-                        qr_codes = st.session_state.inspector.detect_qr_codes(image)
-                        stamps = st.session_state.inspector.detect_stamps(image)
-                    
-                    # Визуализируем
-                    result_image = st.session_state.inspector.draw_detections(
-                        image, signatures + qr_codes + stamps
-                    )
-                    
-                    st.image(result_image, caption=f"Результат анализа - Страница {page_num + 1}", use_column_width=True)
-                    
-                    # Показываем статистику
-                    st.metric("Подписи", len(signatures))
-                    st.metric("QR-коды", len(qr_codes))
-                    st.metric("Штампы", len(stamps))
-                
-                # Сохраняем результаты для JSON
-                page_results = {
-                    "page_number": page_num + 1,
-                    "signatures": [
-                        {
-                            "bbox": sig['bbox'],
-                            "confidence": float(sig['confidence']),
-                            "label": "signature"
-                        } for sig in signatures
-                    ],
-                    "qr_codes": [
-                        {
-                            "bbox": qr['bbox'],
-                            "confidence": float(qr['confidence']),
-                            "label": "qr_code"
-                        } for qr in qr_codes
-                    ],
-                    "stamps": [
-                        {
-                            "bbox": stamp['bbox'],
-                            "confidence": float(stamp['confidence']),
-                            "label": "stamp"
-                        } for stamp in stamps
-                    ]
-                }
-                all_results.append(page_results)
-            
-            # Генерируем JSON результат
-            final_results = {
-                "file_name": uploaded_file.name,
-                "total_pages": len(images),
-                "pages": all_results
-            }
-            
-            # Показываем общую статистику
-            st.subheader("📊 Общая статистика")
-            total_sig = sum(len(page['signatures']) for page in all_results)
-            total_qr = sum(len(page['qr_codes']) for page in all_results)
-            total_stamp = sum(len(page['stamps']) for page in all_results)
-            
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                st.metric("Всего подписей", total_sig)
-            with col2:
-                st.metric("Всего QR-кодов", total_qr)
-            with col3:
-                st.metric("Всего штампов", total_stamp)
-            
-            # Предлагаем скачать JSON
-            json_str = json.dumps(final_results, ensure_ascii=False, indent=2)
-            st.download_button(
-                label="📥 Скачать JSON результаты",
-                data=json_str,
-                file_name=f"results_{uploaded_file.name}.json",
-                mime="application/json"
-            )
-            
-        except Exception as e:
-            st.error(f"❌ Ошибка обработки: {e}")
-        
-        finally:
-            # Удаляем временный файл
-            os.unlink(tmp_path)
-    
-    else:
+
+    if uploaded_file is None:
         # Демонстрационная секция
         st.info("""
         ### 🚀 Как использовать:
         1. Загрузите PDF документ через кнопку выше
-        2. Дождитесь обработки всех страниц
+        2. Страницы появляются по мере обработки
         3. Просмотрите визуальные результаты с bounding boxes
         4. Скачайте JSON с детальными результатами
-        
+
         ### 🔍 Что детектируется:
         - **🔴 Подписи** - красные bounding boxes
-        - **🟢 QR-коды** - зеленые bounding boxes  
+        - **🟢 QR-коды** - зеленые bounding boxes
         - **🔵 Штампы** - синие bounding boxes
         """)
+        return
+
+    try:
+        job = get_job(inspector, uploaded_file.name, uploaded_file.getvalue())
+    except Exception as e:
+        st.error(f"❌ Ошибка обработки: {e}")
+        return
+
+    # Снимок списка: фоновый поток продолжает добавлять страницы
+    pages = list(job.pages)
+    st.success(f"✅ Документ загружен: {job.total_pages} страниц")
+    if not job.done:
+        st.progress(len(pages) / max(job.total_pages, 1),
+                    text=f"Анализ: {len(pages)} из {job.total_pages} страниц")
+
+    for page in pages:
+        show_page(page)
+
+    if job.error:
+        st.error(f"❌ Ошибка обработки: {job.error}")
+    if not job.done:
+        time.sleep(POLL_INTERVAL_S)
+        rerun()
+        return
+
+    # Генерируем JSON результат
+    final_results = {
+        "file_name": uploaded_file.name,
+        "total_pages": len(pages),
+        "pages": [{"page_number": page["page_number"], **page["detections"]} for page in pages]
+    }
+
+    # Показываем общую статистику
+    st.subheader("📊 Общая статистика")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Всего подписей", sum(len(page["detections"]["signatures"]) for page in pages))
+    with col2:
+        st.metric("Всего QR-кодов", sum(len(page["detections"]["qr_codes"]) for page in pages))
+    with col3:
+        st.metric("Всего штампов", sum(len(page["detections"]["stamps"]) for page in pages))
+
+    # Предлагаем скачать JSON
+    json_str = json.dumps(final_results, ensure_ascii=False, indent=2)
+    st.download_button(
+        label="📥 Скачать JSON результаты",
+        data=json_str,
+        file_name=f"results_{uploaded_file.name}.json",
+        mime="application/json"
+    )
 
 if __name__ == "__main__":
     main()
-    
\ No newline at end of file
@@ -1,15 +1,25 @@
-from sqlalchemy import create_engine
+from functools import lru_cache
+
 from sqlalchemy.orm import DeclarativeBase, sessionmaker
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 
-from backend.app.core.config import settings
 
+@lru_cache(maxsize=None)
+def get_engine():
+    """Движок создается при первом обращении к БД, а не при импорте модуля"""
+    from backend.app.core.config import settings
+
+    return create_async_engine(settings.DATABASE_URL)
+
+
+@lru_cache(maxsize=None)
+def get_session_factory():
+    return sessionmaker(get_engine(), class_=AsyncSession, expire_on_commit=False)
 
 
-print(settings.DATABASE_URL)
-engine = create_async_engine(settings.DATABASE_URL)
+def async_session_maker():
+    return get_session_factory()()
 
-async_session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 class Base(DeclarativeBase):
-    pass
\ No newline at end of file
+    pass
@@ -10,4 +10,13 @@ class Status(str, enum.Enum):
 class Label(str, enum.Enum):
     signature = "signature"
     stamp = "stamp"
-    qr_code = "qr_code"
\ No newline at end of file
+    qr_code = "qr_code"
+
+class Detector(str, enum.Enum):
+    signatures = "signatures"
+    qr_codes = "qr_codes"
+    stamps = "stamps"
+
+
+# Порядок запуска детекторов; совпадает с группами детекций в ответе API
+DETECTORS = tuple(detector.value for detector in Detector)
@@ -1,20 +1,29 @@
 import os
-from fastapi import FastAPI, File, UploadFile
+from fastapi import FastAPI, File, UploadFile, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 from fastapi.staticfiles import StaticFiles
 import uvicorn
+from dataclasses import replace
 from pathlib import Path
 import tempfile
+import time
+from typing import List, Optional
 
-# Импорты для обработки изображений
-from PIL import Image
-import io
-import fitz
-from datetime import datetime
+from services.pipeline import (
+    analyze_document, iter_batch_events, iter_progress_events, make_options, parse_required, verify_document
+)
+from services.serialization import dumps, negotiate_format, render, to_columnar
+from services import metrics
+from services.admission import AdmissionError, MemoryBudget, track_memory
+from services.registry import parse_tiers
+from services.prefork import process_memory, serve
+from services.cpu_tuning import tune_worker, worker_slot
 
+# Импорт легкий: torch, transformers, ultralytics и qrdet загружаются при создании DigitalInspector
 try:
-    from detection_services import DigitalInspector
+    from services.detection_services import DigitalInspector
     HAS_MODELS = True
 except Exception as e:
     print(f"⚠️ Модели не загружены: {e}")
@@ -38,32 +47,56 @@ app.add_middleware(
 # Инициализация детектора
 inspector = None
 
+def load_inspector():
+    """Инспектор по переменным окружения: заглушка, настоящие модели или None"""
+    if os.getenv("STAMPNSIGN_FAKE_MODELS") == "1":
+        # Заглушка вместо моделей: нагрузочное тестирование слоя API
+        from services.fake_inspector import FakeInspector
+        print("⚠️ Запуск с фиктивными детекторами (STAMPNSIGN_FAKE_MODELS=1)")
+        return FakeInspector.from_env()
+    if not HAS_MODELS:
+        print("⚠️ Запуск без моделей")
+        return None
+    try:
+        print("🚀 Инициализация StampNSign API...")
+        # STAMPNSIGN_DETECTORS=qr_codes - загрузить только часть моделей,
+        # STAMPNSIGN_TIERS=fast,accurate - уровни моделей из реестра для этого развертывания
+        start_time = time.perf_counter()
+        loaded = DigitalInspector(
+            make_options(os.getenv("STAMPNSIGN_DETECTORS")).detectors,
+            parse_tiers(os.getenv("STAMPNSIGN_TIERS"))
+        )
+        metrics.set_model_load_time(time.perf_counter() - start_time)
+        print("✅ Все модели загружены")
+        return loaded
+    except Exception as e:
+        print(f"❌ Ошибка загрузки моделей: {e}")
+        return None
+
+def preload_inspector():
+    """Загрузка моделей до fork воркеров (STAMPNSIGN_WORKERS > 1)"""
+    global inspector
+    inspector = load_inspector()
+    return inspector
+
 @app.on_event("startup")
 async def startup_event():
     global inspector
-    if HAS_MODELS:
-        try:
-            print("🚀 Инициализация StampNSign API...")
-            inspector = DigitalInspector()
-            print("✅ Все модели загружены")
-        except Exception as e:
-            print(f"❌ Ошибка загрузки моделей: {e}")
-            inspector = None
-    else:
-        print("⚠️ Запуск без моделей")
+    # После fork модели уже загружены родителем, а потоки настроены в воркере.
+    # Иначе процесс один из нескольких (uvicorn --workers) или единственный: доля ядер - из окружения
+    if inspector is None:
+        layout = tune_worker(*worker_slot())
+        if layout:
+            print(f"⚙️ Потоки: {layout}")
+        inspector = load_inspector()
+
+# Бюджет памяти процесса на одновременно обрабатываемые документы
+memory_budget = MemoryBudget.from_env()
 
 # Создаем временную директорию для загрузок
 UPLOAD_DIR = Path(tempfile.gettempdir()) / "stampnsign_uploads"
 UPLOAD_DIR.mkdir(exist_ok=True)
 
-def serialize_detections(detections):
-    """Сериализует детекции в JSON-совместимый формат"""
-    return [{
-        'label': str(det['label']),
-        'bbox': [float(coord) for coord in det['bbox']],
-        'confidence': float(det['confidence'])
-    } for det in detections]
-
 @app.get("/")
 async def root():
     return {
@@ -77,125 +110,324 @@ async def health_check():
     return {
         "status": "healthy" if inspector else "degraded",
         "models_loaded": inspector is not None,
+        "tiers": list(inspector.tiers) if inspector else [],
+        "pid": os.getpid(),
+        "memory": process_memory(),
         "message": "API работает" if inspector else "API работает, но модели не загружены"
     }
 
-@app.post("/api/detect/all")
-async def detect_all(file: UploadFile = File(...)):
+def models_unavailable():
+    return JSONResponse(
+        status_code=503,
+        content={"success": False, "error": "Models are not available"}
+    )
+
+def bad_request(error):
+    return JSONResponse(status_code=400, content={"success": False, "error": str(error)})
+
+def request_options(detectors=None, thresholds=None, fusion=None, containment=None, qr_screen=None,
+                    signature_mode=None, tier=None, annotate=None, deadline_ms=None, detector_timeout_ms=None):
+    """Настройки пайплайна из query-параметров; ValueError при ошибке.
+
+    Значения по умолчанию берутся из STAMPNSIGN_FUSION, STAMPNSIGN_CONTAINMENT, STAMPNSIGN_QR_SCREEN,
+    STAMPNSIGN_SIGNATURE_MODE, STAMPNSIGN_ANNOTATE, STAMPNSIGN_DEADLINE_MS и STAMPNSIGN_DETECTOR_TIMEOUT_MS.
+    Кеш рендеров для загрузок выключен: разовый документ не читается повторно, а запись страниц
+    (~24 МБ на A4) только нагружает диск. STAMPNSIGN_API_RENDER_CACHE=1 включает его.
+    """
+    options = make_options(
+        detectors, thresholds,
+        fusion or os.getenv("STAMPNSIGN_FUSION"),
+        containment if containment is not None else os.getenv("STAMPNSIGN_CONTAINMENT"),
+        qr_screen or os.getenv("STAMPNSIGN_QR_SCREEN"),
+        signature_mode or os.getenv("STAMPNSIGN_SIGNATURE_MODE"),
+        tier,
+        annotate or os.getenv("STAMPNSIGN_ANNOTATE"),
+        deadline_ms or os.getenv("STAMPNSIGN_DEADLINE_MS"),
+        detector_timeout_ms or os.getenv("STAMPNSIGN_DETECTOR_TIMEOUT_MS")
+    )
+    options = replace(options, render_cache=os.getenv("STAMPNSIGN_API_RENDER_CACHE", "0") == "1")
+    missing = [name for name in options.detectors if name not in inspector.detectors]
+    if missing:
+        raise ValueError(f"Detectors are not loaded on this server: {', '.join(missing)}")
+    if options.tier is not None and options.tier not in inspector.tiers:
+        raise ValueError(f"Tier '{options.tier}' is not loaded on this server: {', '.join(inspector.tiers)}")
+    return options
+
+async def run_detection(request, file, response_format, analyze=None, **params):
+    """Общая обработка одиночного документа; params - query-параметры для request_options.
+
+    analyze(inspector, filename, content, options) заменяет полный анализ документа.
+    """
     if inspector is None:
-        return JSONResponse(
-            status_code=503,
-            content={"success": False, "error": "Models are not available"}
-        )
+        return models_unavailable()
+
+    try:
+        response_format = negotiate_format(response_format, request.headers.get("accept"))
+        options = request_options(**params)
+    except ValueError as e:
+        return bad_request(e)
     
+    start_time = time.perf_counter()
+    file_content = await file.read()
+
+    def process():
+        with track_memory(memory_budget, file.filename, file_content, options.zoom) as memory:
+            if analyze is None:
+                result = analyze_document(inspector, file.filename, file_content, UPLOAD_DIR, options)
+            else:
+                result = analyze(inspector, file.filename, file_content, options)
+        result["memory"] = memory
+        return result
+
     try:
-        file_content = await file.read()
-        
-        if file.filename.lower().endswith('.pdf'):
-            # Обработка PDF (ваш существующий код)
-            images = pdf_to_images(file_content)
-            results = []
-            
-            for i, image in enumerate(images):
-                signatures = serialize_detections(inspector.detect_signatures(image))
-                qr_codes = serialize_detections(inspector.detect_qr_codes(image))
-                stamps = serialize_detections(inspector.detect_stamps(image))
-                
-                result_image = inspector.draw_detections(image, signatures + qr_codes + stamps)
-                
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                output_filename = f"result_page_{i+1}_{timestamp}.jpg"
-                output_path = UPLOAD_DIR / output_filename
-                result_image.save(output_path)
-                
-                results.append({
-                    "page": i + 1,
-                    "detections": {
-                        "signatures": signatures,
-                        "qr_codes": qr_codes,
-                        "stamps": stamps
-                    },
-                    "result_image_url": f"/uploads/{output_filename}",
-                    "counts": {
-                        "signatures": len(signatures),
-                        "qr_codes": len(qr_codes),
-                        "stamps": len(stamps)
-                    }
-                })
-            
-            return {
-                "success": True,
-                "file_type": "pdf",
-                "total_pages": len(images),
-                "pages": results
-            }
-        else:
-            # Обработка изображения
-            image = Image.open(io.BytesIO(file_content))
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            
-            signatures = serialize_detections(inspector.detect_signatures(image))
-            qr_codes = serialize_detections(inspector.detect_qr_codes(image))
-            stamps = serialize_detections(inspector.detect_stamps(image))
-            
-            result_image = inspector.draw_detections(image, signatures + qr_codes + stamps)
-            
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            output_filename = f"result_{timestamp}.jpg"
-            output_path = UPLOAD_DIR / output_filename
-            result_image.save(output_path)
-            
-            return {
-                "success": True,
-                "file_type": "image",
-                "detections": {
-                    "signatures": signatures,
-                    "qr_codes": qr_codes,
-                    "stamps": stamps
-                },
-                "result_image_url": f"/uploads/{output_filename}",
-                "counts": {
-                    "signatures": len(signatures),
-                    "qr_codes": len(qr_codes),
-                    "stamps": len(stamps)
-                }
-            }
-            
+        with metrics.track_queue():
+            result = await run_in_threadpool(process)
+    except AdmissionError as e:
+        metrics.observe_rejection(e.status_code)
+        return JSONResponse(
+            status_code=e.status_code,
+            content={"success": False, "error": str(e)},
+            headers={"Retry-After": "5"} if e.status_code == 503 else None
+        )
     except Exception as e:
+        metrics.observe_document(False)
         return JSONResponse(
             status_code=500,
             content={"success": False, "error": str(e)}
         )
 
-# Статические файлы
-app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
+    pages = result.get("pages", [result])
+    for page in pages:
+        metrics.observe_page(page)
+    metrics.observe_document(True)
+    metrics.observe_memory(result["memory"])
 
-# Функция для обработки PDF (добавьте вашу существующую функцию)
-def pdf_to_images(pdf_file):
-    images = []
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-        tmp_file.write(pdf_file)
-        tmp_path = tmp_file.name
-    
+    timings = metrics.total_timings(pages)
+    serialize_start = time.perf_counter()
+    response = render(result, response_format)
+    timings["serialize"] = (time.perf_counter() - serialize_start) * 1000
+    timings["total"] = (time.perf_counter() - start_time) * 1000
+    response.headers["Server-Timing"] = metrics.server_timing_header(timings)
+    metrics.observe_request(request.url.path, timings["total"] / 1000)
+    return response
+
+def observe_events(events, endpoint):
+    """Пропускает события потоковой обработки, учитывая их в метриках"""
+    start_time = time.perf_counter()
+    with metrics.track_queue():
+        for event in events:
+            if event.get("type") == "page" or event.get("event") == "persisted":
+                metrics.observe_page(event)
+            elif event.get("type") == "document" or event.get("event") in ("done", "error"):
+                success = event.get("success", event.get("event") == "done")
+                metrics.observe_document(success)
+                if "memory" in event:
+                    metrics.observe_memory(event["memory"])
+                if "status_code" in event:
+                    metrics.observe_rejection(event["status_code"])
+            yield event
+    metrics.observe_request(endpoint, time.perf_counter() - start_time)
+
+@app.post("/api/detect/all")
+async def detect_all(
+    request: Request,
+    file: UploadFile = File(...),
+    response_format: Optional[str] = Query(None, alias="format"),
+    detectors: Optional[str] = Query(None, description="Например: signatures,qr_codes"),
+    thresholds: Optional[str] = Query(None, description="Например: 0.5 или signatures:0.6,stamps:0.4"),
+    fusion: Optional[str] = Query(None, description="none, nms или wbf, порог IoU через двоеточие: wbf:0.6"),
+    containment: Optional[str] = Query(None, description="Например: signatures@stamps:0.8"),
+    qr_screen: Optional[str] = Query(None, description="off, conservative или regions"),
+    signature_mode: Optional[str] = Query(None, description="full или roi"),
+    tier: Optional[str] = Query(None, description="fast, balanced или accurate"),
+    annotate: Optional[str] = Query(None, description="raster, pdf, svg или none"),
+    deadline_ms: Optional[float] = Query(None, description="Бюджет времени документа в мс"),
+    detector_timeout_ms: Optional[float] = Query(None, description="Лимит одного детектора на странице в мс")
+):
+    return await run_detection(
+        request, file, response_format, detectors=detectors, thresholds=thresholds, fusion=fusion,
+        containment=containment, qr_screen=qr_screen, signature_mode=signature_mode, tier=tier,
+        annotate=annotate, deadline_ms=deadline_ms, detector_timeout_ms=detector_timeout_ms
+    )
+
+@app.post("/api/detect/signatures")
+async def detect_signatures(
+    request: Request,
+    file: UploadFile = File(...),
+    response_format: Optional[str] = Query(None, alias="format"),
+    thresholds: Optional[str] = Query(None),
+    signature_mode: Optional[str] = Query(None),
+    tier: Optional[str] = Query(None),
+    annotate: Optional[str] = Query(None),
+    deadline_ms: Optional[float] = Query(None),
+    detector_timeout_ms: Optional[float] = Query(None)
+):
+    return await run_detection(
+        request, file, response_format, detectors="signatures", thresholds=thresholds,
+        signature_mode=signature_mode, tier=tier, annotate=annotate, deadline_ms=deadline_ms,
+        detector_timeout_ms=detector_timeout_ms
+    )
+
+@app.post("/api/detect/qr-codes")
+async def detect_qr_codes(
+    request: Request,
+    file: UploadFile = File(...),
+    response_format: Optional[str] = Query(None, alias="format"),
+    thresholds: Optional[str] = Query(None),
+    qr_screen: Optional[str] = Query(None),
+    tier: Optional[str] = Query(None),
+    annotate: Optional[str] = Query(None),
+    deadline_ms: Optional[float] = Query(None),
+    detector_timeout_ms: Optional[float] = Query(None)
+):
+    return await run_detection(
+        request, file, response_format, detectors="qr_codes", thresholds=thresholds, qr_screen=qr_screen, tier=tier,
+        annotate=annotate, deadline_ms=deadline_ms, detector_timeout_ms=detector_timeout_ms
+    )
+
+@app.post("/api/detect/stamps")
+async def detect_stamps(
+    request: Request,
+    file: UploadFile = File(...),
+    response_format: Optional[str] = Query(None, alias="format"),
+    thresholds: Optional[str] = Query(None),
+    tier: Optional[str] = Query(None),
+    annotate: Optional[str] = Query(None),
+    deadline_ms: Optional[float] = Query(None),
+    detector_timeout_ms: Optional[float] = Query(None)
+):
+    return await run_detection(
+        request, file, response_format, detectors="stamps", thresholds=thresholds, tier=tier, annotate=annotate,
+        deadline_ms=deadline_ms, detector_timeout_ms=detector_timeout_ms
+    )
+
+@app.post("/api/verify")
+async def verify_presence(
+    request: Request,
+    file: UploadFile = File(...),
+    response_format: Optional[str] = Query(None, alias="format"),
+    require: Optional[str] = Query(None, description="Например: stamps,signatures или stamps:0.7,signatures"),
+    thresholds: Optional[str] = Query(None),
+    qr_screen: Optional[str] = Query(None),
+    signature_mode: Optional[str] = Query(None),
+    tier: Optional[str] = Query(None),
+    deadline_ms: Optional[float] = Query(None),
+    detector_timeout_ms: Optional[float] = Query(None)
+):
+    """Есть ли в документе нужные элементы: страницы просматриваются с последней и первой,
+    обработка останавливается, как только все найдено"""
+    if inspector is None:
+        return models_unavailable()
     try:
-        pdf_document = fitz.open(tmp_path)
-        for page_num in range(len(pdf_document)):
-            page = pdf_document.load_page(page_num)
-            pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))
-            img_data = pix.tobytes("ppm")
-            image = Image.open(io.BytesIO(img_data))
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            images.append(image)
-        pdf_document.close()
-    finally:
-        os.unlink(tmp_path)
-    
-    return images
+        required = parse_required(require or ",".join(inspector.detectors))
+    except ValueError as e:
+        return bad_request(e)
+
+    return await run_detection(
+        request, file, response_format,
+        analyze=lambda inspector, filename, content, options: verify_document(
+            inspector, filename, content, required, options
+        ),
+        detectors=",".join(required), thresholds=thresholds, qr_screen=qr_screen,
+        signature_mode=signature_mode, tier=tier, deadline_ms=deadline_ms, detector_timeout_ms=detector_timeout_ms
+    )
+
+@app.post("/api/detect/batch")
+async def detect_batch(
+    files: List[UploadFile] = File(...),
+    response_format: Optional[str] = Query(None, alias="format"),
+    detectors: Optional[str] = Query(None),
+    thresholds: Optional[str] = Query(None),
+    fusion: Optional[str] = Query(None),
+    containment: Optional[str] = Query(None),
+    qr_screen: Optional[str] = Query(None),
+    signature_mode: Optional[str] = Query(None),
+    tier: Optional[str] = Query(None),
+    annotate: Optional[str] = Query(None),
+    deadline_ms: Optional[float] = Query(None, description="Бюджет времени каждого документа в мс"),
+    detector_timeout_ms: Optional[float] = Query(None)
+):
+    """Пакетная детекция: много файлов или ZIP-архив, результаты потоком NDJSON"""
+    if inspector is None:
+        return models_unavailable()
+    if response_format not in (None, "json", "columnar"):
+        return bad_request("Batch results support only 'json' and 'columnar' formats")
+    try:
+        options = request_options(
+            detectors, thresholds, fusion, containment, qr_screen, signature_mode, tier, annotate,
+            deadline_ms, detector_timeout_ms
+        )
+    except ValueError as e:
+        return bad_request(e)
+
+    uploads = [(file.filename, await file.read()) for file in files]
+    encode = to_columnar if response_format == "columnar" else dict
+    lines = (
+        dumps(encode(event)) + b"\n"
+        for event in observe_events(
+            iter_batch_events(inspector, uploads, UPLOAD_DIR, options, memory_budget), "/api/detect/batch"
+        )
+    )
+    return StreamingResponse(lines, media_type="application/x-ndjson")
+
+@app.post("/api/detect/stream")
+async def detect_stream(
+    file: UploadFile = File(...),
+    detectors: Optional[str] = Query(None),
+    thresholds: Optional[str] = Query(None),
+    fusion: Optional[str] = Query(None),
+    containment: Optional[str] = Query(None),
+    qr_screen: Optional[str] = Query(None),
+    signature_mode: Optional[str] = Query(None),
+    tier: Optional[str] = Query(None),
+    annotate: Optional[str] = Query(None),
+    deadline_ms: Optional[float] = Query(None),
+    detector_timeout_ms: Optional[float] = Query(None)
+):
+    """Детекция с прогрессом по страницам через Server-Sent Events"""
+    if inspector is None:
+        return models_unavailable()
+    try:
+        options = request_options(
+            detectors, thresholds, fusion, containment, qr_screen, signature_mode, tier, annotate,
+            deadline_ms, detector_timeout_ms
+        )
+    except ValueError as e:
+        return bad_request(e)
+
+    file_content = await file.read()
+    messages = (
+        b"event: " + event["event"].encode() + b"\ndata: " + dumps(event) + b"\n\n"
+        for event in observe_events(
+            iter_progress_events(inspector, file.filename, file_content, UPLOAD_DIR, options, memory_budget),
+            "/api/detect/stream"
+        )
+    )
+    return StreamingResponse(
+        messages,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    if not metrics.HAS_PROMETHEUS:
+        return JSONResponse(
+            status_code=503,
+            content={"success": False, "error": "prometheus_client is not installed"}
+        )
+    return Response(metrics.render_latest(), media_type=metrics.CONTENT_TYPE_LATEST)
+
+# Статические файлы
+app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
 
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 8000))
+    workers = int(os.getenv("STAMPNSIGN_WORKERS", "1"))
+    if workers > 1:
+        # Модели загружаются один раз, воркеры делят их память через fork
+        report_after = int(os.getenv("STAMPNSIGN_MEMORY_REPORT_S", "30"))
+        raise SystemExit(serve(app, preload_inspector, "0.0.0.0", port, workers, report_after))
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
@@ -0,0 +1,193 @@
+# admission.py - оценка памяти документа и допуск запросов в бюджет узла
+import io
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import fitz
+from PIL import Image
+
+from services.render_cache import image_max_side, image_page_levels, pick_level
+
+MB = 1024 * 1024
+
+# Сколько копий страницы живет одновременно: PIL RGB, BGR-массив для OpenCV/qrdet,
+# копия для отрисовки и результат, плюс тензоры моделей порядка размера страницы
+PAGE_COPY_FACTOR = 5
+
+
+class AdmissionError(Exception):
+    """Документ не допущен к обработке"""
+
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def physical_memory_bytes():
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def estimate_document_bytes(filename, content, zoom):
+    """Пиковая память обработки документа по размерам страниц, без рендеринга.
+
+    Страницы рендерятся по одной, поэтому пик определяет самая большая страница:
+    ширина × высота × zoom² × 3 байта × PAGE_COPY_FACTOR, плюс сам файл в памяти.
+    """
+    if not filename.lower().endswith('.pdf'):
+        return estimate_image_bytes(content, zoom)
+    largest_page = 0.0
+    with fitz.open(stream=content, filetype="pdf") as pdf_document:
+        for page in pdf_document:
+            rect = page.rect
+            largest_page = max(largest_page, rect.width * rect.height * zoom * zoom * 3)
+    return int(largest_page * PAGE_COPY_FACTOR + len(content))
+
+
+def estimate_image_bytes(content, zoom):
+    """Изображение: выбранный уровень пирамиды декодируется целиком (JPEG - в draft-режиме
+    уже уменьшенным), а копии живут в размере страницы после уменьшения"""
+    max_side = image_max_side(zoom)
+    largest = 0
+    # Image.open читает только заголовки кадров, пиксели не декодируются
+    with Image.open(io.BytesIO(content)) as image:
+        for levels in image_page_levels(image):
+            width, height = pick_level(levels, max_side)[1]
+            scale = min(1.0, max_side / max(width, height))
+            page = width * height * scale * scale * 3
+            decoded = page if image.format == 'JPEG' else width * height * 3
+            largest = max(largest, decoded + page * PAGE_COPY_FACTOR)
+    return int(largest + len(content))
+
+
+class MemoryBudget:
+    """Бюджет памяти процесса: допуск сразу, ожидание в очереди или отказ"""
+
+    def __init__(self, limit_bytes, queue_timeout=30.0):
+        self.limit_bytes = limit_bytes
+        self.queue_timeout = queue_timeout
+        self.used_bytes = 0
+        self.waiting = 0
+        self._condition = threading.Condition()
+
+    @classmethod
+    def from_env(cls):
+        """STAMPNSIGN_MEMORY_BUDGET_MB (на процесс), STAMPNSIGN_ADMISSION_TIMEOUT.
+
+        По умолчанию половина RAM делится между STAMPNSIGN_WORKERS воркерами: у каждого
+        после fork свой бюджет, и вместе они не должны допускать больше половины памяти узла.
+        """
+        budget_mb = os.getenv("STAMPNSIGN_MEMORY_BUDGET_MB")
+        if budget_mb:
+            limit = int(float(budget_mb) * MB)
+        else:
+            physical = physical_memory_bytes()
+            workers = max(1, int(os.getenv("STAMPNSIGN_WORKERS", "1")))
+            limit = physical // 2 // workers if physical else None
+        return cls(limit, float(os.getenv("STAMPNSIGN_ADMISSION_TIMEOUT", "30")))
+
+    def acquire(self, nbytes, timeout=None):
+        """Резервирует nbytes; ждет освобождения памяти не дольше timeout секунд"""
+        if self.limit_bytes is None:
+            return
+        if nbytes > self.limit_bytes:
+            raise AdmissionError(
+                f"Document needs ~{nbytes / MB:.0f} MB, more than the node budget of {self.limit_bytes / MB:.0f} MB",
+                status_code=413
+            )
+
+        timeout = self.queue_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            self.waiting += 1
+            try:
+                while self.used_bytes + nbytes > self.limit_bytes:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise AdmissionError(
+                            f"Memory budget is busy, document needs ~{nbytes / MB:.0f} MB; retry later",
+                            status_code=503
+                        )
+                    self._condition.wait(remaining)
+                self.used_bytes += nbytes
+            finally:
+                self.waiting -= 1
+
+    def release(self, nbytes):
+        if self.limit_bytes is None:
+            return
+        with self._condition:
+            self.used_bytes -= nbytes
+            self._condition.notify_all()
+
+
+def current_rss_bytes():
+    """Текущий RSS процесса из /proc (Linux), иначе через psutil, если он есть"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return None
+
+
+class RssSampler:
+    """Фоновый замер пикового RSS всего процесса на время обработки запроса.
+
+    Это RSS процесса, а не документа: в него входят модели и параллельные запросы этого воркера.
+    """
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak_bytes = current_rss_bytes() or 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            rss = current_rss_bytes()
+            if rss is not None and rss > self.peak_bytes:
+                self.peak_bytes = rss
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        rss = current_rss_bytes()
+        if rss is not None and rss > self.peak_bytes:
+            self.peak_bytes = rss
+        return False
+
+    @property
+    def peak_mb(self):
+        return round(self.peak_bytes / MB, 1)
+
+
+@contextmanager
+def track_memory(budget, filename, content, zoom):
+    """Допускает документ в бюджет (если он задан) и замеряет пиковый RSS процесса.
+
+    Отдает словарь для ответа: estimated_mb сразу, process_peak_rss_mb - после выхода из блока.
+    """
+    estimated = estimate_document_bytes(filename, content, zoom)
+    memory = {"estimated_mb": round(estimated / MB, 1)}
+    if budget is not None:
+        budget.acquire(estimated)
+    try:
+        with RssSampler() as sampler:
+            yield memory
+    finally:
+        if budget is not None:
+            budget.release(estimated)
+    memory["process_peak_rss_mb"] = sampler.peak_mb
@@ -0,0 +1,94 @@
+# annotations.py - векторные аннотации результата: копия исходного PDF с рамками и SVG-оверлеи
+import time
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+import fitz
+
+from services.render_cache import is_pdf
+
+# raster - JPEG каждой страницы с нарисованными рамками (как раньше), pdf - копия документа
+# с векторными аннотациями, svg - прозрачный оверлей на страницу, none - только JSON
+ANNOTATION_MODES = ('raster', 'pdf', 'svg', 'none')
+COLORS = {'signature': (255, 0, 0), 'qr_code': (0, 255, 0), 'stamp': (0, 0, 255)}
+DEFAULT_COLOR = (128, 128, 128)
+# Толщина рамки в пунктах PDF (в SVG - в пикселях страницы)
+BORDER_WIDTH = 1.5
+
+
+def open_as_pdf(filename, content):
+    """Исходный документ как PDF: PDF открывается как есть, изображение (кадры TIFF - страницы)
+    конвертируется без перекодирования в JPEG"""
+    if is_pdf(filename):
+        return fitz.open(stream=content, filetype="pdf")
+    with fitz.open(stream=content, filetype=Path(filename).suffix.lstrip('.').lower() or None) as image:
+        return fitz.open("pdf", image.convert_to_pdf())
+
+
+def annotate_page(page, size, detections):
+    """Рамки детекций на странице PDF; size - размер отрендеренной страницы, в пикселях которой bbox.
+
+    Координаты переводятся в пункты видимой страницы, затем в неповернутые координаты
+    (derotation_matrix): рамка аннотации задается без учета /Rotate, смещение CropBox MuPDF учитывает сам.
+    """
+    scale_x, scale_y = page.rect.width / size[0], page.rect.height / size[1]
+    for detection in (det for group in detections.values() for det in group):
+        x1, y1, x2, y2 = detection['bbox']
+        rect = fitz.Rect(x1 * scale_x, y1 * scale_y, x2 * scale_x, y2 * scale_y) * page.derotation_matrix
+        color = [channel / 255 for channel in COLORS.get(detection['label'], DEFAULT_COLOR)]
+        annot = page.add_rect_annot(rect)
+        annot.set_colors(stroke=color)
+        annot.set_border(width=BORDER_WIDTH)
+        annot.set_info(title=detection['label'], content=f"{detection['label']} {detection['confidence']:.2f}")
+        annot.update()
+
+
+def write_annotated_pdf(filename, content, pages, path):
+    """Копия исходного документа с векторными рамками; pages - [(номер страницы, размер, детекции)]"""
+    with open_as_pdf(filename, content) as document:
+        for page_number, size, detections in pages:
+            annotate_page(document[page_number - 1], size, detections)
+        # garbage/deflate: без дублей объектов и с сжатыми потоками аннотаций
+        document.save(path, garbage=3, deflate=True)
+
+
+def svg_overlay(size, detections):
+    """Прозрачный SVG размером со страницу: фронтенд кладет его поверх любого превью страницы"""
+    width, height = size
+    elements = []
+    for detection in (det for group in detections.values() for det in group):
+        x1, y1, x2, y2 = detection['bbox']
+        red, green, blue = COLORS.get(detection['label'], DEFAULT_COLOR)
+        label = escape(f"{detection['label']} {detection['confidence']:.2f}")
+        elements.append(
+            f'<g class="{escape(detection["label"])}"><title>{label}</title>'
+            f'<rect x="{x1:.1f}" y="{y1:.1f}" width="{x2 - x1:.1f}" height="{y2 - y1:.1f}" fill="none" '
+            f'stroke="rgb({red},{green},{blue})" stroke-width="{BORDER_WIDTH * 2}"/></g>'
+        )
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {width} {height}" '
+        f'width="{width}" height="{height}">' + ''.join(elements) + '</svg>'
+    )
+
+
+def save_page_artifact(inspector, mode, image, detections, output_dir, stem, timings):
+    """Постраничный артефакт режимов raster и svg: (ключ ссылки в ответе, имя файла) или None.
+
+    Время отрисовки и записи добавляется в timings (мс).
+    """
+    if mode == 'raster':
+        start_time = time.perf_counter()
+        result_image = inspector.draw_detections(image, [det for group in detections.values() for det in group])
+        timings["draw"] = round((time.perf_counter() - start_time) * 1000, 2)
+        start_time = time.perf_counter()
+        filename = f"{stem}.jpg"
+        result_image.save(Path(output_dir) / filename)
+        timings["save"] = round((time.perf_counter() - start_time) * 1000, 2)
+        return "result_image_url", filename
+    if mode == 'svg':
+        start_time = time.perf_counter()
+        filename = f"{stem}.svg"
+        (Path(output_dir) / filename).write_text(svg_overlay(image.size, detections), encoding='utf-8')
+        timings["save"] = round((time.perf_counter() - start_time) * 1000, 2)
+        return "overlay_url", filename
+    return None
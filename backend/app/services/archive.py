@@ -0,0 +1,261 @@
+# archive.py - архив результатов с версиями моделей и повторная обработка только изменившихся детекторов
+import argparse
+import json
+import os
+import sys
+import time
+from dataclasses import asdict, replace
+from datetime import datetime
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from enums import DETECTORS
+from services.annotations import svg_overlay, write_annotated_pdf
+from services.fake_inspector import make_inspector
+from services.pipeline import (
+    PipelineOptions, SUPPORTED_EXTENSIONS, add_pipeline_arguments, count_detections, iter_document_images,
+    make_options, options_from_args, postprocess_page, run_detectors
+)
+from services.registry import load_registry, model_version
+from services.render_cache import RenderCache, document_key, shared_cache
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent.parent
+ARCHIVE_DIR = PROJECT_ROOT / 'archive'
+
+
+def options_to_dict(options):
+    return asdict(options)
+
+
+def options_from_dict(data):
+    """Обратное преобразование: JSON хранит кортежи списками"""
+    return PipelineOptions(**{
+        **data,
+        "detectors": tuple(data["detectors"]),
+        "containment": tuple(tuple(rule) for rule in data["containment"])
+    })
+
+
+def copy_detections(detections):
+    """Копия групп: слияние и чтение QR меняют словари детекций на месте"""
+    return {name: [dict(det) for det in items] for name, items in detections.items()}
+
+
+def current_versions(registry, detectors, tier=None):
+    """Версии моделей из реестра, без загрузки самих моделей"""
+    return {name: model_version(registry.get(name, tier)) for name in detectors}
+
+
+class Archive:
+    """Один JSON на документ: {каталог}/{хеш документа}.json"""
+
+    def __init__(self, directory=ARCHIVE_DIR):
+        self.directory = Path(directory)
+
+    def path(self, key):
+        return self.directory / f"{key}.json"
+
+    def save(self, record):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.path(record["document"])
+        temporary = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(record, f, ensure_ascii=False)
+        os.replace(temporary, path)
+
+    def records(self):
+        if not self.directory.exists():
+            return
+        for path in sorted(self.directory.glob('*.json')):
+            with open(path, encoding='utf-8') as f:
+                yield json.load(f)
+
+
+def archive_document(inspector, filename, content, options, archive, cache, registry, source=None):
+    """Полная обработка документа с сохранением сырых детекций и версий моделей по страницам;
+    cache=None - страницы рендерятся без кеша"""
+    versions = current_versions(registry, options.detectors, options.tier)
+    pages = []
+    if cache is None:
+        images = iter_document_images(filename, content, options.zoom)
+    else:
+        images = cache.iter_pages(filename, content, options.zoom)
+    for index, image in enumerate(images):
+        raw, timings = run_detectors(inspector, image, options)
+        detections = postprocess_page(image, copy_detections(raw), options, timings)
+        pages.append({
+            "page": index + 1,
+            "size": list(image.size),
+            "versions": dict(versions),
+            "raw": raw,
+            "detections": detections,
+            "counts": count_detections(detections)
+        })
+
+    record = {
+        "document": document_key(content),
+        "filename": filename,
+        "source": str(source) if source else None,
+        "options": options_to_dict(options),
+        "total_pages": len(pages),
+        "pages": pages,
+        "updated_at": datetime.now().isoformat()
+    }
+    archive.save(record)
+    annotate_record(record, content, archive)
+    return record
+
+
+def annotate_record(record, content, archive):
+    """Артефакты с рамками по сохраненным детекциям рядом с записью: {хеш}.annotated.pdf или
+    {хеш}_page_N.svg. Страницы заново не рендерятся - нужны только их размеры и детекции."""
+    mode = record["options"].get("annotate", "none")
+    key = record["document"]
+    if mode == 'svg':
+        for page in record["pages"]:
+            (archive.directory / f"{key}_page_{page['page']}.svg").write_text(
+                svg_overlay(page["size"], page["detections"]), encoding='utf-8'
+            )
+    elif mode == 'pdf':
+        if content is None:
+            if not record.get("source") or not Path(record["source"]).exists():
+                raise FileNotFoundError(f"Source is missing, annotated PDF is not updated: {record['filename']}")
+            content = Path(record["source"]).read_bytes()
+        pages = [(page["page"], page["size"], page["detections"]) for page in record["pages"]]
+        write_annotated_pdf(record["filename"], content, pages, archive.directory / f"{key}.annotated.pdf")
+
+
+def stale_detectors(page, versions, options, force=()):
+    """Детекторы страницы, чьи модели сменились; в roi-режиме новые штампы меняют и области подписей"""
+    stale = {name for name in options.detectors if page["versions"].get(name) != versions[name] or name in force}
+    if options.signature_mode == 'roi' and 'stamps' in stale and 'signatures' in options.detectors:
+        stale.add('signatures')
+    return tuple(name for name in options.detectors if name in stale)
+
+
+def plan_reprocessing(record, registry, force=()):
+    """[(страница, детекторы для перезапуска)] только по затронутым страницам"""
+    options = options_from_dict(record["options"])
+    versions = current_versions(registry, options.detectors, options.tier)
+    plan = []
+    for page in record["pages"]:
+        names = stale_detectors(page, versions, options, force)
+        if names:
+            plan.append((page, names))
+    return plan
+
+
+def reprocess_record(inspector, record, plan, archive, cache, registry):
+    """Перезапускает по плану только устаревшие детекторы; рендеры берутся из кеша страниц
+    (cache=None или страница вытеснена - рендеринг исходного файла)"""
+    options = options_from_dict(record["options"])
+    versions = current_versions(registry, options.detectors, options.tier)
+    indices = [page["page"] - 1 for page, _ in plan]
+
+    content = None
+    if cache is None or not all(cache.has(record["document"], index, options.zoom) for index in indices):
+        # Часть страниц выпала из кеша (или он не используется): нужен исходный файл
+        if not record.get("source") or not Path(record["source"]).exists():
+            raise FileNotFoundError(f"Page renders are not cached and source is missing: {record['filename']}")
+        content = Path(record["source"]).read_bytes()
+
+    if cache is None:
+        images = iter_document_images(record["filename"], content, options.zoom, indices)
+    else:
+        images = cache.iter_pages(record["filename"], content, options.zoom, indices, key=record["document"])
+    for (page, names), image in zip(plan, images):
+        found, timings = run_detectors(inspector, image, replace(options, detectors=names), page["raw"])
+        page["raw"] = {name: found.get(name, page["raw"].get(name, [])) for name in options.detectors}
+        page["detections"] = postprocess_page(image, copy_detections(page["raw"]), options, timings)
+        page["counts"] = count_detections(page["detections"])
+        page["versions"].update({name: versions[name] for name in names})
+
+    record["updated_at"] = datetime.now().isoformat()
+    archive.save(record)
+    annotate_record(record, content, archive)
+    return {
+        "document": record["document"],
+        "filename": record["filename"],
+        "pages": len(plan),
+        "detector_runs": sum(len(names) for _, names in plan)
+    }
+
+
+def collect_paths(paths):
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files.extend(sorted(item for item in path.iterdir() if item.suffix.lower() in SUPPORTED_EXTENSIONS))
+        elif path.is_file():
+            files.append(path)
+    return files
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Архив результатов и повторная обработка после смены моделей")
+    parser.add_argument("command", choices=("add", "status", "reprocess"))
+    parser.add_argument("paths", nargs='*', help="файлы или папки для add")
+    parser.add_argument("--archive", default=os.getenv("STAMPNSIGN_ARCHIVE_DIR", str(ARCHIVE_DIR)))
+    add_pipeline_arguments(parser, annotate="none")
+    parser.add_argument("--force", help="reprocess: перезапустить эти детекторы независимо от версий")
+    args = parser.parse_args(argv)
+
+    archive = Archive(args.archive)
+    # С --render-cache reprocess берет рендеры из кеша, а не из исходных файлов
+    cache = (shared_cache() or RenderCache()) if args.render_cache else None
+    registry = load_registry()
+
+    if args.command == "add":
+        options = options_from_args(args)
+        options = replace(options, tier=options.tier or registry.default_tier)
+        if options.annotate == 'raster':
+            # Архив хранит детекции, а не рендеры: растровые копии страниц здесь не делаются
+            print("❌ Архив поддерживает только --annotate pdf, svg или none")
+            return 1
+        if options.deadline_ms is not None or options.detector_timeout_ms is not None:
+            # Прерванный детектор записался бы как отработавший текущей версией модели
+            print("❌ Архив хранит только полные результаты: --deadline-ms и --detector-timeout-ms не поддерживаются")
+            return 1
+        files = collect_paths(args.paths)
+        if not files:
+            print("❌ Не найдено файлов для архивации")
+            return 1
+        inspector = make_inspector(options.detectors, (options.tier,))
+        for path in files:
+            start_time = time.perf_counter()
+            record = archive_document(inspector, path.name, path.read_bytes(), options, archive, cache, registry,
+                                      path.resolve())
+            print(f"💾 {path.name}: {record['total_pages']} стр. за {time.perf_counter() - start_time:.1f} с")
+        return 0
+
+    force = make_options(args.force).detectors if args.force else ()
+    plans = [(record, plan_reprocessing(record, registry, force)) for record in archive.records()]
+    plans = [(record, plan) for record, plan in plans if plan]
+    detectors = sorted({name for _, plan in plans for _, names in plan for name in names})
+
+    if args.command == "status" or not plans:
+        print(f"📁 Устаревших документов: {len(plans)}, страниц: {sum(len(plan) for _, plan in plans)}, "
+              f"детекторы: {', '.join(detectors) or '-'}")
+        for record, plan in plans:
+            names = sorted({name for _, page_names in plan for name in page_names})
+            print(f"  {record['filename']}: {len(plan)} стр., {', '.join(names)}")
+        return 0
+
+    tiers = tuple(sorted({record["options"]["tier"] for record, _ in plans}))
+    # Загружаются только модели, которые нужно перезапустить
+    inspector = make_inspector(tuple(name for name in DETECTORS if name in detectors), tiers)
+    for record, plan in plans:
+        start_time = time.perf_counter()
+        try:
+            result = reprocess_record(inspector, record, plan, archive, cache, registry)
+        except FileNotFoundError as e:
+            print(f"⚠️ {e}")
+            continue
+        print(f"🔄 {result['filename']}: {result['pages']} стр., {result['detector_runs']} запусков детекторов "
+              f"за {time.perf_counter() - start_time:.1f} с")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
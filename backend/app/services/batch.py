@@ -0,0 +1,249 @@
+# batch.py - параллельная пакетная обработка каталога с журналом JSONL и возобновлением после сбоя
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from enums import DETECTORS
+from services.annotations import save_page_artifact, write_annotated_pdf
+from services.benchmark import PDFS_DIR, describe
+from services.deadlines import Deadline
+from services.pipeline import (
+    SUPPORTED_EXTENSIONS, add_pipeline_arguments, count_detections, detect_page, iter_document_images,
+    options_from_args, original_geometry, sum_counts
+)
+from services.render_cache import document_key, image_page_sizes, is_pdf
+
+JOURNAL_FILE = Path("batch_journal.jsonl")
+# Артефакты с рамками (--annotate raster/svg/pdf)
+OUTPUT_DIR = Path("batch_output")
+
+# Состояние процесса-воркера: модели загружаются в родителе до fork и наследуются
+_inspector = None
+_options = None
+_output_dir = None
+
+
+def iter_files(directory, recursive=False):
+    """Поддерживаемые файлы каталога по одному: подкаталоги читаются по мере обхода (os.walk),
+    в памяти и в сортировке - только имена текущего каталога"""
+    for current, subdirs, names in os.walk(directory):
+        subdirs.sort()
+        for name in sorted(names):
+            path = Path(current) / name
+            if path.suffix.lower() in SUPPORTED_EXTENSIONS and path.is_file():
+                yield path
+        if not recursive:
+            break
+
+
+def iter_journal(path):
+    """Записи журнала по одной; недописанная при сбое последняя строка пропускается"""
+    if not Path(path).exists():
+        return
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def journaled_files(path, retry_errors=False):
+    """Файлы, которые уже есть в журнале (с retry_errors - только успешные)"""
+    return {
+        record["file"] for record in iter_journal(path)
+        if not retry_errors or record["status"] == "success"
+    }
+
+
+def open_journal(path):
+    """Журнал для дозаписи; если сбой оборвал последнюю строку, новая начнется с новой строки"""
+    path = Path(path)
+    needs_newline = False
+    if path.exists() and path.stat().st_size:
+        with open(path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            needs_newline = f.read(1) != b'\n'
+    journal = open(path, 'a', encoding='utf-8')
+    if needs_newline:
+        journal.write('\n')
+    return journal
+
+
+def process_file(path, root):
+    """Один документ в воркере -> запись журнала"""
+    start_time = time.perf_counter()
+    record = {"file": str(path.relative_to(root)), "size": path.stat().st_size, "worker": os.getpid()}
+    try:
+        content = path.read_bytes()
+        stem = f"{path.stem}_{document_key(content)[:8]}"
+        pages = []
+        # --deadline-ms - на документ: после срока детекторы оставшихся страниц сразу помечаются timed_out
+        deadline = Deadline.from_options(_options)
+        original_sizes = None if is_pdf(path.name) else image_page_sizes(content)
+        for page_number, image in enumerate(iter_document_images(path.name, content, _options.zoom,
+                                                                            use_cache=_options.render_cache), 1):
+            timed_out = []
+            detections, timings = detect_page(_inspector, image, _options, deadline, timed_out)
+            page = {"page": page_number, "page_size": list(image.size), "detections": detections,
+                    "counts": count_detections(detections), "timings": timings, "timed_out": timed_out}
+            if original_sizes is not None:
+                page.update(original_geometry(image, original_sizes[page_number - 1]))
+            artifact = save_page_artifact(_inspector, _options.annotate, image, detections, _output_dir,
+                                          f"{stem}_page_{page_number}", timings)
+            if artifact is not None:
+                page["artifact"] = artifact[1]
+            pages.append(page)
+        record.update({"status": "success", "total_pages": len(pages), "total_counts": sum_counts(pages),
+                       "partial": any(page["timed_out"] for page in pages), "pages": pages})
+        if _options.annotate == 'pdf':
+            record["annotated_pdf"] = f"{stem}_annotated.pdf"
+            write_annotated_pdf(path.name, content,
+                                [(page["page"], page["page_size"], page["detections"]) for page in pages],
+                                Path(_output_dir) / record["annotated_pdf"])
+    except Exception as e:
+        record.update({"status": "error", "error": str(e)})
+    record["processing_time"] = round(time.perf_counter() - start_time, 3)
+    record["timestamp"] = datetime.now().isoformat()
+    return record
+
+
+def init_worker(counter, workers):
+    """Каждый воркер берет свой номер и свою долю ядер"""
+    from services.cpu_tuning import tune_worker
+
+    with counter.get_lock():
+        index = counter.value
+        counter.value += 1
+    tune_worker(index, workers)
+
+
+def run_batch(inspector, files, root, options, journal_path, workers=1, output_dir=OUTPUT_DIR):
+    """Обрабатывает files в workers процессах, дописывая журнал по мере готовности; -> (успешно, ошибок)"""
+    global _inspector, _options, _output_dir
+    _inspector, _options, _output_dir = inspector, options, output_dir
+    if options.annotate != 'none':
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+    done, failed = 0, 0
+    with open_journal(journal_path) as journal:
+        def write(record):
+            nonlocal done, failed
+            journal.write(json.dumps(record, ensure_ascii=False) + '\n')
+            journal.flush()
+            done += record["status"] == "success"
+            failed += record["status"] != "success"
+            mark = "✅" if record["status"] == "success" else "❌"
+            print(f"{mark} {record['file']}: {record.get('total_pages', 0)} стр. за {record['processing_time']} с")
+
+        if workers <= 1:
+            # Без пула init_worker не вызывается: потоки настраиваются в этом процессе
+            from services.cpu_tuning import tune_worker
+            tune_worker(0, 1)
+            for path in files:
+                write(process_file(path, root))
+            return done, failed
+
+        context = multiprocessing.get_context('fork')
+        counter = context.Value('i', 0)
+        with context.Pool(workers, initializer=init_worker, initargs=(counter, workers)) as pool:
+            for record in pool.imap_unordered(_process_path, ((path, root) for path in files)):
+                write(record)
+    return done, failed
+
+
+def _process_path(task):
+    return process_file(*task)
+
+
+def summarize(journal_path):
+    """Сводка по журналу одним проходом; для повторно обработанных файлов берется последняя запись"""
+    latest = {}
+    for record in iter_journal(journal_path):
+        # В памяти только итоги файла, без постраничных детекций
+        latest[record["file"]] = {
+            "status": record["status"],
+            "pages": record.get("total_pages", 0),
+            "counts": record.get("total_counts", {}),
+            "time": record.get("processing_time", 0.0)
+        }
+    successful = [item for item in latest.values() if item["status"] == "success"]
+    totals = {name: sum(item["counts"].get(name, 0) for item in successful) for name in DETECTORS}
+    processing_time = sum(item["time"] for item in successful)
+    pages = sum(item["pages"] for item in successful)
+    return {
+        "files": len(latest),
+        "successful": len(successful),
+        "failed": len(latest) - len(successful),
+        "total_pages_processed": pages,
+        "total_counts": totals,
+        "total_processing_time": round(processing_time, 2),
+        "document_time_s": describe([item["time"] for item in successful]),
+        "pages_per_worker_second": round(pages / processing_time, 3) if processing_time else 0.0
+    }
+
+
+def print_summary(summary, journal_path):
+    print(f"\n{'='*60}")
+    print("📈 ИТОГИ:")
+    print(f"✅ Успешных файлов: {summary['successful']}")
+    print(f"❌ Ошибок: {summary['failed']}")
+    print(f"📄 Всего страниц обработано: {summary['total_pages_processed']}")
+    print(f"⏱️ Суммарное время обработки: {summary['total_processing_time']:.2f}с")
+    print(f"   ✍️ Подписей: {summary['total_counts']['signatures']}")
+    print(f"   📱 QR-кодов: {summary['total_counts']['qr_codes']}")
+    print(f"   🏷️ Штампов: {summary['total_counts']['stamps']}")
+    print(f"💾 Журнал: {journal_path}")
+    print(f"{'='*60}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Пакетная обработка каталога с журналом JSONL и возобновлением")
+    parser.add_argument("command", choices=("run", "summary"))
+    parser.add_argument("directory", nargs='?', default=str(PDFS_DIR), help="каталог с PDF и изображениями")
+    parser.add_argument("--journal", default=str(JOURNAL_FILE), help="журнал JSONL (дописывается)")
+    parser.add_argument("--workers", type=int, default=1, help="число параллельных процессов")
+    parser.add_argument("--recursive", action="store_true", help="обходить подкаталоги")
+    parser.add_argument("--retry-errors", action="store_true", help="повторить файлы, завершившиеся ошибкой")
+    parser.add_argument("--limit", type=int, help="обработать не больше N новых файлов")
+    parser.add_argument("--summary", help="куда записать JSON-сводку")
+    add_pipeline_arguments(parser, annotate="none")
+    parser.add_argument("--output-dir", default=str(OUTPUT_DIR), help="куда писать артефакты --annotate")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        options = options_from_args(args)
+        root = Path(args.directory)
+        if not root.is_dir():
+            print(f"❌ Папка {root} не существует")
+            return 1
+        skip = journaled_files(args.journal, args.retry_errors)
+        files = (path for path in iter_files(root, args.recursive) if str(path.relative_to(root)) not in skip)
+        if args.limit:
+            files = (path for _, path in zip(range(args.limit), files))
+        print(f"📁 {root}: уже в журнале {len(skip)} файлов, обработка в {args.workers} процессах")
+
+        from services.fake_inspector import make_inspector
+
+        # Модели загружаются один раз здесь, воркеры получают их через fork
+        inspector = make_inspector(options.detectors, (options.tier,) if options.tier else None)
+        start_time = time.perf_counter()
+        done, failed = run_batch(inspector, files, root, options, args.journal, args.workers, args.output_dir)
+        print(f"🏁 Новых файлов: {done + failed} ({failed} с ошибкой) за {time.perf_counter() - start_time:.1f} с")
+
+    summary = summarize(args.journal)
+    print_summary(summary, args.journal)
+    if args.summary:
+        with open(args.summary, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+# benchmark.py - сквозной бенчмарк пайплайна на корпусе PDF
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from services.pipeline import add_pipeline_arguments, iter_page_events, is_pdf, options_from_args
+from services.serialization import dumps
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent.parent
+PDFS_DIR = PROJECT_ROOT / 'selected_output' / 'pdfs'
+PERCENTILES = (50, 95, 99)
+# Бюджет холодного импорта API (python -c "import main", без загрузки моделей), с
+STARTUP_BUDGET_S = 1.0
+
+
+def percentile(values, q):
+    """Перцентиль с линейной интерполяцией (q от 0 до 100)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def describe(values):
+    """Сводка по выборке длительностей в мс"""
+    summary = {
+        "count": len(values),
+        "total": round(sum(values), 2),
+        "mean": round(sum(values) / len(values), 2) if values else 0.0,
+        "max": round(max(values), 2) if values else 0.0
+    }
+    for q in PERCENTILES:
+        summary[f"p{q}"] = round(percentile(values, q), 2)
+    return summary
+
+
+def peak_rss_mb():
+    """Пиковый RSS процесса в МБ (ru_maxrss в КБ на Linux, в байтах на macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+def cpu_seconds():
+    times = os.times()
+    return times.user + times.system
+
+
+def collect_files(pdfs_dir, limit=None):
+    files = sorted(path for path in Path(pdfs_dir).iterdir() if path.is_file() and is_pdf(path.name))
+    return files[:limit] if limit else files
+
+
+def run_benchmark(inspector, files, options=None, output_dir=None):
+    """Прогоняет файлы через пайплайн и собирает тайминги по этапам"""
+    output_dir = Path(output_dir or tempfile.mkdtemp(prefix="stampnsign_bench_"))
+    stages = {}
+    page_latencies = []
+    document_latencies = []
+    documents = []
+    skipped_pages = 0
+
+    wall_start = time.perf_counter()
+    cpu_start = cpu_seconds()
+
+    for path in files:
+        document_start = time.perf_counter()
+        try:
+            start_time = time.perf_counter()
+            content = path.read_bytes()
+            stages.setdefault("upload_read", []).append((time.perf_counter() - start_time) * 1000)
+
+            pages = []
+            for event in iter_page_events(inspector, path.name, content, output_dir, options):
+                if event["event"] == "annotated":
+                    # Документный этап режима annotate=pdf: запись копии с векторными рамками
+                    stages.setdefault("annotate", []).extend(event["timings"].values())
+                if event["event"] != "persisted":
+                    continue
+                pages.append(event)
+                if event.get("skipped"):
+                    # Страница после общего срока не обрабатывалась: в латентности не попадает
+                    skipped_pages += 1
+                    continue
+                for stage, value in event["timings"].items():
+                    stages.setdefault(stage, []).append(value)
+                page_latencies.append(sum(event["timings"].values()))
+
+            start_time = time.perf_counter()
+            dumps({"success": True, "pages": pages})
+            stages.setdefault("serialize", []).append((time.perf_counter() - start_time) * 1000)
+        except Exception as e:
+            print(f"❌ Ошибка обработки {path.name}: {e}")
+            documents.append({"file_name": path.name, "status": "error", "error": str(e)})
+            continue
+
+        latency = (time.perf_counter() - document_start) * 1000
+        document_latencies.append(latency)
+        documents.append({
+            "file_name": path.name,
+            "status": "success",
+            "pages": len(pages),
+            "latency_ms": round(latency, 2)
+        })
+        print(f"   📄 {path.name}: {len(pages)} стр., {latency / 1000:.2f}с")
+
+    wall_time = time.perf_counter() - wall_start
+    cpu_time = cpu_seconds() - cpu_start
+    total_pages = len(page_latencies)
+
+    return {
+        "documents": len(files),
+        "failed": sum(1 for doc in documents if doc["status"] == "error"),
+        "pages": total_pages,
+        "skipped_pages": skipped_pages,
+        "wall_time_s": round(wall_time, 3),
+        "pages_per_second": round(total_pages / wall_time, 3) if wall_time else 0.0,
+        "page_latency_ms": describe(page_latencies),
+        "document_latency_ms": describe(document_latencies),
+        "stages_ms": {stage: describe(values) for stage, values in stages.items()},
+        "cpu_time_s": round(cpu_time, 3),
+        "cpu_utilization": round(cpu_time / wall_time / (os.cpu_count() or 1), 3) if wall_time else 0.0,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "files": documents
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк пайплайна StampNSign на корпусе PDF")
+    parser.add_argument("--pdfs-dir", default=str(PDFS_DIR), help="папка с PDF")
+    parser.add_argument("--limit", type=int, help="обработать только первые N файлов")
+    add_pipeline_arguments(parser)
+    parser.add_argument("--startup-budget-s", type=float,
+                        default=float(os.getenv("STAMPNSIGN_STARTUP_BUDGET_S", STARTUP_BUDGET_S)),
+                        help="бюджет холодного импорта main.py, с")
+    parser.add_argument("--output", default="benchmark_report.json", help="куда записать JSON-отчет")
+    args = parser.parse_args(argv)
+
+    options = options_from_args(args)
+    files = collect_files(args.pdfs_dir, args.limit)
+    if not files:
+        print(f"❌ В папке {args.pdfs_dir} не найдено PDF файлов")
+        return 1
+
+    from services.cpu_tuning import tune_worker
+    from services.fake_inspector import make_inspector
+    from services.import_profile import profile_import
+
+    # Холодный импорт API в отдельном процессе: фреймворки моделей не должны попадать в него
+    startup = profile_import('main')
+    startup = {
+        "import_main_s": startup["wall_s"],
+        "imports_s": startup["import_s"],
+        "heaviest_packages_ms": dict(list(startup["packages_ms"].items())[:5]),
+        "heavy_packages": startup["heavy"],
+        "budget_s": args.startup_budget_s,
+        "within_budget": startup["ok"] and startup["wall_s"] <= args.startup_budget_s and not startup["heavy"]
+    }
+
+    # Те же потоки, что у одиночного воркера API
+    print(f"⚙️ Потоки: {tune_worker()}")
+    print(f"🚀 Загрузка моделей ({', '.join(options.detectors)})...")
+    start_time = time.perf_counter()
+    inspector = make_inspector(options.detectors, (options.tier,) if options.tier else None)
+    model_load_time = time.perf_counter() - start_time
+
+    print(f"📁 Бенчмарк на {len(files)} файлах")
+    report = {
+        "benchmark_info": {
+            "timestamp": datetime.now().isoformat(),
+            "pdfs_directory": str(args.pdfs_dir),
+            "detectors": list(options.detectors),
+            "thresholds": options.thresholds,
+            # С кешем этап render после первого прогона меряет чтение .npy, а не рендеринг
+            "render_cache": options.render_cache,
+            "fake_models": os.getenv("STAMPNSIGN_FAKE_MODELS") == "1",
+            "cpu_count": os.cpu_count(),
+            "python": sys.version.split()[0]
+        },
+        "model_load_time_s": round(model_load_time, 3),
+        "startup": {**startup, "model_load_s": round(model_load_time, 3)},
+        **run_benchmark(inspector, files, options)
+    }
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(f"\n{'='*60}")
+    print(f"📄 Страниц: {report['pages']}, {report['pages_per_second']} стр/с")
+    latency = report["page_latency_ms"]
+    print(f"⏱️ Страница p50/p95/p99: {latency['p50']}/{latency['p95']}/{latency['p99']} мс")
+    mark = "✅" if startup["within_budget"] else "❌"
+    print(f"{mark} Импорт main.py: {startup['import_main_s']} с (бюджет {startup['budget_s']} с), "
+          f"загрузка моделей: {report['model_load_time_s']} с")
+    if startup["heavy_packages"]:
+        print(f"   ⚠️ При импорте загружаются: {', '.join(startup['heavy_packages'])}")
+    print(f"🧠 Пиковый RSS: {report['peak_rss_mb']} МБ, CPU: {report['cpu_utilization'] * 100:.0f}%")
+    print(f"💾 Отчет сохранен в: {args.output}")
+    print(f"{'='*60}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,257 @@
+# cpu_tuning.py - потоки torch/OpenCV/OpenMP и привязка воркеров к ядрам по топологии машины
+import argparse
+import json
+import os
+import sys
+import time
+from dataclasses import asdict, dataclass, replace
+from datetime import datetime
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent.parent
+LAYOUT_FILE = PROJECT_ROOT / 'cache' / 'cpu_layout.json'
+
+
+@dataclass(frozen=True)
+class ThreadLayout:
+    """Потоки одного воркера: intra-op torch, inter-op torch, OpenCV и привязка к ядрам"""
+    intra_op: int
+    inter_op: int = 1
+    opencv: int = 1
+    pin: bool = False
+
+
+def available_cpus():
+    """Логические CPU, доступные процессу (с учетом cgroup/taskset)"""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def physical_cores(cpus=None):
+    """Логические CPU, сгруппированные по физическим ядрам: [[0, 8], [1, 9], ...]"""
+    cores = {}
+    for cpu in cpus or available_cpus():
+        topology = Path(f"/sys/devices/system/cpu/cpu{cpu}/topology")
+        try:
+            key = ((topology / 'physical_package_id').read_text().strip(), (topology / 'core_id').read_text().strip())
+        except OSError:
+            key = ('0', str(cpu))
+        cores.setdefault(key, []).append(cpu)
+    return list(cores.values())
+
+
+def default_layout(workers=1, cores=None):
+    """Эвристика: физические ядра делятся поровну между воркерами, гиперпотоки не используются
+    для intra-op (матричные ядра упираются в FPU ядра, а не в число потоков)"""
+    cores = cores or physical_cores()
+    per_worker = max(1, len(cores) // max(workers, 1))
+    return ThreadLayout(intra_op=per_worker, inter_op=1, opencv=1, pin=workers > 1 and len(cores) >= workers)
+
+
+def worker_cpus(worker_index, workers, cores=None):
+    """Логические CPU для воркера worker_index: его доля физических ядер вместе с их гиперпотоками"""
+    cores = cores or physical_cores()
+    if workers <= 1 or len(cores) < workers:
+        return [cpu for core in cores for cpu in core]
+    per_worker = len(cores) // workers
+    share = cores[worker_index % workers * per_worker:(worker_index % workers + 1) * per_worker]
+    return [cpu for core in share for cpu in core]
+
+
+def layout_key(workers, cores=None):
+    return f"{len(cores or physical_cores())}c{len(available_cpus())}t-{workers}w"
+
+
+def load_layout(workers=1, path=None):
+    """Откалиброванная раскладка для этой машины и числа воркеров или None"""
+    path = path or os.getenv("STAMPNSIGN_CPU_LAYOUT") or LAYOUT_FILE
+    try:
+        with open(path, encoding='utf-8') as f:
+            stored = json.load(f).get(layout_key(workers))
+    except (OSError, ValueError):
+        return None
+    return ThreadLayout(**stored["layout"]) if stored else None
+
+
+def save_layout(workers, result, path=None):
+    path = Path(path or os.getenv("STAMPNSIGN_CPU_LAYOUT") or LAYOUT_FILE)
+    try:
+        with open(path, encoding='utf-8') as f:
+            layouts = json.load(f)
+    except (OSError, ValueError):
+        layouts = {}
+    layouts[layout_key(workers)] = result
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(layouts, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def apply_layout(layout, worker_index=0, workers=1):
+    """Применяет раскладку к текущему процессу; возвращает фактически выставленные значения.
+
+    OMP_NUM_THREADS/MKL_NUM_THREADS/OPENBLAS_NUM_THREADS здесь не выставляются: библиотеки читают их
+    при загрузке, а numpy и OpenCV к этому моменту уже импортированы. torch настраивается через API.
+    """
+    applied = asdict(layout)
+    if layout.pin and hasattr(os, 'sched_setaffinity'):
+        cpus = worker_cpus(worker_index, workers)
+        os.sched_setaffinity(0, cpus)
+        applied["cpus"] = cpus
+
+    try:
+        import cv2
+        cv2.setNumThreads(layout.opencv)
+    except ImportError:
+        pass
+    try:
+        import torch
+    except ImportError:
+        return applied
+    torch.set_num_threads(layout.intra_op)
+    try:
+        torch.set_num_interop_threads(layout.inter_op)
+    except RuntimeError:
+        # Пул inter-op уже запущен (например, прогрев моделей до fork) - остается как есть
+        applied["inter_op"] = torch.get_num_interop_threads()
+    return applied
+
+
+def worker_slot():
+    """(номер воркера, число воркеров) для процесса, запущенного внешним менеджером (uvicorn/gunicorn --workers).
+
+    Число воркеров - STAMPNSIGN_WORKERS или WEB_CONCURRENCY, номер - STAMPNSIGN_WORKER_INDEX;
+    без номера возвращается None: доля ядер известна, а какая именно - нет.
+    """
+    workers = int(os.getenv("STAMPNSIGN_WORKERS") or os.getenv("WEB_CONCURRENCY") or "1")
+    index = os.getenv("STAMPNSIGN_WORKER_INDEX")
+    return (int(index) if index else None), max(workers, 1)
+
+
+def tune_worker(worker_index=0, workers=1):
+    """Настройка потоков воркера при старте: калибровка из файла или эвристика по топологии.
+
+    worker_index=None - номер воркера неизвестен: потоки делятся на workers, но без привязки к ядрам,
+    иначе все такие воркеры попали бы на одни и те же ядра.
+    STAMPNSIGN_CPU_TUNING=off оставляет настройки библиотек по умолчанию.
+    """
+    if os.getenv("STAMPNSIGN_CPU_TUNING", "auto") == "off":
+        return None
+    layout = load_layout(workers) or default_layout(workers)
+    if worker_index is None:
+        return apply_layout(replace(layout, pin=False), 0, workers)
+    return apply_layout(layout, worker_index, workers)
+
+
+def candidate_layouts(workers, cores=None):
+    """Раскладки для калибровки: число intra-op потоков (степени двойки до доли ядер) x привязка"""
+    cores = cores or physical_cores()
+    per_worker = max(1, len(cores) // workers)
+    logical = max(1, len(available_cpus()) // workers)
+    counts = sorted({1 << power for power in range(per_worker.bit_length()) if 1 << power <= per_worker}
+                    | {per_worker, logical})
+    pins = (False, True) if workers > 1 and len(cores) >= workers else (False,)
+    return [ThreadLayout(intra_op=count, inter_op=1, opencv=1, pin=pin) for count in counts for pin in pins]
+
+
+def measure_worker(inspector, images, options, layout, worker_index, workers, barrier, results):
+    """Тело воркера калибровки (после fork): страниц обработано и время"""
+    from services.pipeline import detect_page
+
+    apply_layout(layout, worker_index, workers)
+    barrier.wait()
+    start_time = time.perf_counter()
+    for image in images:
+        detect_page(inspector, image, options)
+    results.put((len(images), time.perf_counter() - start_time))
+
+
+def measure_layout(inspector, images, options, layout, workers):
+    """Пропускная способность workers воркеров с раскладкой layout, стр/с"""
+    import multiprocessing
+
+    context = multiprocessing.get_context('fork')
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [
+        context.Process(target=measure_worker,
+                        args=(inspector, images, options, layout, index, workers, barrier, results))
+        for index in range(workers)
+    ]
+    start_time = time.perf_counter()
+    for process in processes:
+        process.start()
+    measured = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    wall_time = time.perf_counter() - start_time
+    return sum(pages for pages, _ in measured) / max(wall_time, 1e-9)
+
+
+def calibrate(inspector, images, options, workers):
+    """Замер всех кандидатов; лучший - с наибольшим числом страниц в секунду"""
+    candidates = []
+    for layout in candidate_layouts(workers):
+        pages_per_second = measure_layout(inspector, images, options, layout, workers)
+        candidates.append({"layout": asdict(layout), "pages_per_second": round(pages_per_second, 3)})
+        print(f"  {layout}: {pages_per_second:.2f} стр/с")
+    best = max(candidates, key=lambda candidate: candidate["pages_per_second"])
+    return {
+        "layout": best["layout"],
+        "pages_per_second": best["pages_per_second"],
+        "cpus": len(available_cpus()),
+        "physical_cores": len(physical_cores()),
+        "workers": workers,
+        "candidates": candidates,
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+def main(argv=None):
+    from services.benchmark import PDFS_DIR, collect_files
+    from services.pipeline import iter_pdf_pages, make_options
+
+    parser = argparse.ArgumentParser(description="Калибровка потоков и привязки к ядрам для воркеров инференса")
+    parser.add_argument("command", choices=("show", "calibrate"))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("STAMPNSIGN_WORKERS", "1")))
+    parser.add_argument("--pdfs-dir", default=str(PDFS_DIR), help="папка с PDF для замера")
+    parser.add_argument("--pages", type=int, default=4, help="страниц на воркер в каждом замере")
+    parser.add_argument("--detectors", help="например: signatures,qr_codes")
+    parser.add_argument("--tier", help="уровень моделей из реестра: fast, balanced, accurate")
+    parser.add_argument("--output", help=f"файл раскладок (по умолчанию {LAYOUT_FILE})")
+    args = parser.parse_args(argv)
+
+    cores = physical_cores()
+    print(f"🖥️ CPU: {len(available_cpus())} логических, {len(cores)} физических ядер, воркеров: {args.workers}")
+    if args.command == "show":
+        stored = load_layout(args.workers, args.output)
+        print(f"⚙️ {'Откалиброванная' if stored else 'Эвристическая'} раскладка: "
+              f"{stored or default_layout(args.workers, cores)}")
+        for index in range(args.workers):
+            print(f"  воркер {index}: CPU {worker_cpus(index, args.workers, cores)}")
+        return 0
+
+    options = make_options(args.detectors, tier=args.tier)
+    images = []
+    for path in collect_files(args.pdfs_dir):
+        images.extend(iter_pdf_pages(path.read_bytes(), options.zoom))
+        if len(images) >= args.pages:
+            break
+    images = images[:args.pages]
+    if not images:
+        print(f"❌ В папке {args.pdfs_dir} не найдено PDF файлов")
+        return 1
+
+    from services.fake_inspector import make_inspector
+    inspector = make_inspector(options.detectors, (options.tier,) if options.tier else None)
+    result = calibrate(inspector, images, options, args.workers)
+    path = save_layout(args.workers, result, args.output)
+    print(f"🏆 Лучшая раскладка: {result['layout']} ({result['pages_per_second']} стр/с), сохранена в {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+# deadlines.py - бюджеты времени запроса и отдельного вызова детектора
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+# Потоки, в которых идут детекторы с лимитом времени. Зависший вызов нельзя прервать: он дорабатывает
+# в своем потоке (и держит замок модели), а результат отбрасывается
+DETECTOR_THREADS = int(os.getenv("STAMPNSIGN_DETECTOR_THREADS", "8"))
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+class DetectorTimeout(Exception):
+    """Детектор не уложился в бюджет времени"""
+
+
+def parse_budget_ms(value, name):
+    """Бюджет в мс из параметра запроса или переменной окружения; None - без ограничения"""
+    if value is None or value == "":
+        return None
+    try:
+        budget = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid {name} '{value}'")
+    if budget <= 0:
+        raise ValueError(f"{name} must be positive: '{value}'")
+    return budget
+
+
+class Deadline:
+    """Общий срок обработки документа и лимит на один вызов детектора на странице (мс)"""
+
+    def __init__(self, deadline_ms=None, detector_timeout_ms=None):
+        self.expires_at = None if deadline_ms is None else time.perf_counter() + deadline_ms / 1000
+        self.detector_timeout = None if detector_timeout_ms is None else detector_timeout_ms / 1000
+
+    @classmethod
+    def from_options(cls, options):
+        return cls(options.deadline_ms, options.detector_timeout_ms)
+
+    @property
+    def limited(self):
+        return self.expires_at is not None or self.detector_timeout is not None
+
+    def remaining(self):
+        """Секунды до общего срока (None - срока нет)"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.perf_counter())
+
+    def expired(self):
+        return self.expires_at is not None and time.perf_counter() >= self.expires_at
+
+    def timeout(self):
+        """Сколько можно ждать очередной детектор: меньшее из лимита вызова и остатка срока"""
+        limits = [value for value in (self.detector_timeout, self.remaining()) if value is not None]
+        return min(limits) if limits else None
+
+    def run(self, function):
+        """function() с ограничением timeout(); DetectorTimeout, если не уложилась"""
+        timeout = self.timeout()
+        if timeout is None:
+            return function()
+        if timeout <= 0:
+            raise DetectorTimeout()
+        future = detector_executor().submit(function)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            # Еще не начатый вызов снимается с очереди, начатый дорабатывает вхолостую
+            future.cancel()
+            raise DetectorTimeout()
+
+
+def detector_executor():
+    """Общий пул потоков процесса; после fork (prefork, batch) создается заново"""
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(DETECTOR_THREADS, thread_name_prefix="detector")
+            _executor_pid = os.getpid()
+        return _executor
@@ -1,28 +1,48 @@
 # detection_services.py - ИСПРАВЛЕННАЯ ВЕРСИЯ
 import os
+import threading
 from pathlib import Path
-from transformers import pipeline
-import torch
-from qrdet import QRDetector
-import cv2
 import numpy as np
 from PIL import Image
-from ultralytics import YOLO
+
+from enums import DETECTORS
+from services.registry import load_registry
+
+# torch, transformers, ultralytics, qrdet и cv2 импортируются при создании моделей, а не при импорте
+# модуля: API, CLI и воркеры без моделей не платят секунды за импорт фреймворков
 
 # Автоматически определяем пути
 PROJECT_ROOT = Path(__file__).parent.parent.parent.parent
 MODELS_DIR = PROJECT_ROOT / 'models'
 
 class SignatureDetector:
-    def __init__(self):
-        self.detector = pipeline(
-            "object-detection", 
-            model="mdefrance/yolos-base-signature-detection"
-        )
+    def __init__(self, model="mdefrance/yolos-base-signature-detection", input_size=None):
+        from transformers import AutoImageProcessor, pipeline
+
+        kwargs = {}
+        if input_size:
+            # Меньшая сторона входа YOLOS; большая ограничена в той же пропорции, что у 800/1333
+            kwargs['image_processor'] = AutoImageProcessor.from_pretrained(
+                model, size={"shortest_edge": input_size, "longest_edge": round(input_size * 1333 / 800)}
+            )
+        self.detector = pipeline("object-detection", model=model, **kwargs)
     
-    def detect_signatures(self, image):
-        results = self.detector(image)
-        
+    def detect_signatures(self, image, threshold=None):
+        if threshold is None:
+            results = self.detector(image)
+        else:
+            results = self.detector(image, threshold=threshold)
+        return self._to_detections(results)
+
+    def detect_signatures_batch(self, images, threshold=None):
+        """Один пакетный прогон YOLOS по нескольким изображениям (вырезкам страницы)"""
+        kwargs = {'batch_size': len(images)}
+        if threshold is not None:
+            kwargs['threshold'] = threshold
+        return [self._to_detections(results) for results in self.detector(images, **kwargs)]
+
+    @staticmethod
+    def _to_detections(results):
         detections = []
         for result in results:
             box = result['box']
@@ -35,10 +55,14 @@ class SignatureDetector:
         return detections
 
 class QRCodeDetector:
-    def __init__(self):
-        self.detector = QRDetector(model_size='s')
+    def __init__(self, model_size='s'):
+        from qrdet import QRDetector
+
+        self.detector = QRDetector(model_size=model_size)
     
-    def detect_qr_codes(self, image):
+    def detect_qr_codes(self, image, threshold=None):
+        import cv2
+
         # Конвертируем PIL в numpy array для OpenCV
         opencv_image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
         
@@ -63,6 +87,9 @@ class QRCodeDetector:
                 else:
                     # Пропускаем неизвестный формат
                     continue
+
+                if threshold is not None and confidence < threshold:
+                    continue
                 
                 results.append({
                     'label': 'qr_code',
@@ -79,10 +106,13 @@ class QRCodeDetector:
                 detections = self.detector.detect(image=opencv_image, is_bgr=True, legacy=True)
                 results = []
                 for detection in detections:
+                    confidence = float(detection['confidence'])
+                    if threshold is not None and confidence < threshold:
+                        continue
                     results.append({
                         'label': 'qr_code',
                         'bbox': [float(x) for x in detection['bbox_xyxy']],
-                        'confidence': float(detection['confidence'])
+                        'confidence': confidence
                     })
                 return results
             except Exception as fallback_error:
@@ -90,9 +120,10 @@ class QRCodeDetector:
                 return []
 
 class StampDetector:
-    def __init__(self, model_path=None):
+    def __init__(self, model_path=None, input_size=None):
         if model_path is None:
             model_path = MODELS_DIR / 'best.pt'
+        self.input_size = input_size
         
         if not os.path.exists(model_path):
             print(f"⚠️ Модель штампов не найдена: {model_path}")
@@ -100,18 +131,24 @@ class StampDetector:
             return
         
         try:
+            from ultralytics import YOLO
             self.model = YOLO(model_path)
             print(f"✅ Модель штампов загружена: {model_path}")
         except Exception as e:
             print(f"❌ Ошибка загрузки модели штампов: {e}")
             self.model = None
     
-    def detect_stamps(self, image):
+    def detect_stamps(self, image, threshold=None):
         if self.model is None:
             return []
             
         try:
-            results = self.model(image)
+            kwargs = {}
+            if threshold is not None:
+                kwargs['conf'] = threshold
+            if self.input_size:
+                kwargs['imgsz'] = self.input_size
+            results = self.model(image, **kwargs)
             detections = []
             
             for result in results:
@@ -128,48 +165,98 @@ class StampDetector:
             print(f"❌ Ошибка детекции штампов: {e}")
             return []
 
+# Бэкенд из реестра -> (класс модели, метод детекции)
+BACKENDS = {
+    'yolos': (lambda spec: SignatureDetector(spec.weights, spec.input_size), 'detect_signatures'),
+    'qrdet': (lambda spec: QRCodeDetector(spec.weights), 'detect_qr_codes'),
+    'ultralytics': (lambda spec: StampDetector(PROJECT_ROOT / spec.weights, spec.input_size), 'detect_stamps'),
+}
+
+ERROR_MESSAGES = {
+    'signatures': "❌ Ошибка детекции подписей",
+    'qr_codes': "❌ Ошибка детекции QR-кодов",
+    'stamps': "❌ Ошибка детекции штампов",
+}
+
+
 class DigitalInspector:
-    def __init__(self):
-        print("🔄 Загрузка модели подписей...")
-        self.signature_detector = SignatureDetector()
-        print("✅ Модель подписей загружена")
-        
-        print("🔄 Загрузка модели QR-кодов...")
-        self.qr_detector = QRCodeDetector()
-        print("✅ Модель QR-кодов загружена")
-        
-        print("🔄 Загрузка модели штампов...")
-        self.stamp_detector = StampDetector()
-        if self.stamp_detector.model is not None:
-            print("✅ Модель штампов загружена")
-        else:
-            print("⚠️ Модель штампов не доступна")
-    
-    def detect_signatures(self, image):
-        try:
-            return self.signature_detector.detect_signatures(image)
-        except Exception as e:
-            print(f"❌ Ошибка детекции подписей: {e}")
-            return []
+    def __init__(self, detectors=None, tiers=None, registry=None):
+        """detectors - какие модели загружать (по умолчанию все из DETECTORS),
+        tiers - уровни из реестра (по умолчанию только default_tier)"""
+        self.registry = registry or load_registry()
+        self.detectors = tuple(detectors or DETECTORS)
+        self.tiers = tuple(tiers or (self.registry.default_tier,))
+        self.default_tier = self.registry.default_tier if self.registry.default_tier in self.tiers else self.tiers[0]
+        # Модели (особенно ultralytics) не потокобезопасны: по замку на модель,
+        # чтобы разные запросы могли параллельно идти через разные модели
+        self.models = {}
+        self.locks = {}
+
+        for name in self.detectors:
+            for tier in self.tiers:
+                spec = self.registry.get(name, tier)
+                print(f"🔄 Загрузка модели {name} ({tier}: {spec.backend} {spec.weights})...")
+                factory, _ = BACKENDS[spec.backend]
+                self.models[(name, tier)] = (spec, factory(spec))
+                self.locks[(name, tier)] = threading.Lock()
+                print(f"✅ Модель {name} ({tier}) загружена")
+
+    def resolve(self, name, tier=None):
+        """(spec, модель) для детектора и уровня; ValueError, если уровень не загружен"""
+        key = (name, tier or self.default_tier)
+        if key not in self.models:
+            raise ValueError(f"Detector '{name}' is not loaded for tier '{key[1]}'")
+        return self.models[key]
+
+    def detect_signatures(self, image, threshold=None, tier=None):
+        return self.run_detector('signatures', image, threshold, tier)
     
-    def detect_qr_codes(self, image):
-        try:
-            return self.qr_detector.detect_qr_codes(image)
-        except Exception as e:
-            print(f"❌ Ошибка детекции QR-кодов: {e}")
-            return []
+    def detect_qr_codes(self, image, threshold=None, tier=None):
+        return self.run_detector('qr_codes', image, threshold, tier)
     
-    def detect_stamps(self, image):
-        try:
-            if self.stamp_detector and self.stamp_detector.model is not None:
-                return self.stamp_detector.detect_stamps(image)
-            return []
-        except Exception as e:
-            print(f"❌ Ошибка детекции штампов: {e}")
+    def detect_stamps(self, image, threshold=None, tier=None):
+        return self.run_detector('stamps', image, threshold, tier)
+
+    def run_detector(self, name, image, threshold=None, tier=None):
+        """Запускает один детектор по имени из DETECTORS на уровне tier"""
+        if name not in DETECTORS:
+            raise ValueError(f"Unknown detector: {name}")
+        if name not in self.detectors:
             return []
+        spec, model = self.resolve(name, tier)
+        threshold = spec.threshold if threshold is None else threshold
+        with self.locks[(name, spec.tier)]:
+            try:
+                return getattr(model, BACKENDS[spec.backend][1])(image, threshold)
+            except Exception as e:
+                print(f"{ERROR_MESSAGES[name]}: {e}")
+                return []
+
+    def run_detector_batch(self, name, images, threshold=None, tier=None):
+        """Детектор на нескольких изображениях; подписи - одним пакетом YOLOS"""
+        if name == 'signatures' and name in self.detectors:
+            spec, model = self.resolve(name, tier)
+            threshold = spec.threshold if threshold is None else threshold
+            with self.locks[(name, spec.tier)]:
+                try:
+                    return model.detect_signatures_batch(images, threshold)
+                except Exception as e:
+                    print(f"❌ Ошибка пакетной детекции подписей: {e}")
+                    return [[] for _ in images]
+        return [self.run_detector(name, image, threshold, tier) for image in images]
+
+    def detect(self, image, detectors=None, thresholds=None, tier=None):
+        """Запускает только выбранные детекторы; thresholds - минимальная уверенность по имени детектора"""
+        thresholds = thresholds or {}
+        return {
+            name: self.run_detector(name, image, thresholds.get(name), tier)
+            for name in (detectors or DETECTORS)
+        }
     
     def draw_detections(self, image, detections):
         """Рисует bounding boxes на изображении"""
+        import cv2
+
         try:
             opencv_image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
             
@@ -0,0 +1,239 @@
+# evaluate.py - точность против скорости на разметке selected_annotations.json
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from enums import DETECTORS
+from services.benchmark import PDFS_DIR, PROJECT_ROOT, describe
+from services.pipeline import make_options, iter_pdf_pages, detect_page
+from services.registry import load_registry
+
+ANNOTATIONS_FILE = PROJECT_ROOT / 'selected_output' / 'selected_annotations.json'
+IOU_THRESHOLDS = (0.5, 0.75)
+
+# Категории разметки -> группы детекций пайплайна
+CATEGORY_GROUPS = {'signature': 'signatures', 'qr': 'qr_codes', 'stamp': 'stamps'}
+
+
+def load_annotations(path=ANNOTATIONS_FILE):
+    """{файл: {страница с нуля: {"size": (w, h), "boxes": {группа: [[x1, y1, x2, y2], ...]}}}}"""
+    with open(path, encoding='utf-8') as f:
+        raw = json.load(f)
+
+    documents = {}
+    for file_name, pages in raw.items():
+        for page_key, page in pages.items():
+            index = int(page_key.split('_')[-1]) - 1
+            boxes = {group: [] for group in DETECTORS}
+            for annotation in page.get("annotations", []):
+                for item in annotation.values():
+                    group = CATEGORY_GROUPS.get(item["category"])
+                    if group is None:
+                        continue
+                    bbox = item["bbox"]
+                    boxes[group].append([
+                        bbox["x"], bbox["y"], bbox["x"] + bbox["width"], bbox["y"] + bbox["height"]
+                    ])
+            size = (page["page_size"]["width"], page["page_size"]["height"])
+            documents.setdefault(file_name, {})[index] = {"size": size, "boxes": boxes}
+    return documents
+
+
+def iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    intersection = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def match_page(predictions, truths, iou_threshold):
+    """Жадное сопоставление по убыванию уверенности: [(confidence, is_true_positive)]"""
+    matched = set()
+    scored = []
+    for confidence, box in sorted(predictions, key=lambda item: -item[0]):
+        best_index, best_iou = None, iou_threshold
+        for index, truth in enumerate(truths):
+            if index in matched:
+                continue
+            overlap = iou(box, truth)
+            if overlap >= best_iou:
+                best_index, best_iou = index, overlap
+        if best_index is not None:
+            matched.add(best_index)
+        scored.append((confidence, best_index is not None))
+    return scored
+
+
+def average_precision(scored, total_truths):
+    """AP по всем точкам кривой precision/recall (как в VOC 2010+)"""
+    if total_truths == 0:
+        return None
+    true_positives = 0
+    points = []
+    for rank, (_, is_tp) in enumerate(sorted(scored, key=lambda item: -item[0]), 1):
+        true_positives += is_tp
+        points.append((true_positives / total_truths, true_positives / rank))
+
+    ap = 0.0
+    previous_recall = 0.0
+    for i, (recall, _) in enumerate(points):
+        best_precision = max(precision for _, precision in points[i:])
+        ap += (recall - previous_recall) * best_precision
+        previous_recall = recall
+    return ap
+
+
+def summarize(scored, total_truths):
+    true_positives = sum(1 for _, is_tp in scored if is_tp)
+    false_positives = len(scored) - true_positives
+    ap = average_precision(scored, total_truths)
+    return {
+        "tp": true_positives,
+        "fp": false_positives,
+        "fn": total_truths - true_positives,
+        "precision": round(true_positives / len(scored), 4) if scored else None,
+        "recall": round(true_positives / total_truths, 4) if total_truths else None,
+        "ap": round(ap, 4) if ap is not None else None
+    }
+
+
+def parse_config(text):
+    """Конфигурация вида "zoom=1.5;detectors=qr_codes;thresholds=0.3;fusion=wbf;qr_screen=off" """
+    values = {}
+    for item in filter(None, (part.strip() for part in text.split(';'))):
+        key, _, value = item.partition('=')
+        values[key.strip()] = value.strip()
+
+    options = make_options(
+        values.pop("detectors", None), values.pop("thresholds", None),
+        values.pop("fusion", None), values.pop("containment", None), values.pop("qr_screen", None),
+        values.pop("signature_mode", None), values.pop("tier", None)
+    )
+    if "zoom" in values:
+        options.zoom = float(values.pop("zoom"))
+    if values:
+        raise ValueError(f"Unknown config keys: {', '.join(values)}")
+    return options
+
+
+def to_page_space(box, image_size, page_size):
+    """Пиксели отрендеренной страницы -> координаты разметки"""
+    scale_x = page_size[0] / image_size[0]
+    scale_y = page_size[1] / image_size[1]
+    return [box[0] * scale_x, box[1] * scale_y, box[2] * scale_x, box[3] * scale_y]
+
+
+def evaluate_config(inspector, annotations, pdfs_dir, options):
+    """Метрики по классам на IoU-порогах и пропускная способность одной конфигурации"""
+    scored = {threshold: {group: [] for group in options.detectors} for threshold in IOU_THRESHOLDS}
+    totals = {group: 0 for group in options.detectors}
+    page_latencies = []
+    start_time = time.perf_counter()
+
+    for file_name, pages in annotations.items():
+        path = Path(pdfs_dir) / file_name
+        if not path.exists():
+            print(f"⚠️ Нет файла для разметки: {file_name}")
+            continue
+
+        indices = sorted(pages)
+        content = path.read_bytes()
+        render_start = time.perf_counter()
+        for index, image in zip(indices, iter_pdf_pages(content, options.zoom, indices)):
+            detections, timings = detect_page(inspector, image, options)
+            page_latencies.append((time.perf_counter() - render_start) * 1000)
+
+            truth = pages[index]
+            for group in options.detectors:
+                totals[group] += len(truth["boxes"][group])
+                predictions = [
+                    (det["confidence"], to_page_space(det["bbox"], image.size, truth["size"]))
+                    for det in detections[group]
+                ]
+                for threshold in IOU_THRESHOLDS:
+                    scored[threshold][group].extend(match_page(predictions, truth["boxes"][group], threshold))
+            render_start = time.perf_counter()
+
+    wall_time = time.perf_counter() - start_time
+    metrics = {}
+    for threshold in IOU_THRESHOLDS:
+        per_class = {group: summarize(scored[threshold][group], totals[group]) for group in options.detectors}
+        aps = [item["ap"] for item in per_class.values() if item["ap"] is not None]
+        metrics[f"iou_{threshold}"] = {
+            "classes": per_class,
+            "mAP": round(sum(aps) / len(aps), 4) if aps else None
+        }
+
+    return {
+        "pages": len(page_latencies),
+        "wall_time_s": round(wall_time, 3),
+        "pages_per_second": round(len(page_latencies) / wall_time, 3) if wall_time else 0.0,
+        "page_latency_ms": describe(page_latencies),
+        "metrics": metrics
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Оценка точности и скорости детекторов по разметке")
+    parser.add_argument("--annotations", default=str(ANNOTATIONS_FILE), help="файл разметки")
+    parser.add_argument("--pdfs-dir", default=str(PDFS_DIR), help="папка с PDF")
+    parser.add_argument("--config", action="append",
+                        help='конфигурация, например "zoom=1.5;thresholds=0.3" (можно несколько)')
+    parser.add_argument("--limit", type=int, help="оценить только первые N документов")
+    parser.add_argument("--output", default="evaluation_report.json", help="куда записать JSON-отчет")
+    args = parser.parse_args(argv)
+
+    configs = [(text, parse_config(text)) for text in (args.config or ["zoom=2"])]
+    annotations = load_annotations(args.annotations)
+    if args.limit:
+        annotations = dict(list(annotations.items())[:args.limit])
+
+    from services.fake_inspector import make_inspector
+
+    needed = tuple(name for name in DETECTORS if any(name in options.detectors for _, options in configs))
+    default_tier = load_registry().default_tier
+    tiers = tuple(dict.fromkeys(options.tier or default_tier for _, options in configs))
+    print(f"🚀 Загрузка моделей ({', '.join(needed)})...")
+    inspector = make_inspector(needed, tiers)
+
+    report = {
+        "evaluation_info": {
+            "timestamp": datetime.now().isoformat(),
+            "annotations": str(args.annotations),
+            "documents": len(annotations),
+            "iou_thresholds": list(IOU_THRESHOLDS),
+            "fake_models": os.getenv("STAMPNSIGN_FAKE_MODELS") == "1"
+        },
+        "configs": []
+    }
+    for text, options in configs:
+        print(f"\n🔍 Конфигурация: {text}")
+        result = evaluate_config(inspector, annotations, args.pdfs_dir, options)
+        report["configs"].append({"config": text, **result})
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(f"\n{'='*60}")
+    print(f"{'config':<36}{'стр/с':>8}{'mAP@.5':>8}{'mAP@.75':>9}")
+    for item in report["configs"]:
+        map50 = item["metrics"]["iou_0.5"]["mAP"]
+        map75 = item["metrics"]["iou_0.75"]["mAP"]
+        print(f"{item['config']:<36}{item['pages_per_second']:>8}{map50 if map50 is not None else '-':>8}"
+              f"{map75 if map75 is not None else '-':>9}")
+        for group, values in item["metrics"]["iou_0.5"]["classes"].items():
+            print(f"   {group:<12} P={values['precision']} R={values['recall']} AP={values['ap']}")
+    print(f"💾 Отчет сохранен в: {args.output}")
+    print(f"{'='*60}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+# fake_inspector.py - заглушка DigitalInspector для нагрузочного тестирования API без моделей
+import os
+import random
+import time
+
+from PIL import ImageDraw
+
+from enums import DETECTORS
+from services.registry import TIERS
+
+LABELS = {'signatures': 'signature', 'qr_codes': 'qr_code', 'stamps': 'stamp'}
+COLORS = {'signature': (255, 0, 0), 'qr_code': (0, 255, 0), 'stamp': (0, 0, 255)}
+
+# Примерная стоимость настоящих моделей на CPU, мс на страницу
+DEFAULT_LATENCY_MS = {'signatures': 400.0, 'qr_codes': 60.0, 'stamps': 80.0}
+# Множитель задержки по уровням реестра
+TIER_LATENCY_FACTOR = {'fast': 0.5, 'balanced': 1.0, 'accurate': 2.0}
+
+
+def parse_per_detector(value, default):
+    """ "50" -> всем детекторам 50; "signatures:300,qr_codes:40" -> по детекторам"""
+    result = dict(default)
+    if not value:
+        return result
+    for item in value.split(','):
+        name, _, number = item.strip().rpartition(':')
+        if name:
+            result[name.strip()] = float(number)
+        else:
+            result = {detector: float(number) for detector in DETECTORS}
+    return result
+
+
+class FakeInspector:
+    """Тот же интерфейс, что у DigitalInspector, но с синтетической задержкой и детекциями"""
+
+    def __init__(self, latency_ms=None, detections_per_page=None, busy=False, seed=None, detectors=None):
+        self.detectors = tuple(detectors or DETECTORS)
+        self.tiers = TIERS
+        self.default_tier = 'balanced'
+        self.latency_ms = latency_ms if latency_ms is not None else dict(DEFAULT_LATENCY_MS)
+        self.detections_per_page = detections_per_page if detections_per_page is not None else {
+            name: 1.0 for name in DETECTORS
+        }
+        # busy=True жжет CPU вместо sleep, чтобы имитировать конкуренцию за ядра и GIL
+        self.busy = busy
+        self.random = random.Random(seed)
+
+    @classmethod
+    def from_env(cls):
+        """Настройка через STAMPNSIGN_FAKE_LATENCY_MS, STAMPNSIGN_FAKE_DETECTIONS, STAMPNSIGN_FAKE_BUSY"""
+        return cls(
+            latency_ms=parse_per_detector(os.getenv("STAMPNSIGN_FAKE_LATENCY_MS"), DEFAULT_LATENCY_MS),
+            detections_per_page=parse_per_detector(
+                os.getenv("STAMPNSIGN_FAKE_DETECTIONS"), {name: 1.0 for name in DETECTORS}
+            ),
+            busy=os.getenv("STAMPNSIGN_FAKE_BUSY", "0") == "1",
+            seed=int(os.getenv("STAMPNSIGN_FAKE_SEED", "0"))
+        )
+
+    def _wait(self, name, tier):
+        seconds = self.latency_ms.get(name, 0.0) / 1000 * TIER_LATENCY_FACTOR[tier or self.default_tier]
+        if not self.busy:
+            time.sleep(seconds)
+            return
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            pass
+
+    def _detections(self, name, image, threshold):
+        mean = self.detections_per_page.get(name, 0.0)
+        count = int(mean) + (1 if self.random.random() < mean - int(mean) else 0)
+        width, height = image.size
+        detections = []
+        for _ in range(count):
+            box_width = self.random.uniform(0.05, 0.2) * width
+            box_height = self.random.uniform(0.03, 0.15) * height
+            x1 = self.random.uniform(0, width - box_width)
+            y1 = self.random.uniform(0, height - box_height)
+            confidence = self.random.uniform(0.3, 0.99)
+            if threshold is not None and confidence < threshold:
+                continue
+            detections.append({
+                'label': LABELS[name],
+                'bbox': [x1, y1, x1 + box_width, y1 + box_height],
+                'confidence': confidence
+            })
+        return detections
+
+    def run_detector(self, name, image, threshold=None, tier=None):
+        if name not in DETECTORS:
+            raise ValueError(f"Unknown detector: {name}")
+        if name not in self.detectors:
+            return []
+        self._wait(name, tier)
+        return self._detections(name, image, threshold)
+
+    def run_detector_batch(self, name, images, threshold=None, tier=None):
+        return [self.run_detector(name, image, threshold, tier) for image in images]
+
+    def detect_signatures(self, image, threshold=None, tier=None):
+        return self.run_detector('signatures', image, threshold, tier)
+
+    def detect_qr_codes(self, image, threshold=None, tier=None):
+        return self.run_detector('qr_codes', image, threshold, tier)
+
+    def detect_stamps(self, image, threshold=None, tier=None):
+        return self.run_detector('stamps', image, threshold, tier)
+
+    def detect(self, image, detectors=None, thresholds=None, tier=None):
+        thresholds = thresholds or {}
+        return {
+            name: self.run_detector(name, image, thresholds.get(name), tier)
+            for name in (detectors or DETECTORS)
+        }
+
+    def draw_detections(self, image, detections):
+        """Рисует bounding boxes средствами PIL (без OpenCV)"""
+        result = image.copy()
+        draw = ImageDraw.Draw(result)
+        for detection in detections:
+            color = COLORS.get(detection['label'], (128, 128, 128))
+            draw.rectangle(detection['bbox'], outline=color, width=3)
+            draw.text((detection['bbox'][0], detection['bbox'][1] - 12),
+                      f"{detection['label']} {detection.get('confidence', 0):.2f}", fill=color)
+        return result
+
+
+def make_inspector(detectors=None, tiers=None):
+    """Инспектор для CLI-инструментов: заглушка при STAMPNSIGN_FAKE_MODELS=1, иначе настоящие модели"""
+    if os.getenv("STAMPNSIGN_FAKE_MODELS") == "1":
+        return FakeInspector.from_env()
+    from services.detection_services import DigitalInspector
+    return DigitalInspector(detectors, tiers)
@@ -0,0 +1,132 @@
+# fusion.py - постобработка детекций: NMS/WBF внутри класса и правила вложенности между классами
+import numpy as np
+
+from enums import DETECTORS
+
+FUSION_METHODS = ('none', 'nms', 'wbf')
+DEFAULT_IOU = 0.5
+
+
+def to_arrays(detections):
+    """Список детекций -> (boxes (N, 4), scores (N,)) в float64"""
+    if not detections:
+        return np.zeros((0, 4), dtype=np.float64), np.zeros(0, dtype=np.float64)
+    boxes = np.array([det['bbox'] for det in detections], dtype=np.float64)
+    scores = np.array([det['confidence'] for det in detections], dtype=np.float64)
+    return boxes, scores
+
+
+def box_areas(boxes):
+    return np.clip(boxes[:, 2] - boxes[:, 0], 0, None) * np.clip(boxes[:, 3] - boxes[:, 1], 0, None)
+
+
+def intersections(a, b):
+    """Матрица площадей пересечения (len(a), len(b))"""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    return np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+
+
+def iou_matrix(a, b):
+    inter = intersections(a, b)
+    union = box_areas(a)[:, None] + box_areas(b)[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0)
+
+
+def nms(boxes, scores, iou_threshold=DEFAULT_IOU):
+    """Индексы оставшихся боксов по убыванию уверенности"""
+    order = np.argsort(-scores, kind='stable')
+    overlaps = iou_matrix(boxes, boxes)
+    suppressed = np.zeros(len(boxes), dtype=bool)
+    keep = []
+    for index in order:
+        if suppressed[index]:
+            continue
+        keep.append(index)
+        suppressed |= overlaps[index] >= iou_threshold
+    return np.array(keep, dtype=np.int64)
+
+
+def weighted_box_fusion(boxes, scores, iou_threshold=DEFAULT_IOU):
+    """Кластеры перекрывающихся боксов -> (индекс лидера, бокс, взвешенный по уверенности)"""
+    order = np.argsort(-scores, kind='stable')
+    overlaps = iou_matrix(boxes, boxes)
+    assigned = np.zeros(len(boxes), dtype=bool)
+    fused = []
+    for index in order:
+        if assigned[index]:
+            continue
+        cluster = np.flatnonzero(~assigned & (overlaps[index] >= iou_threshold))
+        assigned[cluster] = True
+        weights = scores[cluster]
+        box = (boxes[cluster] * weights[:, None]).sum(axis=0) / max(float(weights.sum()), 1e-9)
+        fused.append((index, box))
+    return fused
+
+
+def parse_fusion(value):
+    """fusion=nms, wbf:0.6 (метод и порог IoU) или none"""
+    if not value:
+        return 'nms', DEFAULT_IOU
+    method, _, iou_threshold = value.strip().lower().partition(':')
+    if method not in FUSION_METHODS:
+        raise ValueError(f"Unknown fusion method '{method}', expected one of: {', '.join(FUSION_METHODS)}")
+    try:
+        iou_threshold = float(iou_threshold) if iou_threshold else DEFAULT_IOU
+    except ValueError:
+        raise ValueError(f"Invalid fusion IoU threshold in '{value}'")
+    if not 0.0 < iou_threshold <= 1.0:
+        raise ValueError(f"Fusion IoU threshold must be in (0, 1]: '{value}'")
+    return method, iou_threshold
+
+
+def parse_containment(value):
+    """Правила "signatures@stamps:0.8" - убрать подписи, на 80%+ лежащие внутри штампа"""
+    rules = []
+    for item in filter(None, (part.strip() for part in (value or "").split(','))):
+        pair, _, ratio = item.partition(':')
+        inner, _, outer = pair.partition('@')
+        inner, outer = inner.strip().replace('-', '_'), outer.strip().replace('-', '_')
+        if inner not in DETECTORS or outer not in DETECTORS or inner == outer:
+            raise ValueError(f"Invalid containment rule '{item}', expected e.g. signatures@stamps:0.8")
+        try:
+            ratio = float(ratio) if ratio else 0.9
+        except ValueError:
+            raise ValueError(f"Invalid containment ratio in '{item}'")
+        rules.append((inner, outer, ratio))
+    return tuple(rules)
+
+
+def fuse_class(detections, method, iou_threshold):
+    if method == 'none' or len(detections) < 2:
+        return detections
+    boxes, scores = to_arrays(detections)
+    if method == 'nms':
+        return [detections[index] for index in nms(boxes, scores, iou_threshold)]
+    return [
+        {**detections[index], 'bbox': [float(coord) for coord in box]}
+        for index, box in weighted_box_fusion(boxes, scores, iou_threshold)
+    ]
+
+
+def apply_containment(detections, rules):
+    """Удаляет внутренние боксы по правилам вложенности между классами"""
+    for inner, outer, ratio in rules:
+        inner_items = detections.get(inner)
+        outer_items = detections.get(outer)
+        if not inner_items or not outer_items:
+            continue
+        inner_boxes, _ = to_arrays(inner_items)
+        outer_boxes, _ = to_arrays(outer_items)
+        contained = intersections(inner_boxes, outer_boxes) / np.maximum(box_areas(inner_boxes), 1e-9)[:, None]
+        keep = ~(contained >= ratio).any(axis=1)
+        detections[inner] = [det for det, kept in zip(inner_items, keep) if kept]
+    return detections
+
+
+def fuse_detections(detections, method='nms', iou_threshold=DEFAULT_IOU, containment=()):
+    """Постобработка детекций страницы {группа: [детекции]}"""
+    fused = {name: fuse_class(items, method, iou_threshold) for name, items in detections.items()}
+    return apply_containment(fused, containment)
@@ -0,0 +1,90 @@
+# import_profile.py - стоимость импорта модулей по пакетам (python -X importtime в чистом интерпретаторе)
+import argparse
+import json
+import re
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+APP_DIR = Path(__file__).parent.parent
+DEFAULT_MODULES = ('main', 'services.pipeline', 'services.detection_services')
+# Фреймворки за границей детекторов: импортируются только при загрузке моделей или первой странице
+HEAVY_PACKAGES = ('torch', 'torchvision', 'transformers', 'ultralytics', 'qrdet', 'cv2')
+# "import time:       812 |       4051 |   PIL.Image": собственное и накопленное время (мкс), отступ - вложенность
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)")
+
+
+def profile_import(module, cwd=APP_DIR):
+    """Импорт module в отдельном процессе: полное время (с запуском интерпретатора), сумма времени
+    импортов и собственное время по пакетам верхнего уровня в мс"""
+    start_time = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=cwd, capture_output=True, text=True
+    )
+    wall_time = time.perf_counter() - start_time
+
+    packages = {}
+    direct = {}
+    for line in process.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = int(match[1]), int(match[2]), match[3], match[4]
+        package = name.split('.')[0]
+        packages[package] = packages.get(package, 0) + self_us
+        if len(indent) == 1:
+            direct[name] = cumulative_us
+
+    errors = [line for line in process.stderr.splitlines() if not line.startswith('import time:')]
+    return {
+        "module": module,
+        "ok": process.returncode == 0,
+        "error": errors[-1] if process.returncode and errors else None,
+        "wall_s": round(wall_time, 3),
+        "import_s": round(sum(packages.values()) / 1e6, 3),
+        "packages_ms": {
+            name: round(us / 1000, 1) for name, us in sorted(packages.items(), key=lambda item: -item[1])
+        },
+        "direct_ms": {
+            name: round(us / 1000, 1) for name, us in sorted(direct.items(), key=lambda item: -item[1])
+        },
+        "heavy": [name for name in HEAVY_PACKAGES if name in packages]
+    }
+
+
+def print_profile(profile, top=10):
+    status = "✅" if profile["ok"] else "❌"
+    print(f"{status} {profile['module']}: {profile['wall_s']:.2f} с с запуском интерпретатора, "
+          f"импорты {profile['import_s']:.2f} с")
+    if profile["error"]:
+        print(f"   {profile['error']}")
+    for name, value in list(profile["packages_ms"].items())[:top]:
+        print(f"   {value:9.1f} мс  {name}")
+    if profile["heavy"]:
+        print(f"   ⚠️ Импортированы тяжелые фреймворки: {', '.join(profile['heavy'])}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Время импорта модулей по пакетам")
+    parser.add_argument("modules", nargs='*', default=list(DEFAULT_MODULES), help="модули для импорта")
+    parser.add_argument("--top", type=int, default=10, help="сколько самых дорогих пакетов показать")
+    parser.add_argument("--check", action="store_true",
+                        help="код возврата 1, если модуль тянет torch/transformers/ultralytics/qrdet")
+    parser.add_argument("--output", help="куда записать JSON-отчет")
+    args = parser.parse_args(argv)
+
+    profiles = [profile_import(module) for module in args.modules]
+    for profile in profiles:
+        print_profile(profile, args.top)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(profiles, f, ensure_ascii=False, indent=2)
+    if args.check and any(profile["heavy"] for profile in profiles):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+# loadtest.py - нагрузочный генератор для /api/detect/all
+import argparse
+import json
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from services.benchmark import PDFS_DIR, describe
+
+
+def build_multipart(path, field_name="file"):
+    """Тело multipart/form-data с одним файлом (собирается один раз на весь прогон)"""
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{field_name}"; filename="{path.name}"\r\n'
+        f"Content-Type: application/octet-stream\r\n\r\n"
+    ).encode('utf-8') + path.read_bytes() + f"\r\n--{boundary}--\r\n".encode('utf-8')
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def parse_server_timing(header):
+    """ "render;dur=12.3, save;dur=4" -> {"render": 12.3, "save": 4.0}"""
+    timings = {}
+    for item in filter(None, (part.strip() for part in (header or "").split(','))):
+        name, _, params = item.partition(';')
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == "dur":
+                timings[name.strip()] = float(value)
+    return timings
+
+
+def send_request(url, body, content_type, timeout):
+    request = urllib.request.Request(url, data=body, method="POST", headers={"Content-Type": content_type})
+    start_time = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        payload = response.read()
+        server_timing = response.headers.get("Server-Timing")
+    latency = (time.perf_counter() - start_time) * 1000
+    return latency, len(payload), parse_server_timing(server_timing)
+
+
+def run_load(url, body, content_type, concurrency, requests=None, duration=None, timeout=300):
+    """Гоняет запросы с заданной параллельностью до числа запросов или истечения времени"""
+    lock = threading.Lock()
+    state = {"issued": 0}
+    latencies = []
+    server_timings = {}
+    errors = []
+    response_bytes = []
+    deadline = time.perf_counter() + duration if duration else None
+
+    def next_request():
+        with lock:
+            if requests is not None and state["issued"] >= requests:
+                return False
+            if deadline is not None and time.perf_counter() >= deadline:
+                return False
+            state["issued"] += 1
+            return True
+
+    def worker():
+        while next_request():
+            try:
+                latency, size, timings = send_request(url, body, content_type, timeout)
+            except (urllib.error.URLError, OSError) as e:
+                with lock:
+                    errors.append(str(e))
+                continue
+            with lock:
+                latencies.append(latency)
+                response_bytes.append(size)
+                for stage, value in timings.items():
+                    server_timings.setdefault(stage, []).append(value)
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(concurrency):
+            executor.submit(worker)
+    wall_time = time.perf_counter() - start_time
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "wall_time_s": round(wall_time, 3),
+        "requests_per_second": round(len(latencies) / wall_time, 3) if wall_time else 0.0,
+        "latency_ms": describe(latencies),
+        "response_bytes_mean": round(sum(response_bytes) / len(response_bytes)) if response_bytes else 0,
+        "server_timing_ms": {stage: describe(values) for stage, values in server_timings.items()}
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный тест API StampNSign")
+    parser.add_argument("--url", default="http://localhost:8000/api/detect/all", help="адрес эндпоинта")
+    parser.add_argument("--file", help="файл для отправки (по умолчанию первый PDF корпуса)")
+    parser.add_argument("--concurrency", type=int, nargs='+', default=[1, 4, 8],
+                        help="уровни параллельности, прогон на каждом")
+    parser.add_argument("--requests", type=int, help="запросов на уровень")
+    parser.add_argument("--duration", type=float, default=30.0, help="секунд на уровень, если не задано --requests")
+    parser.add_argument("--output", help="куда записать JSON-отчет")
+    args = parser.parse_args(argv)
+
+    path = Path(args.file) if args.file else sorted(PDFS_DIR.glob("*.pdf"))[0]
+    body, content_type = build_multipart(path)
+    print(f"🚀 Нагрузка на {args.url} файлом {path.name} ({len(body) / 1024:.0f} КБ)")
+
+    results = []
+    for concurrency in args.concurrency:
+        result = run_load(
+            args.url, body, content_type, concurrency,
+            requests=args.requests, duration=None if args.requests else args.duration
+        )
+        results.append(result)
+        latency = result["latency_ms"]
+        print(f"   👥 {concurrency}: {result['requests_per_second']} запр/с, "
+              f"p50/p95/p99 {latency['p50']}/{latency['p95']}/{latency['p99']} мс, ошибок {result['errors']}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({"url": args.url, "file": str(path), "levels": results}, f, ensure_ascii=False, indent=2)
+        print(f"💾 Отчет сохранен в: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
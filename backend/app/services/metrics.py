@@ -0,0 +1,165 @@
+# metrics.py - метрики Prometheus и заголовок Server-Timing
+import os
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+
+def prepare_multiprocess_dir():
+    """Каталог метрик для prefork (STAMPNSIGN_WORKERS > 1): каждый воркер пишет свои значения в файлы,
+    /metrics любого воркера суммирует их. Должен быть задан до импорта prometheus_client
+    (тип хранения значений выбирается при импорте), поэтому вызывается при импорте модуля в родителе.
+    """
+    if int(os.getenv("STAMPNSIGN_WORKERS", "1")) <= 1:
+        return os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    directory = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if directory:
+        # Файлы прошлого запуска с чужими pid исказили бы счетчики
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        for path in Path(directory).glob("*.db"):
+            path.unlink()
+    else:
+        directory = tempfile.mkdtemp(prefix="stampnsign_prometheus_")
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = directory
+    return directory
+
+
+MULTIPROCESS_DIR = prepare_multiprocess_dir()
+
+try:
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+    )
+    HAS_PROMETHEUS = True
+except ImportError:
+    CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+    HAS_PROMETHEUS = False
+
+# Границы гистограмм в секундах: от быстрых этапов (отрисовка) до тяжелых страниц
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+if HAS_PROMETHEUS:
+    STAGE_SECONDS = Histogram(
+        "stampnsign_stage_seconds", "Длительность этапа обработки страницы", ["stage"], buckets=STAGE_BUCKETS
+    )
+    REQUEST_SECONDS = Histogram(
+        "stampnsign_request_seconds", "Длительность запроса детекции", ["endpoint"], buckets=STAGE_BUCKETS
+    )
+    PAGES_PROCESSED = Counter("stampnsign_pages_processed_total", "Обработано страниц")
+    PAGES_SKIPPED = Counter("stampnsign_pages_skipped_total", "Страницы без обработки", ["reason"])
+    DOCUMENTS_PROCESSED = Counter("stampnsign_documents_processed_total", "Обработано документов", ["status"])
+    # multiprocess_mode: как сводить значения воркеров; без каталога метрик не используется
+    QUEUE_DEPTH = Gauge(
+        "stampnsign_queue_depth", "Запросы детекции в работе или в ожидании", multiprocess_mode="livesum"
+    )
+    CACHE_REQUESTS = Counter("stampnsign_cache_requests_total", "Обращения к кешам", ["cache", "result"])
+    MODEL_LOAD_SECONDS = Gauge(
+        "stampnsign_model_load_seconds", "Время загрузки моделей при старте", multiprocess_mode="max"
+    )
+    DOCUMENT_MEMORY_BYTES = Histogram(
+        "stampnsign_document_memory_bytes", "Оценка памяти документа и пиковый RSS процесса при его обработке", ["kind"],
+        buckets=tuple(mb * 1024 * 1024 for mb in (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384))
+    )
+    ADMISSION_REJECTED = Counter("stampnsign_admission_rejected_total", "Отказы в допуске по памяти", ["reason"])
+    DETECTOR_TIMEOUTS = Counter(
+        "stampnsign_detector_timeouts_total", "Детекторы, не уложившиеся в бюджет времени страницы", ["detector"]
+    )
+
+
+def observe_page(page):
+    """Учитывает страницу ответа: тайминги (мс по этапам) в гистограммах и детекторы с истекшим лимитом.
+
+    Страница, пропущенная после общего срока (skipped), не обрабатывалась: она идет только
+    в stampnsign_pages_skipped_total{reason="deadline"}.
+    """
+    if not HAS_PROMETHEUS:
+        return
+    if page.get("skipped"):
+        PAGES_SKIPPED.labels("deadline").inc()
+        return
+    PAGES_PROCESSED.inc()
+    observe_timeouts(page.get("timed_out", ()))
+    for stage, value in page["timings"].items():
+        STAGE_SECONDS.labels(stage).observe(value / 1000)
+
+
+def observe_document(success):
+    if HAS_PROMETHEUS:
+        DOCUMENTS_PROCESSED.labels("success" if success else "error").inc()
+
+
+def observe_memory(memory):
+    """Оценка памяти документа и пиковый RSS процесса за время его обработки (admission.track_memory, МБ)"""
+    if not HAS_PROMETHEUS:
+        return
+    for kind, key in (("estimated", "estimated_mb"), ("process_peak_rss", "process_peak_rss_mb")):
+        if key in memory:
+            DOCUMENT_MEMORY_BYTES.labels(kind).observe(memory[key] * 1024 * 1024)
+
+
+def observe_timeouts(detectors):
+    if HAS_PROMETHEUS:
+        for name in detectors:
+            DETECTOR_TIMEOUTS.labels(name).inc()
+
+
+def observe_rejection(status_code):
+    if HAS_PROMETHEUS:
+        ADMISSION_REJECTED.labels("too_large" if status_code == 413 else "queue_timeout").inc()
+
+
+def observe_request(endpoint, seconds):
+    if HAS_PROMETHEUS:
+        REQUEST_SECONDS.labels(endpoint).observe(seconds)
+
+
+def record_cache(cache, hit):
+    """Попадание/промах кеша; доля попаданий считается в PromQL"""
+    if HAS_PROMETHEUS:
+        CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def set_model_load_time(seconds):
+    if HAS_PROMETHEUS:
+        MODEL_LOAD_SECONDS.set(seconds)
+
+
+@contextmanager
+def track_queue():
+    """Запрос учитывается в queue_depth, пока не завершится"""
+    if HAS_PROMETHEUS:
+        QUEUE_DEPTH.inc()
+    try:
+        yield
+    finally:
+        if HAS_PROMETHEUS:
+            QUEUE_DEPTH.dec()
+
+
+def render_latest():
+    """Текст метрик в формате экспозиции Prometheus; в prefork - сумма по всем воркерам"""
+    if not MULTIPROCESS_DIR:
+        return generate_latest()
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry)
+
+
+def mark_process_dead(pid):
+    """Убирает gauge-значения завершившегося воркера (livesum), счетчики его остаются в сумме"""
+    if HAS_PROMETHEUS and MULTIPROCESS_DIR:
+        multiprocess.mark_process_dead(pid)
+
+
+def total_timings(pages):
+    """Суммарные тайминги этапов по всем страницам документа (мс)"""
+    totals = {}
+    for page in pages:
+        for stage, value in page.get("timings", {}).items():
+            totals[stage] = totals.get(stage, 0.0) + value
+    return totals
+
+
+def server_timing_header(timings):
+    """Значение заголовка Server-Timing: "render;dur=12.3, signatures;dur=45.6" """
+    return ", ".join(f"{stage};dur={value:.1f}" for stage, value in timings.items())
@@ -0,0 +1,665 @@
+# pipeline.py - общий конвейер обработки документов
+import io
+import time
+import uuid
+import zipfile
+from dataclasses import dataclass, field, replace
+from datetime import datetime
+from functools import partial
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import fitz
+
+from enums import DETECTORS
+from services.admission import AdmissionError, track_memory
+from services.annotations import ANNOTATION_MODES, save_page_artifact, write_annotated_pdf
+from services.deadlines import Deadline, DetectorTimeout, parse_budget_ms
+from services.fusion import DEFAULT_IOU, fuse_detections, parse_containment, parse_fusion
+from services.qr_decoding import decode_payloads
+from services.qr_screen import SCREEN_MODES, detect_in_regions, screen_page
+from services.registry import TIERS
+from services.render_cache import (
+    count_image_pages, image_page_sizes, is_pdf, iter_image_pages, render_pdf_page, shared_cache
+)
+from services.signature_roi import SIGNATURE_MODES, detect_in_regions_batched, signature_regions
+
+PDF_ZOOM = 2
+# Минимальная уверенность, с которой элемент считается найденным в режиме проверки наличия
+PRESENCE_CONFIDENCE = 0.5
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.tif', '.tiff')
+SUPPORTED_EXTENSIONS = ('.pdf',) + IMAGE_EXTENSIONS
+# Ссылки на артефакты страницы в зависимости от режима annotate
+PAGE_ARTIFACTS = ('result_image_url', 'overlay_url')
+# Размеры исходного изображения, если страница декодирована уменьшенной (см. original_geometry)
+PAGE_GEOMETRY = ('original_size', 'scale')
+
+
+@dataclass
+class PipelineOptions:
+    """Настройки обработки одного запроса"""
+    detectors: Tuple[str, ...] = DETECTORS
+    thresholds: Dict[str, float] = field(default_factory=dict)
+    zoom: float = PDF_ZOOM
+    # Постобработка: none / nms / wbf внутри класса и правила вложенности (inner, outer, доля площади)
+    fusion: str = 'nms'
+    fusion_iou: float = DEFAULT_IOU
+    containment: Tuple[Tuple[str, str, float], ...] = ()
+    # Чтение содержимого QR-кодов по найденным вырезкам
+    decode_qr: bool = True
+    # Предварительный поиск поисковых узоров QR: off / conservative / regions. Только по запросу:
+    # это эвристика, полнота проверена лишь на разметке (python services/qr_screen.py)
+    qr_screen: str = 'off'
+    # Подписи: full - вся страница, roi - только вырезки у штампов и блоков чернил
+    signature_mode: str = 'full'
+    # Уровень моделей из реестра (fast / balanced / accurate); None - уровень сервера по умолчанию
+    tier: Optional[str] = None
+    # Артефакт с рамками: raster (JPEG страниц), pdf (копия документа с векторными аннотациями),
+    # svg (оверлей на страницу) или none
+    annotate: str = 'raster'
+    # Бюджеты времени в мс: на весь документ и на один детектор на странице; None - без ограничения.
+    # Не уложившиеся детекторы попадают в timed_out страницы, остальные результаты возвращаются
+    deadline_ms: Optional[float] = None
+    detector_timeout_ms: Optional[float] = None
+    # Брать страницы из общего кеша рендеров и сохранять туда новые. Только по явному запросу:
+    # разовый проход (API, batch, бенчмарк) страницы повторно не читает, а запись ~24 МБ на A4 дорогая
+    render_cache: bool = False
+
+
+def parse_detectors(value):
+    """Разбирает параметр detectors=signatures,qr_codes (допускается qr-codes)"""
+    if not value:
+        return DETECTORS
+    names = []
+    for name in value.split(','):
+        name = name.strip().replace('-', '_')
+        if not name:
+            continue
+        if name not in DETECTORS:
+            raise ValueError(f"Unknown detector '{name}', expected one of: {', '.join(DETECTORS)}")
+        if name not in names:
+            names.append(name)
+    if not names:
+        raise ValueError("At least one detector must be selected")
+    # Порядок запуска всегда канонический
+    return tuple(name for name in DETECTORS if name in names)
+
+
+def parse_thresholds(value, detectors=DETECTORS):
+    """Разбирает thresholds=0.5 (для всех) или thresholds=signatures:0.6,stamps:0.4"""
+    if not value:
+        return {}
+    thresholds = {}
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, number = item.rpartition(':')
+        try:
+            threshold = float(number)
+        except ValueError:
+            raise ValueError(f"Invalid threshold '{item}'")
+        if not 0.0 <= threshold <= 1.0:
+            raise ValueError(f"Threshold must be between 0 and 1: '{item}'")
+        if not name:
+            thresholds.update({detector: threshold for detector in detectors})
+            continue
+        name = name.strip().replace('-', '_')
+        if name not in DETECTORS:
+            raise ValueError(f"Unknown detector '{name}', expected one of: {', '.join(DETECTORS)}")
+        thresholds[name] = threshold
+    return thresholds
+
+
+def make_options(detectors=None, thresholds=None, fusion=None, containment=None, qr_screen=None,
+                 signature_mode=None, tier=None, annotate=None, deadline_ms=None, detector_timeout_ms=None):
+    """PipelineOptions из параметров запроса; ValueError при некорректных значениях"""
+    selected = parse_detectors(detectors)
+    method, iou_threshold = parse_fusion(fusion)
+    qr_screen = qr_screen or PipelineOptions.qr_screen
+    if qr_screen not in SCREEN_MODES:
+        raise ValueError(f"Unknown QR screen mode '{qr_screen}', expected one of: {', '.join(SCREEN_MODES)}")
+    signature_mode = signature_mode or PipelineOptions.signature_mode
+    if signature_mode not in SIGNATURE_MODES:
+        raise ValueError(
+            f"Unknown signature mode '{signature_mode}', expected one of: {', '.join(SIGNATURE_MODES)}"
+        )
+    if tier is not None and tier not in TIERS:
+        raise ValueError(f"Unknown tier '{tier}', expected one of: {', '.join(TIERS)}")
+    annotate = annotate or PipelineOptions.annotate
+    if annotate not in ANNOTATION_MODES:
+        raise ValueError(
+            f"Unknown annotation mode '{annotate}', expected one of: {', '.join(ANNOTATION_MODES)}"
+        )
+    return PipelineOptions(
+        detectors=selected,
+        thresholds=parse_thresholds(thresholds, selected),
+        fusion=method,
+        fusion_iou=iou_threshold,
+        containment=parse_containment(containment),
+        qr_screen=qr_screen,
+        signature_mode=signature_mode,
+        tier=tier,
+        annotate=annotate,
+        deadline_ms=parse_budget_ms(deadline_ms, 'deadline_ms'),
+        detector_timeout_ms=parse_budget_ms(detector_timeout_ms, 'detector_timeout_ms')
+    )
+
+
+def add_pipeline_arguments(parser, annotate=None):
+    """Параметры пайплайна для CLI-инструментов - те же, что query-параметры API.
+
+    annotate - значение --annotate по умолчанию (None - как в PipelineOptions).
+    """
+    parser.add_argument("--detectors", help="например: signatures,qr_codes")
+    parser.add_argument("--thresholds", help="например: 0.5 или stamps:0.4")
+    parser.add_argument("--fusion", help="постобработка: none, nms, wbf:0.6")
+    parser.add_argument("--containment", help="например: signatures@stamps:0.8")
+    parser.add_argument("--qr-screen", help="скрининг QR перед qrdet: off, conservative, regions")
+    parser.add_argument("--signature-mode", help="подписи: full или roi")
+    parser.add_argument("--tier", help="уровень моделей из реестра: fast, balanced, accurate")
+    parser.add_argument("--annotate", default=annotate, help="артефакт с рамками: raster, pdf, svg, none")
+    parser.add_argument("--deadline-ms", help="бюджет времени одного документа в мс")
+    parser.add_argument("--detector-timeout-ms", help="лимит одного детектора на странице в мс")
+    parser.add_argument("--render-cache", action="store_true",
+                        help="брать страницы из кеша рендеров и сохранять новые (для повторных прогонов)")
+
+
+def options_from_args(args):
+    """PipelineOptions из аргументов add_pipeline_arguments; ValueError при некорректных значениях"""
+    options = make_options(
+        args.detectors, args.thresholds, args.fusion, args.containment, args.qr_screen, args.signature_mode,
+        args.tier, args.annotate, args.deadline_ms, args.detector_timeout_ms
+    )
+    return replace(options, render_cache=args.render_cache)
+
+
+def parse_required(value):
+    """Разбирает require=stamps,signatures или require=stamps:0.7,signatures - что должно найтись"""
+    required = {}
+    for item in (value or "").split(','):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, number = item.partition(':')
+        name = name.strip().replace('-', '_')
+        if name not in DETECTORS:
+            raise ValueError(f"Unknown detector '{name}', expected one of: {', '.join(DETECTORS)}")
+        try:
+            confidence = float(number) if number else PRESENCE_CONFIDENCE
+        except ValueError:
+            raise ValueError(f"Invalid confidence '{item}'")
+        if not 0.0 <= confidence <= 1.0:
+            raise ValueError(f"Confidence must be between 0 and 1: '{item}'")
+        required[name] = confidence
+    if not required:
+        raise ValueError("At least one required element must be given")
+    return {name: required[name] for name in DETECTORS if name in required}
+
+
+def serialize_detections(detections):
+    """Сериализует детекции в JSON-совместимый формат"""
+    return [{
+        'label': str(det['label']),
+        'bbox': [float(coord) for coord in det['bbox']],
+        'confidence': float(det['confidence'])
+    } for det in detections]
+
+
+def iter_pdf_pages(pdf_bytes, zoom=PDF_ZOOM, page_indices=None, use_cache=False):
+    """Рендерит страницы PDF по одной, не держа весь документ в памяти.
+
+    page_indices - номера страниц (с нуля) в нужном порядке, по умолчанию все.
+    С use_cache страницы берутся из общего кеша рендеров (если он не выключен STAMPNSIGN_RENDER_CACHE=off).
+    """
+    cache = shared_cache() if use_cache else None
+    if cache is not None:
+        yield from cache.iter_pages("document.pdf", pdf_bytes, zoom, page_indices)
+        return
+
+    pdf_document = fitz.open(stream=pdf_bytes, filetype="pdf")
+    try:
+        if page_indices is None:
+            page_indices = range(pdf_document.page_count)
+        for index in page_indices:
+            yield render_pdf_page(pdf_document, index, zoom)
+    finally:
+        pdf_document.close()
+
+
+def pdf_to_images(pdf_bytes, zoom=PDF_ZOOM):
+    """Конвертирует PDF в список изображений"""
+    return list(iter_pdf_pages(pdf_bytes, zoom))
+
+
+def iter_document_images(filename, content, zoom=PDF_ZOOM, page_indices=None, use_cache=False):
+    """Отдает страницы документа (PDF или изображение, кадры TIFF - отдельные страницы) по одной"""
+    if is_pdf(filename):
+        yield from iter_pdf_pages(content, zoom, page_indices, use_cache)
+        return
+    cache = shared_cache() if use_cache else None
+    if cache is not None:
+        yield from cache.iter_pages(filename, content, zoom, page_indices)
+    else:
+        yield from iter_image_pages(content, zoom, page_indices)
+
+
+def document_type(filename, total_pages):
+    """file_type ответа: pdf, image или multipage_image (многостраничный TIFF)"""
+    if is_pdf(filename):
+        return "pdf"
+    return "image" if total_pages == 1 else "multipage_image"
+
+
+def original_geometry(image, original_size):
+    """original_size страницы-изображения и scale: bbox * scale - координаты в пикселях исходного файла"""
+    return {"original_size": list(original_size), "scale": round(max(original_size) / max(image.size), 6)}
+
+
+def make_result_prefix():
+    """Уникальный префикс файлов результата для одного документа"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return f"result_{timestamp}_{uuid.uuid4().hex[:8]}"
+
+
+def count_detections(detections):
+    return {name: len(items) for name, items in detections.items()}
+
+
+def count_pages(filename, content):
+    """Число страниц документа без рендеринга"""
+    if not is_pdf(filename):
+        return count_image_pages(content)
+    with fitz.open(stream=content, filetype="pdf") as pdf_document:
+        return pdf_document.page_count
+
+
+def elapsed_ms(start_time):
+    return round((time.perf_counter() - start_time) * 1000, 2)
+
+
+def run_in_regions(inspector, name, image, regions, threshold=None, tier=None):
+    """Детектор на всей странице (regions is None) или только на вырезках regions"""
+    if regions is None:
+        return inspector.run_detector(name, image, threshold, tier)
+    return detect_in_regions(
+        lambda crop, crop_threshold: inspector.run_detector(name, crop, crop_threshold, tier),
+        image, regions, threshold
+    )
+
+
+def run_detectors(inspector, image, options=None, known=None, deadline=None, timed_out=None):
+    """Сырые детекции выбранных детекторов (до слияния) и тайминги в мс.
+
+    known - уже найденные группы других детекторов страницы (штампы для roi-режима подписей).
+    deadline - бюджет времени документа (по умолчанию новый из options, только на эту страницу);
+    не уложившиеся в него детекторы дают пустой список и дописываются в timed_out.
+    """
+    options = options or PipelineOptions()
+    deadline = deadline or Deadline.from_options(options)
+    detections = dict(known or {})
+    timings = {}
+    order = options.detectors
+    if options.signature_mode == 'roi':
+        # Штампы нужны для выбора областей подписей, поэтому подписи идут последними
+        order = tuple(name for name in order if name != 'signatures') + tuple(
+            name for name in order if name == 'signatures'
+        )
+
+    for name in order:
+        threshold = options.thresholds.get(name)
+        start_time = time.perf_counter()
+        if name == 'qr_codes' and options.qr_screen != 'off':
+            # qrdet только там, где скрининг нашел поисковые узоры QR
+            regions = screen_page(image, options.qr_screen)
+            timings["qr_screen"] = elapsed_ms(start_time)
+            start_time = time.perf_counter()
+            detect = partial(run_in_regions, inspector, name, image, regions, threshold, options.tier)
+        elif name == 'signatures' and options.signature_mode == 'roi':
+            regions = signature_regions(image, [det['bbox'] for det in detections.get('stamps', [])])
+            timings["signature_roi"] = elapsed_ms(start_time)
+            start_time = time.perf_counter()
+            if regions is None:
+                detect = partial(inspector.run_detector, name, image, threshold, options.tier)
+            else:
+                detect = partial(detect_in_regions_batched, inspector, name, image, regions, threshold, options.tier)
+        else:
+            detect = partial(inspector.run_detector, name, image, threshold, options.tier)
+        try:
+            found = deadline.run(detect)
+        except DetectorTimeout:
+            found = []
+            if timed_out is not None:
+                timed_out.append(name)
+        detections[name] = serialize_detections(found)
+        timings[name] = elapsed_ms(start_time)
+    return {name: detections[name] for name in options.detectors}, timings
+
+
+def postprocess_page(image, detections, options, timings):
+    """Слияние боксов и чтение QR-кодов; тайминги дописываются в timings"""
+    start_time = time.perf_counter()
+    detections = fuse_detections(detections, options.fusion, options.fusion_iou, options.containment)
+    timings["fusion"] = elapsed_ms(start_time)
+
+    if options.decode_qr and detections.get('qr_codes'):
+        start_time = time.perf_counter()
+        decode_payloads(image, detections['qr_codes'])
+        timings["qr_decode"] = elapsed_ms(start_time)
+    return detections
+
+
+def detect_page(inspector, image, options=None, deadline=None, timed_out=None):
+    """Запускает выбранные детекторы на странице; возвращает детекции и тайминги в мс.
+
+    Не уложившиеся в deadline детекторы дописываются в timed_out (см. run_detectors).
+    """
+    options = options or PipelineOptions()
+    detections, timings = run_detectors(inspector, image, options, deadline=deadline, timed_out=timed_out)
+    return postprocess_page(image, detections, options, timings), timings
+
+
+def iter_page_events(inspector, filename, content, output_dir, options=None):
+    """Этапы обработки каждой страницы: rendered, detected, persisted (с таймингами в мс).
+
+    В режиме annotate=pdf после всех страниц идет событие annotated с копией документа.
+    Если истек options.deadline_ms, оставшиеся страницы не рендерятся: для каждой сразу идет
+    persisted без детекций, со skipped и всеми детекторами в timed_out.
+    Изображения декодируются уменьшенными, поэтому их страницы дополнительно несут original_size и scale.
+    """
+    options = options or PipelineOptions()
+    deadline = Deadline.from_options(options)
+    prefix = make_result_prefix()
+    original_sizes = None if is_pdf(filename) else image_page_sizes(content)
+    images = iter_document_images(filename, content, options.zoom, use_cache=options.render_cache)
+    annotated_pages = []
+    page_number = 0
+
+    while True:
+        if deadline.expired():
+            if hasattr(images, 'close'):
+                images.close()
+            for page_number in range(page_number + 1, count_pages(filename, content) + 1):
+                detections = {name: [] for name in options.detectors}
+                yield {"event": "persisted", "page": page_number, "detections": detections,
+                       "counts": count_detections(detections), "timings": {},
+                       "timed_out": list(options.detectors), "skipped": True}
+            break
+        start_time = time.perf_counter()
+        image = next(images, None)
+        if image is None:
+            break
+        page_number += 1
+        timings = {"render": elapsed_ms(start_time)}
+        yield {"event": "rendered", "page": page_number, "size": list(image.size), "timings": dict(timings)}
+
+        timed_out = []
+        detections, detector_timings = detect_page(inspector, image, options, deadline, timed_out)
+        timings.update(detector_timings)
+        yield {"event": "detected", "page": page_number, "detections": detections,
+               "counts": count_detections(detections), "timings": dict(timings), "timed_out": timed_out}
+
+        page = {
+            "event": "persisted",
+            "page": page_number,
+            "page_size": list(image.size),
+            "detections": detections,
+            "timed_out": timed_out
+        }
+        if original_sizes is not None:
+            page.update(original_geometry(image, original_sizes[page_number - 1]))
+        artifact = save_page_artifact(
+            inspector, options.annotate, image, detections, output_dir, f"{prefix}_page_{page_number}", timings
+        )
+        if artifact is not None:
+            page[artifact[0]] = f"/uploads/{artifact[1]}"
+        if options.annotate == 'pdf':
+            annotated_pages.append((page_number, image.size, detections))
+
+        yield {**page, "counts": count_detections(detections), "timings": timings}
+
+    if options.annotate == 'pdf':
+        start_time = time.perf_counter()
+        output_filename = f"{prefix}_annotated.pdf"
+        write_annotated_pdf(filename, content, annotated_pages, Path(output_dir) / output_filename)
+        yield {"event": "annotated", "annotated_pdf_url": f"/uploads/{output_filename}",
+               "timings": {"annotate": elapsed_ms(start_time)}}
+
+
+def sum_counts(pages):
+    totals = {}
+    for page in pages:
+        for name, value in page["counts"].items():
+            totals[name] = totals.get(name, 0) + value
+    return totals
+
+
+def analyze_document(inspector, filename, content, output_dir, options=None):
+    """Полный ответ /api/detect/all для одного файла"""
+    pages = []
+    artifacts = {}
+    for event in iter_page_events(inspector, filename, content, output_dir, options):
+        if event["event"] == "persisted":
+            page = dict(event)
+            del page["event"]
+            pages.append(page)
+        elif event["event"] == "annotated":
+            artifacts["annotated_pdf_url"] = event["annotated_pdf_url"]
+
+    if is_pdf(filename) or len(pages) > 1:
+        return {
+            "success": True,
+            "file_type": document_type(filename, len(pages)),
+            "total_pages": len(pages),
+            "pages": pages,
+            "total_counts": sum_counts(pages),
+            "partial": any(page["timed_out"] for page in pages),
+            **artifacts
+        }
+
+    page = pages[0]
+    return {
+        "success": True,
+        "file_type": "image",
+        "detections": page["detections"],
+        **{key: page[key] for key in PAGE_ARTIFACTS if key in page},
+        "page_size": page.get("page_size"),
+        **{key: page[key] for key in PAGE_GEOMETRY if key in page},
+        "counts": page["counts"],
+        "timings": page["timings"],
+        "timed_out": page["timed_out"],
+        "partial": bool(page["timed_out"]),
+        **artifacts
+    }
+
+
+def priority_page_order(total_pages):
+    """Порядок просмотра для проверки наличия: последняя страница, первая, затем остальные.
+
+    Подписи и штампы чаще всего стоят на последней странице, реквизиты - на первой.
+    """
+    if total_pages <= 2:
+        return list(range(total_pages))[::-1]
+    return [total_pages - 1, 0] + list(range(1, total_pages - 1))
+
+
+def verify_document(inspector, filename, content, required, options=None):
+    """Проверка наличия элементов с ранним выходом.
+
+    required - {детектор: минимальная уверенность}. Страницы идут в порядке priority_page_order,
+    на каждой запускаются только детекторы еще не найденных элементов; как только найдено все,
+    остальные страницы не рендерятся. По истечении options.deadline_ms проверка тоже останавливается,
+    а ответ помечается partial.
+    """
+    options = options or PipelineOptions()
+    deadline = Deadline.from_options(options)
+    total_pages = count_pages(filename, content)
+    original_sizes = None if is_pdf(filename) else image_page_sizes(content)
+    order = priority_page_order(total_pages)
+    images = iter_document_images(filename, content, options.zoom, order, options.render_cache)
+    found = {name: None for name in required}
+    pages = []
+    partial_result = False
+
+    try:
+        for page_index in order:
+            if deadline.expired():
+                partial_result = True
+                break
+            start_time = time.perf_counter()
+            image = next(images)
+            timings = {"render": elapsed_ms(start_time)}
+
+            missing = tuple(name for name in required if found[name] is None)
+            timed_out = []
+            detections, detector_timings = detect_page(
+                inspector, image, replace(options, detectors=missing), deadline, timed_out
+            )
+            timings.update(detector_timings)
+            partial_result = partial_result or bool(timed_out)
+            for name in missing:
+                best = max(detections[name], key=lambda det: det['confidence'], default=None)
+                if best is not None and best['confidence'] >= required[name]:
+                    found[name] = {"page": page_index + 1, **best}
+
+            page = {
+                "page": page_index + 1,
+                "page_size": list(image.size),
+                "detectors": list(missing),
+                "counts": count_detections(detections),
+                "timings": timings,
+                "timed_out": timed_out
+            }
+            if original_sizes is not None:
+                page.update(original_geometry(image, original_sizes[page_index]))
+            pages.append(page)
+            if all(found.values()):
+                break
+    finally:
+        # Закрывает PDF, если проверка остановилась раньше последней страницы
+        if hasattr(images, 'close'):
+            images.close()
+
+    return {
+        "success": True,
+        "file_type": document_type(filename, total_pages),
+        "verified": all(found.values()),
+        "total_pages": total_pages,
+        "pages_checked": len(pages),
+        # Не все нужные страницы или детекторы успели в срок: verified=false здесь не означает отсутствие
+        "partial": partial_result and not all(found.values()),
+        "found": found,
+        "pages": pages
+    }
+
+
+def iter_upload_documents(filename, content):
+    """Разворачивает загрузку в документы: ZIP-архив дает по документу на файл"""
+    if not filename.lower().endswith('.zip'):
+        yield filename, content
+        return
+
+    with zipfile.ZipFile(io.BytesIO(content)) as archive:
+        for info in archive.infolist():
+            if info.is_dir() or not info.filename.lower().endswith(SUPPORTED_EXTENSIONS):
+                continue
+            yield f"{filename}/{info.filename}", archive.read(info)
+
+
+def iter_document_events(inspector, name, content, output_dir, options=None, budget=None):
+    """События одного документа пакета: по строке на страницу и итог документа"""
+    options = options or PipelineOptions()
+    start_time = time.perf_counter()
+    pages = []
+    artifacts = {}
+    try:
+        with track_memory(budget, name, content, options.zoom) as memory:
+            for event in iter_page_events(inspector, name, content, output_dir, options):
+                if event["event"] == "persisted":
+                    page = dict(event)
+                    del page["event"]
+                    pages.append({"counts": page["counts"], "timed_out": page["timed_out"]})
+                    yield {"type": "page", "document": name, **page}
+                elif event["event"] == "annotated":
+                    artifacts["annotated_pdf_url"] = event["annotated_pdf_url"]
+    except AdmissionError as e:
+        yield {"type": "document", "document": name, "success": False, "error": str(e),
+               "status_code": e.status_code}
+        return
+    except Exception as e:
+        yield {"type": "document", "document": name, "success": False, "error": str(e)}
+        return
+
+    yield {
+        "type": "document",
+        "document": name,
+        "success": True,
+        "total_pages": len(pages),
+        "total_counts": sum_counts(pages),
+        "partial": any(page["timed_out"] for page in pages),
+        "processing_time": time.perf_counter() - start_time,
+        "memory": memory,
+        **artifacts
+    }
+
+
+def iter_batch_events(inspector, uploads, output_dir, options=None, budget=None):
+    """Пакетная обработка: события страниц и документов по мере готовности, в конце - сводка"""
+    start_time = time.perf_counter()
+    summary = {"documents": 0, "failed": 0, "total_pages": 0}
+
+    for filename, content in uploads:
+        try:
+            documents = iter_upload_documents(filename, content)
+            for name, document_content in documents:
+                for event in iter_document_events(inspector, name, document_content, output_dir, options, budget):
+                    if event["type"] == "document":
+                        summary["documents"] += 1
+                        if event["success"]:
+                            summary["total_pages"] += event["total_pages"]
+                        else:
+                            summary["failed"] += 1
+                    yield event
+        except Exception as e:
+            summary["documents"] += 1
+            summary["failed"] += 1
+            yield {"type": "document", "document": filename, "success": False, "error": str(e)}
+
+    summary["processing_time"] = time.perf_counter() - start_time
+    yield {"type": "summary", **summary}
+
+
+def iter_progress_events(inspector, filename, content, output_dir, options=None, budget=None):
+    """Поток прогресса одного документа: started, события страниц, done или error"""
+    options = options or PipelineOptions()
+    start_time = time.perf_counter()
+    try:
+        with track_memory(budget, filename, content, options.zoom) as memory:
+            total_pages = count_pages(filename, content)
+            yield {
+                "event": "started",
+                "file_type": document_type(filename, total_pages),
+                "total_pages": total_pages,
+                "memory": dict(memory)
+            }
+
+            pages = []
+            for event in iter_page_events(inspector, filename, content, output_dir, options):
+                if event["event"] == "persisted":
+                    pages.append({"counts": event["counts"], "timed_out": event["timed_out"]})
+                yield event
+    except AdmissionError as e:
+        yield {"event": "error", "error": str(e), "status_code": e.status_code}
+        return
+    except Exception as e:
+        yield {"event": "error", "error": str(e)}
+        return
+
+    yield {
+        "event": "done",
+        "total_pages": len(pages),
+        "total_counts": sum_counts(pages),
+        "partial": any(page["timed_out"] for page in pages),
+        "processing_time": time.perf_counter() - start_time,
+        "memory": memory
+    }
@@ -0,0 +1,201 @@
+# prefork.py - модели загружаются один раз в родительском процессе, воркеры делят их через fork (copy-on-write)
+import gc
+import os
+import signal
+import socket
+import time
+
+import uvicorn
+from PIL import Image
+
+from services import metrics
+from services.cpu_tuning import tune_worker
+
+# Пустая страница для прогрева: ленивые инициализации моделей (слияние Conv+BN в YOLO,
+# загрузка процессора YOLOS) должны случиться до fork, иначе каждый воркер получит свою копию
+WARMUP_SIZE = (640, 640)
+MEMORY_REPORT_DELAY_S = 30
+
+
+def process_memory(pid="self"):
+    """RSS, PSS, USS (уникальная память) и разделяемая память процесса в МБ; None вне Linux"""
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 3 and parts[0].endswith(':'):
+                    fields[parts[0][:-1]] = int(parts[1])
+    except (OSError, ValueError):
+        return None
+    to_mb = lambda *names: round(sum(fields.get(name, 0) for name in names) / 1024, 1)
+    return {
+        "rss_mb": to_mb("Rss"),
+        "pss_mb": to_mb("Pss"),
+        "uss_mb": to_mb("Private_Clean", "Private_Dirty"),
+        "shared_mb": to_mb("Shared_Clean", "Shared_Dirty")
+    }
+
+
+def iter_torch_modules(inspector, depth=3):
+    """torch.nn.Module внутри моделей инспектора (обертки transformers, qrdet, ultralytics)"""
+    try:
+        import torch
+    except ImportError:
+        return
+    seen = set()
+    stack = [(model, 0) for _, model in getattr(inspector, 'models', {}).values()]
+    while stack:
+        item, level = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        if isinstance(item, torch.nn.Module):
+            yield item
+            continue
+        if level < depth and hasattr(item, '__dict__'):
+            stack.extend((value, level + 1) for value in vars(item).values() if hasattr(value, '__dict__'))
+
+
+def share_models(inspector):
+    """Переносит веса в разделяемую память: даже запись в тензор не размножит их по воркерам"""
+    modules = list(iter_torch_modules(inspector))
+    for module in modules:
+        module.eval()
+        module.share_memory()
+    return len(modules)
+
+
+def warm_up(inspector):
+    """Один прогон каждого детектора на пустой странице в родителе.
+
+    Пулы потоков torch/OpenMP после fork в потомке непригодны, поэтому прогрев идет в один поток.
+    """
+    try:
+        import torch
+        threads = torch.get_num_threads()
+        torch.set_num_threads(1)
+    except ImportError:
+        torch = None
+    image = Image.new('RGB', WARMUP_SIZE, 'white')
+    try:
+        for name in inspector.detectors:
+            for tier in inspector.tiers:
+                inspector.run_detector(name, image, tier=tier)
+    finally:
+        if torch is not None:
+            torch.set_num_threads(threads)
+
+
+def memory_report(workers):
+    """Память родителя и каждого воркера; уникальная память воркера - то, что стоит еще один воркер"""
+    report = {"parent": process_memory()}
+    report["workers"] = {pid: process_memory(pid) for pid in workers}
+    unique = [memory["uss_mb"] for memory in report["workers"].values() if memory]
+    report["worker_uss_mb"] = round(sum(unique) / len(unique), 1) if unique else None
+    return report
+
+
+def print_memory_report(workers):
+    report = memory_report(workers)
+    if report["parent"] is None:
+        print("⚠️ Отчет о памяти доступен только в Linux (/proc/<pid>/smaps_rollup)")
+        return
+    print(f"📊 Родитель: RSS {report['parent']['rss_mb']} МБ")
+    for pid, memory in report["workers"].items():
+        if memory:
+            print(f"  воркер {pid}: RSS {memory['rss_mb']} МБ, PSS {memory['pss_mb']} МБ, "
+                  f"уникальная {memory['uss_mb']} МБ, общая {memory['shared_mb']} МБ")
+
+
+def bind_socket(host, port):
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, sock, host, port, worker_index, workers):
+    """Тело воркера после fork: своя доля ядер и свой цикл событий uvicorn на общем сокете"""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGALRM, signal.SIG_DFL)
+    layout = tune_worker(worker_index, workers)
+    if layout:
+        print(f"⚙️ Воркер {os.getpid()}: {layout}")
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=port))
+    server.run(sockets=[sock])
+
+
+def serve(app, preload, host="0.0.0.0", port=8000, workers=2, report_after=MEMORY_REPORT_DELAY_S):
+    """Preload-then-fork: preload() загружает модели в родителе и возвращает инспектор,
+    затем workers воркеров uvicorn форкаются от него и слушают общий сокет. Если preload() вернул None,
+    сервер не запускается: иначе каждый воркер загрузил бы свою копию моделей.
+
+    Упавший воркер перезапускается; SIGTERM/SIGINT завершают всех. Через report_after секунд
+    печатается отчет о памяти воркеров (report_after=0 - не печатать).
+    """
+    inspector = preload()
+    if inspector is None:
+        print("❌ Модели не загружены в родителе, воркеры не запускаются")
+        return 1
+    if os.getenv("STAMPNSIGN_PREFORK_WARMUP", "1") == "1":
+        start_time = time.perf_counter()
+        warm_up(inspector)
+        print(f"🔥 Прогрев моделей: {time.perf_counter() - start_time:.1f} с")
+    print(f"🔗 Моделей в разделяемой памяти: {share_models(inspector)}")
+    # Все объекты родителя - в постоянное поколение: сборщик мусора в воркерах не трогает
+    # их заголовки и не копирует страницы с весами и кодом
+    gc.collect()
+    gc.freeze()
+
+    sock = bind_socket(host, port)
+    children = {}
+    stopping = False
+
+    def spawn(index):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(app, sock, host, port, index, workers)
+            finally:
+                os._exit(0)
+        children[pid] = (index, time.time())
+        print(f"👷 Воркер {pid} запущен")
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGALRM, lambda signum, frame: print_memory_report(list(children)))
+
+    for index in range(workers):
+        spawn(index)
+    if report_after:
+        signal.alarm(report_after)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        index, started = children.pop(pid, (None, None))
+        metrics.mark_process_dead(pid)
+        if not stopping and index is not None:
+            print(f"⚠️ Воркер {pid} завершился (код {os.waitstatus_to_exitcode(status)}), перезапуск")
+            if time.time() - started < 1:
+                # Воркер падает сразу после старта: не перезапускать в цикле без паузы
+                time.sleep(1)
+            # Новый воркер занимает ядра упавшего
+            spawn(index)
+    sock.close()
+    return 0
@@ -0,0 +1,95 @@
+# qr_decoding.py - декодирование QR-кодов только по вырезкам qrdet, с кешем по хешу вырезки
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from services import metrics
+
+# Вырезка расширяется на долю стороны, чтобы захватить тихую зону вокруг кода
+CROP_PADDING = 0.1
+# Декодер OpenCV уверенно читает код, когда его сторона не меньше ~300 px
+MIN_DECODE_SIDE = 320
+MAX_UPSCALE = 4.0
+
+
+class PayloadCache:
+    """LRU-кеш payload по хешу пикселей вырезки (None - код не прочитан)"""
+
+    def __init__(self, max_items=1024):
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(int(os.getenv("STAMPNSIGN_QR_CACHE_SIZE", "1024")))
+
+    def get(self, key):
+        """(найдено, payload)"""
+        with self._lock:
+            if key not in self._items:
+                return False, None
+            self._items.move_to_end(key)
+            return True, self._items[key]
+
+    def put(self, key, payload):
+        with self._lock:
+            self._items[key] = payload
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+
+payload_cache = PayloadCache.from_env()
+
+
+def crop_box(image, bbox, padding=CROP_PADDING):
+    """Серая вырезка bbox (x1, y1, x2, y2) с полями, обрезанная по границам страницы"""
+    width, height = image.size
+    x1, y1, x2, y2 = bbox
+    pad_x, pad_y = (x2 - x1) * padding, (y2 - y1) * padding
+    left, top = max(int(x1 - pad_x), 0), max(int(y1 - pad_y), 0)
+    right, bottom = min(int(x2 + pad_x) + 1, width), min(int(y2 + pad_y) + 1, height)
+    return np.asarray(image.crop((left, top, right, bottom)).convert('L'))
+
+
+def crop_key(crop):
+    digest = hashlib.blake2b(np.ascontiguousarray(crop).data, digest_size=16)
+    digest.update(str(crop.shape).encode())
+    return digest.hexdigest()
+
+
+def decode_crop(crop):
+    """Текст QR-кода из вырезки (серый uint8) или None"""
+    import cv2
+
+    if crop.size == 0:
+        return None
+    side = min(crop.shape[:2])
+    if side < MIN_DECODE_SIDE:
+        scale = min(MIN_DECODE_SIDE / side, MAX_UPSCALE)
+        crop = cv2.resize(crop, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+    try:
+        payload, _, _ = cv2.QRCodeDetector().detectAndDecode(crop)
+    except cv2.error:
+        return None
+    return payload or None
+
+
+def decode_payloads(image, detections, cache=payload_cache):
+    """Добавляет 'payload' к каждой детекции QR-кода; декодируются только вырезки"""
+    if not detections:
+        return detections
+    for det in detections:
+        crop = crop_box(image, det['bbox'])
+        key = crop_key(crop)
+        found, payload = cache.get(key)
+        metrics.record_cache("qr_payload", found)
+        if not found:
+            payload = decode_crop(crop)
+            cache.put(key, payload)
+        det['payload'] = payload
+    return detections
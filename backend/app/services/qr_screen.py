@@ -0,0 +1,221 @@
+# qr_screen.py - дешевый поиск поисковых узоров QR (finder patterns) перед запуском qrdet
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+SCREEN_MODES = ('off', 'conservative', 'regions')
+# Длинная сторона уменьшенной страницы: самый мелкий QR в разметке ~50 из 1684 пунктов,
+# его поисковый узор на 1600 px остается ~13 px с модулем ~2 px
+SCREEN_MAX_SIDE = 1600
+MIN_FINDER_SIDE = 6
+# Локальный порог: глобальный Otsu на белой странице слишком высок и склеивает кольца узора
+THRESHOLD_BLOCK = 15
+THRESHOLD_OFFSET = 10
+# Поисковый узор 7x7 модулей, внутренний квадрат 3x3: доля площади ~0.18
+INNER_AREA_RATIO = {'conservative': (0.03, 0.6), 'regions': (0.08, 0.4)}
+MIN_FILL = {'conservative': 0.5, 'regions': 0.75}
+MAX_ASPECT = {'conservative': 2.0, 'regions': 1.4}
+# Регион вокруг узора: QR до ~45 модулей (версия 7) - это ~6.5 узора от его края
+REGION_EXPAND = 6.5
+MIN_REGION_SIDE = 320
+# Страницы разметки (файл, номер с единицы), где QR размечен, а в самом PDF кода нет:
+# проверка recall их не учитывает, чтобы ошибка разметки не выдавалась за промах скрининга
+ANNOTATION_EXCLUSIONS = frozenset({
+    ('АПЗ-41-чб.pdf', 4),
+    ('АПЗ-41-чб.pdf', 5),
+})
+
+
+def downscale(image, max_side=SCREEN_MAX_SIDE):
+    """Серая уменьшенная страница (numpy) и коэффициент перевода в исходные пиксели.
+
+    Уменьшение в целое число раз (Image.reduce) на порядок дешевле resize.
+    """
+    factor = max(1, int(max(image.size) / max_side))
+    gray = image.convert('L')
+    if factor > 1:
+        gray = gray.reduce(factor)
+    return np.asarray(gray), factor
+
+
+def find_finder_patterns(image, mode='conservative', max_side=SCREEN_MAX_SIDE):
+    """Кандидаты поисковых узоров [x1, y1, x2, y2] в пикселях исходной страницы.
+
+    Узор - темный квадрат с просветом и вложенным темным квадратом: в дереве
+    контуров бинаризованной страницы это контур с ребенком и внуком.
+    """
+    import cv2
+
+    gray, scale = downscale(image, max_side)
+    binary = cv2.adaptiveThreshold(
+        gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, THRESHOLD_BLOCK, THRESHOLD_OFFSET
+    )
+    contours, hierarchy = cv2.findContours(binary, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+    if hierarchy is None:
+        return []
+
+    child = hierarchy[0][:, 2]
+    grandchild = np.where(child >= 0, child[np.maximum(child, 0)], -1)
+    candidates = np.flatnonzero((child >= 0) & (grandchild >= 0))
+
+    low, high = INNER_AREA_RATIO[mode]
+    boxes = []
+    for index in candidates:
+        x, y, width, height = cv2.boundingRect(contours[index])
+        if min(width, height) < MIN_FINDER_SIDE:
+            continue
+        if max(width, height) / min(width, height) > MAX_ASPECT[mode]:
+            continue
+        outer_area = cv2.contourArea(contours[index])
+        if outer_area < MIN_FILL[mode] * width * height:
+            continue
+        inner_area = cv2.contourArea(contours[grandchild[index]])
+        if not low <= inner_area / max(outer_area, 1.0) <= high:
+            continue
+        boxes.append([x * scale, y * scale, (x + width) * scale, (y + height) * scale])
+    return boxes
+
+
+def merge_regions(regions):
+    """Объединяет пересекающиеся прямоугольники до неподвижной точки"""
+    regions = [list(region) for region in regions]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(regions)):
+            for j in range(i + 1, len(regions)):
+                a, b = regions[i], regions[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    regions[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                    del regions[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return regions
+
+
+def finder_regions(finders, image_size):
+    """Области для qrdet вокруг найденных узоров, в пикселях страницы"""
+    width, height = image_size
+    regions = []
+    for x1, y1, x2, y2 in finders:
+        margin = max(x2 - x1, y2 - y1) * REGION_EXPAND
+        margin = max(margin, (MIN_REGION_SIDE - max(x2 - x1, y2 - y1)) / 2)
+        regions.append([max(x1 - margin, 0), max(y1 - margin, 0), min(x2 + margin, width), min(y2 + margin, height)])
+    return [[int(coord) for coord in region] for region in merge_regions(regions)]
+
+
+def screen_page(image, mode='conservative'):
+    """Решение для страницы: None - запускать qrdet на всей странице,
+    [] - QR нет, qrdet не нужен, список областей - запускать qrdet только в них.
+    """
+    if mode == 'off':
+        return None
+    finders = find_finder_patterns(image, mode)
+    if not finders:
+        return []
+    if mode == 'conservative':
+        return None
+    return finder_regions(finders, image.size)
+
+
+def detect_in_regions(run_detector, image, regions, threshold=None):
+    """Запуск детектора на вырезках с переводом боксов в координаты страницы"""
+    detections = []
+    for left, top, right, bottom in regions:
+        for det in run_detector(image.crop((left, top, right, bottom)), threshold):
+            x1, y1, x2, y2 = det['bbox']
+            detections.append({**det, 'bbox': [x1 + left, y1 + top, x2 + left, y2 + top]})
+    return detections
+
+
+def screen_recall(annotations, pdfs_dir, mode, zoom, exclusions=ANNOTATION_EXCLUSIONS):
+    """Проверка скрининга на разметке: доля QR, которые не будут пропущены, и доля пропущенных страниц.
+
+    QR на страницах из exclusions не считаются (см. ANNOTATION_EXCLUSIONS).
+    """
+    from services.pipeline import iter_pdf_pages
+    from services.evaluate import to_page_space
+
+    kept, total, skipped_pages, pages = 0, 0, 0, 0
+    missed = []
+    excluded = []
+    latencies = []
+    for file_name, annotated_pages in annotations.items():
+        path = Path(pdfs_dir) / file_name
+        if not path.exists():
+            continue
+        indices = sorted(annotated_pages)
+        for index, image in zip(indices, iter_pdf_pages(path.read_bytes(), zoom, indices)):
+            start_time = time.perf_counter()
+            decision = screen_page(image, mode)
+            latencies.append((time.perf_counter() - start_time) * 1000)
+            pages += 1
+            truths = annotated_pages[index]["boxes"]["qr_codes"]
+            if (file_name, index + 1) in exclusions:
+                excluded.extend({"file": file_name, "page": index + 1, "bbox": truth} for truth in truths)
+                truths = []
+            if decision == []:
+                skipped_pages += 1
+            for truth in truths:
+                total += 1
+                if decision is None:
+                    kept += 1
+                    continue
+                regions = [to_page_space(region, image.size, annotated_pages[index]["size"]) for region in decision]
+                if any(r[0] <= truth[0] and r[1] <= truth[1] and truth[2] <= r[2] and truth[3] <= r[3]
+                       for r in regions):
+                    kept += 1
+                else:
+                    missed.append({"file": file_name, "page": index + 1, "bbox": truth})
+
+    return {
+        "mode": mode,
+        "pages": pages,
+        "skipped_pages": skipped_pages,
+        "qr_codes": total,
+        "qr_kept": kept,
+        "recall": round(kept / total, 4) if total else None,
+        "screen_ms": {"mean": round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+                      "max": round(max(latencies), 2) if latencies else 0.0},
+        "missed": missed,
+        "excluded": excluded
+    }
+
+
+def main(argv=None):
+    from services.evaluate import ANNOTATIONS_FILE, load_annotations
+    from services.benchmark import PDFS_DIR
+    from services.pipeline import PDF_ZOOM
+
+    parser = argparse.ArgumentParser(description="Проверка QR-скрининга на разметке (без моделей)")
+    parser.add_argument("--annotations", default=str(ANNOTATIONS_FILE), help="файл разметки")
+    parser.add_argument("--pdfs-dir", default=str(PDFS_DIR), help="папка с PDF")
+    parser.add_argument("--mode", choices=SCREEN_MODES[1:], nargs='+', default=list(SCREEN_MODES[1:]))
+    parser.add_argument("--zoom", type=float, default=PDF_ZOOM)
+    parser.add_argument("--output", help="куда записать JSON-отчет")
+    args = parser.parse_args(argv)
+
+    annotations = load_annotations(args.annotations)
+    results = [screen_recall(annotations, args.pdfs_dir, mode, args.zoom) for mode in args.mode]
+    for result in results:
+        print(f"🔍 {result['mode']}: recall {result['recall']} ({result['qr_kept']}/{result['qr_codes']}), "
+              f"пропущено страниц {result['skipped_pages']}/{result['pages']}, "
+              f"скрининг {result['screen_ms']['mean']} мс/стр (макс {result['screen_ms']['max']}), "
+              f"исключено из разметки QR: {len(result['excluded'])}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"💾 Отчет сохранен в: {args.output}")
+    return 0 if all(result['recall'] in (None, 1.0) for result in results if result['mode'] == 'conservative') else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+# registry.py - реестр детекторов: бэкенд, веса, размер входа, порог и уровень скорости/точности
+import hashlib
+import json
+import os
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from enums import DETECTORS
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent.parent
+REGISTRY_FILE = Path(__file__).parent.parent / 'core' / 'detectors.json'
+TIERS = ('fast', 'balanced', 'accurate')
+BACKENDS = ('yolos', 'qrdet', 'ultralytics')
+
+
+@dataclass(frozen=True)
+class DetectorSpec:
+    """Описание одной модели детектора из конфигурации"""
+    name: str
+    tier: str
+    backend: str
+    weights: str
+    input_size: Optional[int] = None
+    # Порог по умолчанию, если запрос не задал свой
+    threshold: Optional[float] = None
+
+
+@dataclass
+class Registry:
+    specs: Dict[Tuple[str, str], DetectorSpec] = field(default_factory=dict)
+    default_tier: str = 'balanced'
+
+    def get(self, name, tier=None):
+        tier = tier or self.default_tier
+        try:
+            return self.specs[(name, tier)]
+        except KeyError:
+            raise ValueError(f"Detector '{name}' has no '{tier}' tier in the registry")
+
+
+def parse_spec(item):
+    try:
+        spec = DetectorSpec(**item)
+    except TypeError as e:
+        raise ValueError(f"Invalid detector entry {item}: {e}")
+    if spec.name not in DETECTORS:
+        raise ValueError(f"Unknown detector '{spec.name}' in registry, expected one of: {', '.join(DETECTORS)}")
+    if spec.tier not in TIERS:
+        raise ValueError(f"Unknown tier '{spec.tier}' for {spec.name}, expected one of: {', '.join(TIERS)}")
+    if spec.backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{spec.backend}' for {spec.name}, expected one of: {', '.join(BACKENDS)}")
+    return spec
+
+
+def load_registry(path=None):
+    """Реестр из JSON (STAMPNSIGN_DETECTOR_CONFIG или core/detectors.json); ValueError при ошибке"""
+    path = path or os.getenv("STAMPNSIGN_DETECTOR_CONFIG") or REGISTRY_FILE
+    with open(path, encoding='utf-8') as f:
+        config = json.load(f)
+    registry = Registry(default_tier=config.get("default_tier", "balanced"))
+    for item in config["detectors"]:
+        spec = parse_spec(item)
+        registry.specs[(spec.name, spec.tier)] = spec
+    if registry.default_tier not in TIERS:
+        raise ValueError(f"Unknown default tier '{registry.default_tier}'")
+    return registry
+
+
+def parse_tiers(value):
+    """STAMPNSIGN_TIERS=fast,accurate - какие уровни загружать; пусто - только уровень по умолчанию"""
+    if not value:
+        return None
+    tiers = tuple(tier for tier in TIERS if tier in {item.strip() for item in value.split(',')})
+    unknown = {item.strip() for item in value.split(',') if item.strip()} - set(TIERS)
+    if unknown or not tiers:
+        raise ValueError(f"Unknown tiers: {', '.join(sorted(unknown)) or value}, expected: {', '.join(TIERS)}")
+    return tiers
+
+
+@lru_cache(maxsize=None)
+def file_digest(path, size, mtime_ns):
+    """Хеш содержимого файла весов; size и mtime_ns - ключ кеша, чтобы замена файла давала новый хеш"""
+    digest = hashlib.blake2b(digest_size=8)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def model_version(spec):
+    """Версия модели детектора: бэкенд, веса и размер входа, для локальных весов - и их содержимое.
+
+    Порог в версию не входит: он задается запросом и хранится вместе с настройками.
+    """
+    digest = hashlib.blake2b(f"{spec.backend}|{spec.weights}|{spec.input_size}".encode(), digest_size=8)
+    path = PROJECT_ROOT / spec.weights
+    if path.is_file():
+        stat = path.stat()
+        digest.update(file_digest(str(path), stat.st_size, stat.st_mtime_ns).encode())
+    return digest.hexdigest()
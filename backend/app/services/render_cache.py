@@ -0,0 +1,295 @@
+# render_cache.py - рендеринг страниц и общий кеш страниц на диске (memory-mapped .npy)
+import hashlib
+import io
+import os
+import threading
+from pathlib import Path
+
+import fitz
+import numpy as np
+from PIL import Image
+
+from services import metrics
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent.parent
+RENDER_CACHE_DIR = PROJECT_ROOT / 'cache' / 'renders'
+# Страница A4 при zoom=2 - около 24 МБ сырых пикселей
+RENDER_CACHE_MB = 4096
+# Длинная сторона A4 в пунктах PDF: по ней выбирается разрешение декодирования изображений
+A4_LONG_SIDE_PT = 842
+# Тег TIFF NewSubfileType; бит 0 - уменьшенная копия предыдущего кадра
+TIFF_SUBFILE_TYPE = 254
+# После вытеснения кеш занимает не больше этой доли лимита, чтобы не чистить его на каждой записи
+EVICT_TO = 0.9
+
+
+def is_pdf(filename):
+    return filename.lower().endswith('.pdf')
+
+
+def image_max_side(zoom):
+    """Длинная сторона страницы-изображения: как у A4, отрендеренного из PDF с тем же zoom.
+
+    Сканы 600 dpi (~7000 px) детекторам не нужны - YOLO и YOLOS все равно сжимают вход до ~640-800 px.
+    """
+    return round(A4_LONG_SIDE_PT * zoom)
+
+
+def image_page_levels(image):
+    """Страницы многокадрового изображения: [[(кадр, размер), уменьшенные копии...], ...].
+
+    Каждый кадр TIFF - отдельная страница; кадр с флагом reduced-resolution в NewSubfileType
+    (пирамида сканера) - уменьшенная копия предыдущей страницы, а не новая страница.
+    """
+    pages = []
+    for index in range(getattr(image, 'n_frames', 1)):
+        image.seek(index)
+        reduced = image.format == 'TIFF' and image.tag_v2.get(TIFF_SUBFILE_TYPE, 0) & 1
+        if reduced and pages:
+            pages[-1].append((index, image.size))
+        else:
+            pages.append([(index, image.size)])
+    return pages
+
+
+def pick_level(levels, max_side):
+    """Самый маленький уровень пирамиды, длинная сторона которого не меньше max_side"""
+    fitting = [level for level in levels if max(level[1]) >= max_side]
+    return min(fitting, key=lambda level: max(level[1])) if fitting else levels[0]
+
+
+def render_image_array(image, levels, zoom):
+    """Страница изображения как массив (высота, ширина, 3) uint8, декодированная в уменьшенном виде.
+
+    Берется самый маленький уровень пирамиды не меньше нужного размера; JPEG декодируется
+    в draft-режиме (масштабирование DCT 1/2-1/8 при декодировании), остальное уменьшается после.
+    """
+    max_side = image_max_side(zoom)
+    index, size = pick_level(levels, max_side)
+    image.seek(index)
+    scale = min(1.0, max_side / max(size))
+    if scale < 1 and image.format == 'JPEG':
+        image.draft(image.mode, (max(1, round(size[0] * scale)), max(1, round(size[1] * scale))))
+
+    # Битовые и палитровые сканы уменьшаются в оттенках серого: resize для них - только nearest
+    if image.mode in ('1', 'P', 'L', 'LA'):
+        page = image.convert('RGB' if image.mode == 'P' else 'L')
+    else:
+        page = image.convert('RGB')
+    if max(page.size) > max_side:
+        page.thumbnail((max_side, max_side), Image.BILINEAR)
+    if page.mode != 'RGB':
+        page = page.convert('RGB')
+    return np.asarray(page)
+
+
+def iter_image_pages(content, zoom, page_indices=None):
+    """Страницы изображения (кадры TIFF) по одной, в уменьшенном до нужного разрешения виде"""
+    with Image.open(io.BytesIO(content)) as image:
+        pages = image_page_levels(image)
+        for index in range(len(pages)) if page_indices is None else page_indices:
+            yield Image.fromarray(render_image_array(image, pages[index], zoom))
+
+
+def count_image_pages(content):
+    """Число страниц изображения; читаются только заголовки кадров"""
+    with Image.open(io.BytesIO(content)) as image:
+        return len(image_page_levels(image))
+
+
+def image_page_sizes(content):
+    """Исходные размеры страниц изображения (самый крупный уровень пирамиды); пиксели не декодируются"""
+    with Image.open(io.BytesIO(content)) as image:
+        return [levels[0][1] for levels in image_page_levels(image)]
+
+
+def document_key(content):
+    """Хеш содержимого документа: одинаковые файлы под разными именами делят страницы"""
+    return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+
+def render_pdf_array(pdf_document, index, zoom):
+    """Страница открытого PDF (с нуля) как массив (высота, ширина, 3) uint8"""
+    pix = pdf_document.load_page(index).get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+    array = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.stride)
+    return array[:, :pix.width * 3].reshape(pix.height, pix.width, 3)
+
+
+def render_pdf_page(pdf_document, index, zoom):
+    """Одна страница открытого PDF (с нуля) в RGB"""
+    return Image.fromarray(render_pdf_array(pdf_document, index, zoom))
+
+
+class RenderCache:
+    """Сырые массивы страниц: {каталог}/{хеш документа}/{страница}_{масштаб}.npy.
+
+    Файлы открываются через np.load(mmap_mode='r'): страница не декодируется, а процессы,
+    читающие одну страницу, делят страницы page cache ОС. Размер ограничен max_bytes,
+    вытесняются давно не читавшиеся страницы (время изменения обновляется при чтении).
+    """
+
+    def __init__(self, directory=RENDER_CACHE_DIR, max_bytes=RENDER_CACHE_MB * 1024 * 1024):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        # Оценка занятого места; None - еще не считали. Другие процессы тоже пишут,
+        # поэтому при превышении лимита каталог пересчитывается целиком
+        self._size = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """STAMPNSIGN_RENDER_CACHE - каталог кеша (off - без кеша), STAMPNSIGN_RENDER_CACHE_MB - лимит"""
+        directory = os.getenv("STAMPNSIGN_RENDER_CACHE", str(RENDER_CACHE_DIR))
+        if directory == "off":
+            return None
+        return cls(directory, int(float(os.getenv("STAMPNSIGN_RENDER_CACHE_MB", RENDER_CACHE_MB)) * 1024 * 1024))
+
+    def path(self, key, page_index, zoom):
+        return self.directory / key / f"{page_index}_{zoom:g}.npy"
+
+    def has(self, key, page_index, zoom):
+        return self.path(key, page_index, zoom).exists()
+
+    def get_array(self, key, page_index, zoom):
+        """Массив страницы, отображенный в память (только чтение), или None"""
+        path = self.path(key, page_index, zoom)
+        try:
+            array = np.load(path, mmap_mode='r')
+            os.utime(path)
+        except (OSError, ValueError):
+            # Нет файла или его как раз вытеснил другой процесс
+            metrics.record_cache("render", False)
+            return None
+        metrics.record_cache("render", True)
+        return array
+
+    def get(self, key, page_index, zoom):
+        array = self.get_array(key, page_index, zoom)
+        return None if array is None else Image.fromarray(array)
+
+    def put(self, key, page_index, zoom, array):
+        path = self.path(key, page_index, zoom)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Запись через временный файл: параллельный читатель не увидит половину страницы
+        temporary = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(temporary, 'wb') as f:
+                np.save(f, np.ascontiguousarray(array))
+            os.replace(temporary, path)
+        except OSError:
+            # Диск заполнен или нет прав: недописанный файл не остается в кеше
+            temporary.unlink(missing_ok=True)
+            raise
+        self._account(path.stat().st_size)
+
+    def store(self, key, page_index, zoom, array):
+        """put, при котором сбой записи не мешает обработке: страница просто не попадает в кеш"""
+        try:
+            self.put(key, page_index, zoom, array)
+        except OSError as e:
+            print(f"⚠️ Кеш рендеров: страница {page_index} не сохранена: {e}")
+
+    def _scan(self):
+        """[(время последнего чтения или записи, размер, путь)] всех страниц кеша"""
+        entries = []
+        if not self.directory.exists():
+            return entries
+        for document in os.scandir(self.directory):
+            if not document.is_dir():
+                continue
+            for page in os.scandir(document.path):
+                if page.name.endswith('.npy'):
+                    stat = page.stat()
+                    entries.append((stat.st_mtime, stat.st_size, page.path))
+        return entries
+
+    def _account(self, added):
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._scan())
+            else:
+                self._size += added
+            if self._size > self.max_bytes:
+                self._size = self.evict(int(self.max_bytes * EVICT_TO))
+
+    def evict(self, target_bytes):
+        """Удаляет самые старые по доступу страницы, пока кеш не станет меньше target_bytes"""
+        entries = sorted(self._scan())
+        size = sum(entry_size for _, entry_size, _ in entries)
+        for _, entry_size, path in entries:
+            if size <= target_bytes:
+                break
+            try:
+                # Уже отображенные в память копии у других процессов остаются валидными
+                os.unlink(path)
+                size -= entry_size
+            except FileNotFoundError:
+                size -= entry_size
+            except OSError:
+                # Windows не дает удалить файл, открытый через mmap (PermissionError): он остается
+                # до следующего вытеснения
+                continue
+        return size
+
+    def iter_pages(self, filename, content, zoom, page_indices=None, key=None):
+        """Страницы документа из кеша; недостающие рендерятся и сохраняются.
+
+        Если key задан, а все страницы уже в кеше, content не нужен (может быть None).
+        """
+        key = key or document_key(content)
+        if not is_pdf(filename):
+            yield from self._iter_image_pages(key, content, zoom, page_indices)
+            return
+
+        pdf_document = None
+        try:
+            if page_indices is None:
+                pdf_document = fitz.open(stream=content, filetype="pdf")
+                page_indices = range(pdf_document.page_count)
+            for index in page_indices:
+                image = self.get(key, index, zoom)
+                if image is None:
+                    # PDF открывается только при первом промахе
+                    pdf_document = pdf_document or fitz.open(stream=content, filetype="pdf")
+                    array = render_pdf_array(pdf_document, index, zoom)
+                    self.store(key, index, zoom, array)
+                    image = Image.fromarray(array)
+                yield image
+        finally:
+            if pdf_document is not None:
+                pdf_document.close()
+
+
+    def _iter_image_pages(self, key, content, zoom, page_indices):
+        image, pages = None, None
+        try:
+            if page_indices is None:
+                image = Image.open(io.BytesIO(content))
+                pages = image_page_levels(image)
+                page_indices = range(len(pages))
+            for index in page_indices:
+                page = self.get(key, index, zoom)
+                if page is None:
+                    if image is None:
+                        image = Image.open(io.BytesIO(content))
+                        pages = image_page_levels(image)
+                    array = render_image_array(image, pages[index], zoom)
+                    self.store(key, index, zoom, array)
+                    page = Image.fromarray(array)
+                yield page
+        finally:
+            if image is not None:
+                image.close()
+
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+
+def shared_cache():
+    """Кеш процесса из переменных окружения (None, если выключен); каталог общий для всех процессов"""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = RenderCache.from_env() or False
+    return _shared_cache or None
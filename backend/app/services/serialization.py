@@ -0,0 +1,77 @@
+# serialization.py - форматы ответа: JSON, колоночный JSON и MessagePack
+import json
+
+from starlette.responses import Response
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+try:
+    import msgpack
+    HAS_MSGPACK = True
+except ImportError:
+    HAS_MSGPACK = False
+
+FORMATS = ('json', 'columnar', 'msgpack')
+MSGPACK_MEDIA_TYPES = ('application/msgpack', 'application/x-msgpack')
+
+# Имена колонок для стандартных полей детекции, остальные поля сохраняют свое имя
+COLUMN_NAMES = {'label': 'labels', 'bbox': 'boxes', 'confidence': 'scores'}
+
+
+def dumps(data):
+    """Кодирует данные в JSON (bytes), через orjson если он установлен"""
+    if HAS_ORJSON:
+        return orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+
+def columnar_detections(detections):
+    """Сводит группы детекций страницы в параллельные массивы labels/boxes/scores"""
+    items = [det for group in detections.values() for det in group]
+    keys = list(COLUMN_NAMES)
+    for det in items:
+        keys.extend(key for key in det if key not in keys)
+    return {COLUMN_NAMES.get(key, key): [det.get(key) for det in items] for key in keys}
+
+
+def to_columnar(data):
+    """Переводит ответ (документ, страницу или событие) в колоночный вид"""
+    if not isinstance(data, dict):
+        return data
+    if isinstance(data.get("detections"), dict):
+        data = {**data, "detections": columnar_detections(data["detections"])}
+    if isinstance(data.get("pages"), list):
+        data = {**data, "pages": [to_columnar(page) for page in data["pages"]]}
+    return data
+
+
+def negotiate_format(requested, accept=None):
+    """Формат ответа из параметра format или заголовка Accept"""
+    if requested:
+        if requested not in FORMATS:
+            raise ValueError(f"Unknown format '{requested}', expected one of: {', '.join(FORMATS)}")
+        return requested
+    if accept and any(media_type in accept for media_type in MSGPACK_MEDIA_TYPES):
+        return 'msgpack'
+    return 'json'
+
+
+def render(data, response_format='json', status_code=200, headers=None):
+    """Готовый Response в выбранном формате, минуя jsonable_encoder"""
+    if response_format == 'msgpack':
+        if not HAS_MSGPACK:
+            return Response(
+                dumps({"success": False, "error": "msgpack is not installed on the server"}),
+                status_code=406,
+                media_type="application/json"
+            )
+        content = msgpack.packb(to_columnar(data), use_bin_type=True, use_single_float=True)
+        return Response(content, status_code=status_code, headers=headers, media_type=MSGPACK_MEDIA_TYPES[0])
+
+    if response_format == 'columnar':
+        data = to_columnar(data)
+    return Response(dumps(data), status_code=status_code, headers=headers, media_type="application/json")
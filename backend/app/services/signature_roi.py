@@ -0,0 +1,238 @@
+# signature_roi.py - области для детектора подписей: штампы, чернильные блоки и априорные зоны
+import argparse
+import json
+import sys
+import time
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from services.qr_screen import downscale, merge_regions
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent.parent
+PRIORS_FILE = PROJECT_ROOT / 'selected_output' / 'signature_priors.json'
+
+SIGNATURE_MODES = ('full', 'roi')
+PRIOR_GRID = 8
+# Разметка для поиска блоков рукописных чернил достаточно грубая
+LAYOUT_MAX_SIDE = 800
+# Размытие штрихов в блоки: подпись распадается на штрихи, текст - на буквы
+BLOB_KERNEL = (9, 5)
+# Размер блока-кандидата в долях страницы и доля чернил в его рамке
+BLOB_WIDTH = (0.03, 0.45)
+BLOB_HEIGHT = (0.012, 0.2)
+BLOB_INK = (0.02, 0.6)
+MAX_BLOBS = 6
+# Поля вокруг кандидатов: подпись часто выходит за штамп и за свой блок чернил
+STAMP_MARGIN = 0.6
+BLOB_MARGIN = 1.0
+# Если области покрывают больше этой доли страницы, дешевле один проход по всей странице
+MAX_AREA_FRACTION = 0.6
+
+
+def learn_priors(annotations, grid=PRIOR_GRID):
+    """Частота подписей по ячейкам сетки grid x grid (доли страницы), нормированная к максимуму"""
+    counts = np.zeros((grid, grid))
+    signatures = 0
+    for pages in annotations.values():
+        for page in pages.values():
+            width, height = page["size"]
+            for x1, y1, x2, y2 in page["boxes"]["signatures"]:
+                signatures += 1
+                cols = range(int(x1 / width * grid), min(int(x2 / width * grid), grid - 1) + 1)
+                rows = range(int(y1 / height * grid), min(int(y2 / height * grid), grid - 1) + 1)
+                for row in rows:
+                    counts[row, list(cols)] += 1
+    peak = counts.max() or 1.0
+    return {"grid": grid, "signatures": signatures, "weights": np.round(counts / peak, 4).tolist()}
+
+
+@lru_cache(maxsize=None)
+def load_priors(path=PRIORS_FILE):
+    """Априорные веса сетки; без файла - равномерные (зоны не ограничивают поиск)"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            priors = json.load(f)
+    except (OSError, ValueError):
+        return np.ones((PRIOR_GRID, PRIOR_GRID))
+    return np.array(priors["weights"], dtype=np.float64)
+
+
+def ink_blobs(image, weights, max_side=LAYOUT_MAX_SIDE):
+    """Блоки чернил, похожие на подпись, с весом по априорной сетке: [(вес, [x1, y1, x2, y2])]"""
+    import cv2
+
+    gray, scale = downscale(image, max_side)
+    height, width = gray.shape
+    binary = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 15, 10)
+    blobs = cv2.dilate(binary, cv2.getStructuringElement(cv2.MORPH_RECT, BLOB_KERNEL))
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(blobs, connectivity=8)
+    if count <= 1:
+        return []
+
+    x, y, w, h = (stats[1:, i] for i in (cv2.CC_STAT_LEFT, cv2.CC_STAT_TOP, cv2.CC_STAT_WIDTH, cv2.CC_STAT_HEIGHT))
+    ink = np.array([
+        np.count_nonzero(binary[top:top + box_h, left:left + box_w]) / max(box_w * box_h, 1)
+        for left, top, box_w, box_h in zip(x, y, w, h)
+    ])
+    keep = (
+        (w >= BLOB_WIDTH[0] * width) & (w <= BLOB_WIDTH[1] * width)
+        & (h >= BLOB_HEIGHT[0] * height) & (h <= BLOB_HEIGHT[1] * height)
+        & (ink >= BLOB_INK[0]) & (ink <= BLOB_INK[1])
+    )
+    grid = weights.shape[0]
+    rows = np.minimum(((y + h / 2) / height * grid).astype(int), grid - 1)
+    cols = np.minimum(((x + w / 2) / width * grid).astype(int), grid - 1)
+    score = weights[rows, cols] * keep
+    order = [index for index in np.argsort(-score) if score[index] > 0]
+    return [
+        (float(score[index]), [x[index] * scale, y[index] * scale, (x[index] + w[index]) * scale,
+                               (y[index] + h[index]) * scale])
+        for index in order
+    ]
+
+
+def expand(box, margin, image_size):
+    x1, y1, x2, y2 = box
+    pad_x, pad_y = (x2 - x1) * margin, (y2 - y1) * margin
+    return [max(x1 - pad_x, 0), max(y1 - pad_y, 0), min(x2 + pad_x, image_size[0]), min(y2 + pad_y, image_size[1])]
+
+
+def signature_regions(image, stamp_boxes=(), priors_path=PRIORS_FILE, max_blobs=MAX_BLOBS, weights=None):
+    """Области для детектора подписей: None - вся страница, [] - кандидатов нет.
+
+    weights - априорная сетка вместо файла priors_path (проверка на отложенных документах).
+    """
+    weights = load_priors(priors_path) if weights is None else weights
+    regions = [expand(box, STAMP_MARGIN, image.size) for box in stamp_boxes]
+    regions += [expand(box, BLOB_MARGIN, image.size) for _, box in ink_blobs(image, weights)[:max_blobs]]
+    if not regions:
+        return []
+    regions = merge_regions(regions)
+    area = sum((x2 - x1) * (y2 - y1) for x1, y1, x2, y2 in regions)
+    if area > MAX_AREA_FRACTION * image.size[0] * image.size[1]:
+        return None
+    return [[int(coord) for coord in region] for region in regions]
+
+
+def detect_in_regions_batched(inspector, name, image, regions, threshold=None, tier=None):
+    """Один пакетный вызов детектора на все вырезки, боксы в координатах страницы"""
+    if not regions:
+        return []
+    crops = [image.crop(tuple(region)) for region in regions]
+    results = inspector.run_detector_batch(name, crops, threshold, tier)
+    detections = []
+    for (left, top, _, _), found in zip(regions, results):
+        for det in found:
+            x1, y1, x2, y2 = det['bbox']
+            detections.append({**det, 'bbox': [x1 + left, y1 + top, x2 + left, y2 + top]})
+    return detections
+
+
+def holdout_weights(annotations, file_name, grid=PRIOR_GRID):
+    """Априорная сетка, обученная на всех документах, кроме file_name (leave-one-document-out)"""
+    rest = {name: pages for name, pages in annotations.items() if name != file_name}
+    priors = learn_priors(rest, grid)
+    if not priors["signatures"]:
+        return np.ones((grid, grid))
+    return np.array(priors["weights"], dtype=np.float64)
+
+
+def check_coverage(annotations, pdfs_dir, zoom, priors_path=PRIORS_FILE, min_overlap=0.8, holdout=True):
+    """Доля размеченных подписей, на 80%+ попадающих в области (штампы берутся из разметки).
+
+    holdout=True - leave-one-document-out: зоны для страниц документа обучаются на остальных документах,
+    иначе покрытие завышено (зоны запомнили ровно эти подписи). holdout=False - веса из priors_path.
+    """
+    from services.pipeline import iter_pdf_pages
+
+    covered, total, pages, skipped, full_pages = 0, 0, 0, 0, 0
+    area_fractions = []
+    latencies = []
+    for file_name, annotated_pages in annotations.items():
+        path = Path(pdfs_dir) / file_name
+        if not path.exists():
+            continue
+        weights = holdout_weights(annotations, file_name) if holdout else None
+        indices = sorted(annotated_pages)
+        for index, image in zip(indices, iter_pdf_pages(path.read_bytes(), zoom, indices)):
+            page = annotated_pages[index]
+            scale_x, scale_y = image.size[0] / page["size"][0], image.size[1] / page["size"][1]
+            to_pixels = lambda box: [box[0] * scale_x, box[1] * scale_y, box[2] * scale_x, box[3] * scale_y]
+
+            start_time = time.perf_counter()
+            regions = signature_regions(image, [to_pixels(box) for box in page["boxes"]["stamps"]], priors_path,
+                                        weights=weights)
+            latencies.append((time.perf_counter() - start_time) * 1000)
+            pages += 1
+            if regions is None:
+                full_pages += 1
+                area_fractions.append(1.0)
+            else:
+                skipped += not regions
+                area_fractions.append(
+                    sum((x2 - x1) * (y2 - y1) for x1, y1, x2, y2 in regions) / (image.size[0] * image.size[1])
+                )
+
+            for truth in page["boxes"]["signatures"]:
+                total += 1
+                if regions is None:
+                    covered += 1
+                    continue
+                x1, y1, x2, y2 = to_pixels(truth)
+                truth_area = max((x2 - x1) * (y2 - y1), 1e-9)
+                if any(
+                    max(0.0, min(x2, r[2]) - max(x1, r[0])) * max(0.0, min(y2, r[3]) - max(y1, r[1]))
+                    >= min_overlap * truth_area
+                    for r in regions
+                ):
+                    covered += 1
+
+    return {
+        "holdout": "leave-one-document-out" if holdout else None,
+        "pages": pages,
+        "full_pages": full_pages,
+        "skipped_pages": skipped,
+        "signatures": total,
+        "covered": covered,
+        "recall": round(covered / total, 4) if total else None,
+        "mean_area_fraction": round(sum(area_fractions) / len(area_fractions), 4) if area_fractions else None,
+        "roi_ms": round(sum(latencies) / len(latencies), 2) if latencies else 0.0
+    }
+
+
+def main(argv=None):
+    from services.benchmark import PDFS_DIR
+    from services.evaluate import ANNOTATIONS_FILE, load_annotations
+    from services.pipeline import PDF_ZOOM
+
+    parser = argparse.ArgumentParser(description="Априорные зоны подписей и проверка ROI-режима по разметке")
+    parser.add_argument("command", choices=("learn", "check"))
+    parser.add_argument("--annotations", default=str(ANNOTATIONS_FILE), help="файл разметки")
+    parser.add_argument("--pdfs-dir", default=str(PDFS_DIR), help="папка с PDF")
+    parser.add_argument("--priors", default=str(PRIORS_FILE), help="файл априорных весов")
+    parser.add_argument("--zoom", type=float, default=PDF_ZOOM)
+    parser.add_argument("--in-sample", action="store_true",
+                        help="check: веса из --priors вместо leave-one-document-out (покрытие завышено)")
+    args = parser.parse_args(argv)
+
+    annotations = load_annotations(args.annotations)
+    if args.command == "learn":
+        priors = learn_priors(annotations)
+        with open(args.priors, 'w', encoding='utf-8') as f:
+            json.dump(priors, f, indent=2)
+        print(f"💾 Априорные веса по {priors['signatures']} подписям сохранены в: {args.priors}")
+        return 0
+
+    result = check_coverage(annotations, args.pdfs_dir, args.zoom, Path(args.priors), holdout=not args.in_sample)
+    print(f"🔍 Покрытие подписей ({result['holdout'] or 'на обучающей разметке'}): {result['recall']} ({result['covered']}/{result['signatures']}), "
+          f"доля площади {result['mean_area_fraction']}, целиком {result['full_pages']}/{result['pages']}, "
+          f"без областей {result['skipped_pages']}, {result['roi_ms']} мс/стр")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
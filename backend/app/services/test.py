@@ -3,26 +3,20 @@ import json
 from pathlib import Path
 import time
 from datetime import datetime
-import fitz  # PyMuPDF
-import tempfile
 import sys
-from PIL import Image
-import io
 import cv2
 import numpy as np
 
 # Добавляем пути к проекту
 project_root = Path(__file__).parent.parent.parent
 sys.path.append(str(project_root))
+sys.path.append(str(Path(__file__).parent.parent))
+
+from services.pipeline import iter_pdf_pages
 
 try:
-    try:
-        from backend.app.detection_services import DigitalInspector
-        print("✅ Модели загружены из backend.app.detection_services")
-    except ImportError:
-        from detection_services import DigitalInspector
-        print("✅ Модели загружены из detection_services")
-    
+    from services.detection_services import DigitalInspector
+    print("✅ Модели загружены из services.detection_services")
     HAS_MODELS = True
 except ImportError as e:
     print(f"❌ Ошибка импорта моделей: {e}")
@@ -30,8 +24,9 @@ except ImportError as e:
     HAS_MODELS = False
 
 # Конфигурация путей
-PDFS_DIR = Path(r"C:\Users\user\Desktop\Programming\aiesec_hackathon\selected_output\pdfs")
+PDFS_DIR = Path(os.getenv("PDFS_DIR", project_root.parent / "selected_output" / "pdfs"))
 RESULTS_FILE = Path("test_results.json")
+RESULTS_JOURNAL = Path("test_results.jsonl")
 
 def create_detector_directly():
     """Создает детектор напрямую если импорт не работает"""
@@ -134,32 +129,8 @@ def create_detector_directly():
         return None
 
 def pdf_to_images(pdf_file):
-    """Конвертирует PDF в список изображений"""
-    images = []
-    
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-        tmp_file.write(pdf_file)
-        tmp_path = tmp_file.name
-    
-    try:
-        pdf_document = fitz.open(tmp_path)
-        
-        for page_num in range(len(pdf_document)):
-            page = pdf_document.load_page(page_num)
-            pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))
-            img_data = pix.tobytes("ppm")
-            
-            image = Image.open(io.BytesIO(img_data))
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            images.append(image)
-        
-        pdf_document.close()
-        
-    finally:
-        os.unlink(tmp_path)
-    
-    return images
+    """Конвертирует PDF в список изображений (через общий кеш рендеров)"""
+    return list(iter_pdf_pages(pdf_file, zoom=2))
 
 def test_single_pdf(pdf_path, inspector):
     """Тестирует один PDF файл"""
@@ -270,6 +241,10 @@ def test_all_pdfs():
         "files": []
     }
     
+    # Промежуточные результаты пишутся в журнал по строке на файл, полный JSON - один раз в конце.
+    # Прогон всегда проходит все файлы заново, поэтому журнал прошлого прогона перезаписывается
+    journal = open(RESULTS_JOURNAL, 'w', encoding='utf-8')
+
     # Тестируем каждый файл
     for i, pdf_path in enumerate(pdf_files, 1):
         print(f"\n📊 Прогресс: {i}/{len(pdf_files)}")
@@ -299,9 +274,12 @@ def test_all_pdfs():
         
         test_results["files"].append(file_result)
         
-        # Сохраняем промежуточные результаты после каждого файла
-        with open(RESULTS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(test_results, f, ensure_ascii=False, indent=2, default=str)
+        journal.write(json.dumps(file_result, ensure_ascii=False, default=str) + '\n')
+        journal.flush()
+    
+    journal.close()
+    with open(RESULTS_FILE, 'w', encoding='utf-8') as f:
+        json.dump(test_results, f, ensure_ascii=False, indent=2, default=str)
     
     # Финальная статистика
     print(f"\n{'='*60}")
@@ -1,11 +1,11 @@
 # visual_debug.py
 import sys
 from pathlib import Path
-from PIL import Image, ImageDraw
-import io
+from PIL import ImageDraw
 
 sys.path.append(str(Path(__file__).parent.parent))
 from detection_services import DigitalInspector
+from services.pipeline import iter_pdf_pages
 
 def visualize_detections():
     """Визуализирует детекции на реальных изображениях"""
@@ -14,15 +14,9 @@ def visualize_detections():
     # Прямой путь к PDF
     pdf_path = Path("C:/Users/user/Desktop/Programming/aiesec_hackathon/selected_output/pdfs/АПЗ-2.pdf")
     
-    # Конвертируем только первую страницу
-    import fitz
-    doc = fitz.open(pdf_path)
-    page = doc[0]  # Первая страница
-    mat = fitz.Matrix(2, 2)
-    pix = page.get_pixmap(matrix=mat)
-    img_data = pix.tobytes("ppm")
-    image = Image.open(io.BytesIO(img_data))
-    doc.close()
+    # Конвертируем только первую страницу (повторные запуски берут ее из кеша рендеров);
+    # копия, потому что ниже на ней рисуются рамки
+    image = next(iter_pdf_pages(pdf_path.read_bytes(), zoom=2, page_indices=[0])).copy()
     
     print(f"📐 Размер изображения: {image.size}")
     
@@ -0,0 +1,5 @@
+# conftest.py - модули приложения (services, enums) импортируются так же, как из backend/app
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
@@ -0,0 +1,64 @@
+# test_annotations.py - векторные рамки в копии PDF на повернутых и обрезанных страницах, SVG-оверлей
+import fitz
+import numpy as np
+import pytest
+
+from services.annotations import BORDER_WIDTH, svg_overlay, write_annotated_pdf
+
+ZOOM = 2
+
+
+def make_page_pdf(rotation, cropbox=None):
+    document = fitz.open()
+    page = document.new_page(width=200, height=300)
+    if cropbox:
+        page.set_cropbox(fitz.Rect(*cropbox))
+    page.set_rotation(rotation)
+    content = document.tobytes()
+    pixmap = page.get_pixmap(matrix=fitz.Matrix(ZOOM, ZOOM))
+    document.close()
+    return content, (pixmap.width, pixmap.height)
+
+
+def red_box(path):
+    """Рамка красного цвета (подпись) на отрендеренной странице, в пикселях видимой страницы"""
+    with fitz.open(path) as document:
+        pixmap = document[0].get_pixmap(matrix=fitz.Matrix(ZOOM, ZOOM))
+    pixels = np.frombuffer(pixmap.samples, np.uint8).reshape(pixmap.height, pixmap.width, pixmap.n)
+    red = (pixels[:, :, 0] > 200) & (pixels[:, :, 1] < 80) & (pixels[:, :, 2] < 80)
+    ys, xs = np.nonzero(red)
+    return [xs.min(), ys.min(), xs.max(), ys.max()]
+
+
+@pytest.mark.parametrize('rotation', [0, 90, 180, 270])
+@pytest.mark.parametrize('cropbox', [None, (20, 30, 180, 280)])
+def test_annotated_pdf_box_matches_rendered_bbox(tmp_path, rotation, cropbox):
+    content, size = make_page_pdf(rotation, cropbox)
+    # Несимметричный бокс: перепутанные оси или поворот в неверную сторону его сдвинут
+    bbox = [size[0] * 0.2, size[1] * 0.3, size[0] * 0.6, size[1] * 0.5]
+    detections = {'signatures': [{'label': 'signature', 'bbox': bbox, 'confidence': 0.9}]}
+    path = tmp_path / 'annotated.pdf'
+    write_annotated_pdf('doc.pdf', content, [(1, size, detections)], path)
+    # Обводка толщиной BORDER_WIDTH пунктов центрирована на границе рамки
+    assert red_box(path) == pytest.approx(bbox, abs=BORDER_WIDTH * ZOOM)
+
+
+def test_annotated_pdf_keeps_original_pages(tmp_path):
+    content, size = make_page_pdf(90)
+    path = tmp_path / 'annotated.pdf'
+    write_annotated_pdf('doc.pdf', content, [(1, size, {'stamps': []})], path)
+    with fitz.open(path) as document:
+        assert len(document) == 1
+        assert document[0].rotation == 90
+        assert list(document[0].annots()) == []
+
+
+def test_svg_overlay():
+    svg = svg_overlay([400, 600], {
+        'stamps': [{'label': 'stamp', 'bbox': [10, 20, 110, 70], 'confidence': 0.5}],
+        'signatures': [{'label': 'sig<n>', 'bbox': [0, 0, 1, 1], 'confidence': 0.25}],
+    })
+    assert svg.startswith('<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 400 600"')
+    assert '<rect x="10.0" y="20.0" width="100.0" height="50.0"' in svg
+    assert 'stroke="rgb(0,0,255)"' in svg
+    assert 'sig&lt;n&gt;' in svg and 'sig<n>' not in svg
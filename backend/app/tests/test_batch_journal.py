@@ -0,0 +1,101 @@
+# test_batch_journal.py - журнал batch.py: возобновление после сбоя и --retry-errors
+import json
+
+import fitz
+import pytest
+
+from services import batch
+
+
+def write_pdf(path, pages=1):
+    document = fitz.open()
+    for _ in range(pages):
+        document.new_page(width=200, height=300)
+    document.save(str(path))
+    document.close()
+
+
+def read_journal(path):
+    return [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines() if line.strip()]
+
+
+@pytest.fixture
+def fake_models(monkeypatch):
+    monkeypatch.setenv("STAMPNSIGN_FAKE_MODELS", "1")
+    monkeypatch.setenv("STAMPNSIGN_FAKE_LATENCY_MS", "0")
+
+
+def test_iter_journal_skips_torn_last_line(tmp_path):
+    journal = tmp_path / 'journal.jsonl'
+    journal.write_text('{"file": "a.pdf", "status": "success"}\n{"file": "b.pd', encoding='utf-8')
+    assert [record["file"] for record in batch.iter_journal(journal)] == ['a.pdf']
+    assert list(batch.iter_journal(tmp_path / 'missing.jsonl')) == []
+
+
+def test_open_journal_starts_new_line_after_torn_record(tmp_path):
+    journal = tmp_path / 'journal.jsonl'
+    journal.write_text('{"file": "a.pdf", "status": "success"}\n{"file": "b.pd', encoding='utf-8')
+    with batch.open_journal(journal) as f:
+        f.write(json.dumps({"file": "c.pdf", "status": "success"}) + '\n')
+    assert [record["file"] for record in batch.iter_journal(journal)] == ['a.pdf', 'c.pdf']
+
+
+def test_journaled_files_with_retry_errors(tmp_path):
+    journal = tmp_path / 'journal.jsonl'
+    journal.write_text(
+        '{"file": "a.pdf", "status": "success"}\n{"file": "b.pdf", "status": "error"}\n', encoding='utf-8'
+    )
+    assert batch.journaled_files(journal) == {'a.pdf', 'b.pdf'}
+    assert batch.journaled_files(journal, retry_errors=True) == {'a.pdf'}
+
+
+def test_iter_files_sorted_per_directory(tmp_path):
+    for name in ('b.pdf', 'a.PNG', 'notes.txt'):
+        (tmp_path / name).write_bytes(b'')
+    (tmp_path / 'sub').mkdir()
+    (tmp_path / 'sub' / 'c.pdf').write_bytes(b'')
+    names = lambda recursive: [str(path.relative_to(tmp_path)) for path in batch.iter_files(tmp_path, recursive)]
+    assert names(False) == ['a.PNG', 'b.pdf']
+    assert names(True) == ['a.PNG', 'b.pdf', 'sub/c.pdf']
+
+
+def test_run_resumes_and_retries_errors(tmp_path, fake_models):
+    documents = tmp_path / 'docs'
+    documents.mkdir()
+    write_pdf(documents / 'a.pdf', 2)
+    write_pdf(documents / 'b.pdf')
+    (documents / 'broken.pdf').write_bytes(b'not a pdf')
+    journal = tmp_path / 'journal.jsonl'
+    run = lambda *extra: batch.main(['run', str(documents), '--journal', str(journal), *extra])
+
+    assert run() == 0
+    first = {record["file"]: record for record in read_journal(journal)}
+    assert set(first) == {'a.pdf', 'b.pdf', 'broken.pdf'}
+    assert first['a.pdf']['status'] == 'success' and first['a.pdf']['total_pages'] == 2
+    assert first['broken.pdf']['status'] == 'error'
+
+    # Повторный запуск ничего не дописывает: все файлы уже в журнале
+    assert run() == 0
+    assert len(read_journal(journal)) == 3
+
+    # --retry-errors повторяет только файл с ошибкой; сводка берет его последнюю запись
+    (documents / 'broken.pdf').unlink()
+    write_pdf(documents / 'broken.pdf')
+    assert run('--retry-errors') == 0
+    records = read_journal(journal)
+    assert [record["file"] for record in records[3:]] == ['broken.pdf']
+    assert records[3]['status'] == 'success'
+    summary = batch.summarize(journal)
+    assert (summary['files'], summary['successful'], summary['failed']) == (3, 3, 0)
+    assert summary['total_pages_processed'] == 4
+
+
+def test_run_limit_takes_only_new_files(tmp_path, fake_models):
+    documents = tmp_path / 'docs'
+    documents.mkdir()
+    for name in ('a.pdf', 'b.pdf', 'c.pdf'):
+        write_pdf(documents / name)
+    journal = tmp_path / 'journal.jsonl'
+    batch.main(['run', str(documents), '--journal', str(journal), '--limit', '2'])
+    batch.main(['run', str(documents), '--journal', str(journal), '--limit', '2'])
+    assert [record["file"] for record in read_journal(journal)] == ['a.pdf', 'b.pdf', 'c.pdf']
@@ -0,0 +1,102 @@
+# test_deadlines.py - бюджеты времени: срок документа, лимит детектора и частичные ответы
+import time
+
+import fitz
+import pytest
+
+from enums import DETECTORS
+from services.deadlines import Deadline, DetectorTimeout, parse_budget_ms
+from services.fake_inspector import FakeInspector
+from services.pipeline import analyze_document, make_options, verify_document
+
+
+def make_pdf(pages=3):
+    document = fitz.open()
+    for _ in range(pages):
+        document.new_page(width=200, height=300)
+    content = document.tobytes()
+    document.close()
+    return content
+
+
+def fake_inspector(**latency_ms):
+    latency = {name: 0.0 for name in DETECTORS}
+    latency.update(latency_ms)
+    return FakeInspector(latency_ms=latency, seed=0)
+
+
+def test_parse_budget_ms():
+    assert parse_budget_ms(None, 'deadline_ms') is None
+    assert parse_budget_ms('', 'deadline_ms') is None
+    assert parse_budget_ms('250', 'deadline_ms') == 250.0
+    for value in ('abc', '0', '-5'):
+        with pytest.raises(ValueError):
+            parse_budget_ms(value, 'deadline_ms')
+
+
+def test_unlimited_deadline_runs_inline():
+    deadline = Deadline()
+    assert not deadline.limited
+    assert deadline.remaining() is None and deadline.timeout() is None
+    assert deadline.run(lambda: 42) == 42
+
+
+def test_timeout_is_smaller_of_detector_limit_and_remaining_time():
+    deadline = Deadline(deadline_ms=10000, detector_timeout_ms=50)
+    assert deadline.timeout() == pytest.approx(0.05)
+    deadline = Deadline(deadline_ms=20, detector_timeout_ms=10000)
+    assert deadline.timeout() <= 0.02
+
+
+def test_run_raises_when_call_exceeds_limit():
+    deadline = Deadline(detector_timeout_ms=20)
+    with pytest.raises(DetectorTimeout):
+        deadline.run(lambda: time.sleep(0.5))
+    assert deadline.run(lambda: 'ok') == 'ok'
+
+
+def test_expired_deadline_fails_without_calling():
+    deadline = Deadline(deadline_ms=1)
+    time.sleep(0.01)
+    assert deadline.expired()
+    called = []
+    with pytest.raises(DetectorTimeout):
+        deadline.run(lambda: called.append(True))
+    assert called == []
+
+
+def test_detector_timeout_keeps_other_detectors(tmp_path):
+    options = make_options(annotate='none', detector_timeout_ms='50')
+    result = analyze_document(fake_inspector(signatures=500), 'doc.pdf', make_pdf(2), tmp_path, options)
+    assert result['partial'] is True
+    for page in result['pages']:
+        assert page['timed_out'] == ['signatures']
+        assert page['detections']['signatures'] == []
+        assert 'skipped' not in page
+
+
+def test_deadline_skips_remaining_pages(tmp_path):
+    options = make_options(annotate='none', deadline_ms='100')
+    result = analyze_document(fake_inspector(signatures=300), 'doc.pdf', make_pdf(3), tmp_path, options)
+    assert result['partial'] is True
+    assert result['total_pages'] == 3
+    first, *rest = result['pages']
+    assert 'signatures' in first['timed_out'] and not first.get('skipped')
+    for page in rest:
+        assert page['skipped'] is True
+        assert page['timings'] == {}
+        assert page['timed_out'] == list(DETECTORS)
+        assert page['counts'] == {name: 0 for name in DETECTORS}
+
+
+def test_no_budget_is_not_partial(tmp_path):
+    result = analyze_document(fake_inspector(), 'doc.pdf', make_pdf(2), tmp_path, make_options(annotate='none'))
+    assert result['partial'] is False
+    assert all(page['timed_out'] == [] for page in result['pages'])
+
+
+def test_verify_marks_unfinished_check_partial():
+    options = make_options(detector_timeout_ms='50')
+    result = verify_document(fake_inspector(signatures=500), 'doc.pdf', make_pdf(2), {'signatures': 0.0}, options)
+    assert result['verified'] is False
+    assert result['partial'] is True
@@ -0,0 +1,80 @@
+# test_fusion.py - NMS/WBF внутри класса и правила вложенности между классами
+import numpy as np
+import pytest
+
+from services.fusion import (
+    DEFAULT_IOU, apply_containment, fuse_detections, nms, parse_containment, parse_fusion, weighted_box_fusion
+)
+
+
+def detection(bbox, confidence, label='signature'):
+    return {'label': label, 'bbox': list(bbox), 'confidence': confidence}
+
+
+def test_nms_keeps_best_of_overlapping_and_separate_boxes():
+    boxes = np.array([[0, 0, 10, 10], [1, 1, 11, 11], [50, 50, 60, 60]], dtype=np.float64)
+    scores = np.array([0.6, 0.9, 0.5])
+    assert nms(boxes, scores, 0.5).tolist() == [1, 2]
+
+
+def test_nms_threshold_above_overlap_keeps_all():
+    boxes = np.array([[0, 0, 10, 10], [1, 1, 11, 11]], dtype=np.float64)
+    # IoU этих боксов 81 / 119 ~ 0.68
+    assert sorted(nms(boxes, np.array([0.6, 0.9]), 0.7).tolist()) == [0, 1]
+
+
+def test_weighted_box_fusion_averages_by_confidence():
+    boxes = np.array([[0, 0, 10, 10], [1, 1, 11, 11]], dtype=np.float64)
+    fused = weighted_box_fusion(boxes, np.array([0.75, 0.25]), 0.5)
+    assert len(fused) == 1
+    leader, box = fused[0]
+    assert leader == 0
+    assert box == pytest.approx([0.25, 0.25, 10.25, 10.25])
+
+
+def test_fuse_detections_wbf_keeps_leader_fields():
+    page = {'signatures': [detection([0, 0, 10, 10], 0.25), detection([1, 1, 11, 11], 0.75)]}
+    fused = fuse_detections(page, 'wbf', 0.5)
+    assert len(fused['signatures']) == 1
+    assert fused['signatures'][0]['confidence'] == 0.75
+    assert fused['signatures'][0]['bbox'] == pytest.approx([0.75, 0.75, 10.75, 10.75])
+
+
+def test_fuse_detections_none_leaves_duplicates():
+    page = {'stamps': [detection([0, 0, 10, 10], 0.9, 'stamp'), detection([0, 0, 10, 10], 0.8, 'stamp')]}
+    assert len(fuse_detections(page, 'none')['stamps']) == 2
+
+
+def test_containment_removes_only_boxes_mostly_inside():
+    page = {
+        'signatures': [detection([10, 10, 20, 20], 0.9), detection([90, 10, 110, 20], 0.9)],
+        'stamps': [detection([0, 0, 100, 100], 0.8, 'stamp')],
+    }
+    # Вторая подпись лежит внутри штампа наполовину: при пороге 0.8 остается
+    result = apply_containment(page, (('signatures', 'stamps', 0.8),))
+    assert [det['bbox'] for det in result['signatures']] == [[90, 10, 110, 20]]
+    assert len(result['stamps']) == 1
+
+
+def test_containment_without_outer_boxes_keeps_everything():
+    page = {'signatures': [detection([10, 10, 20, 20], 0.9)], 'stamps': []}
+    assert len(apply_containment(page, (('signatures', 'stamps', 0.8),))['signatures']) == 1
+
+
+def test_parse_fusion():
+    assert parse_fusion(None) == ('nms', DEFAULT_IOU)
+    assert parse_fusion('WBF:0.6') == ('wbf', 0.6)
+    assert parse_fusion('none') == ('none', DEFAULT_IOU)
+    for value in ('soft-nms', 'nms:abc', 'nms:0', 'nms:1.5'):
+        with pytest.raises(ValueError):
+            parse_fusion(value)
+
+
+def test_parse_containment():
+    assert parse_containment(None) == ()
+    assert parse_containment('signatures@stamps:0.8, qr-codes@stamps') == (
+        ('signatures', 'stamps', 0.8), ('qr_codes', 'stamps', 0.9)
+    )
+    for value in ('signatures@signatures', 'signatures@tables:0.5', 'signatures@stamps:x'):
+        with pytest.raises(ValueError):
+            parse_containment(value)
@@ -0,0 +1,64 @@
+# test_parsers.py - разбор query-параметров запроса: детекторы, пороги, обязательные элементы, настройки
+import pytest
+
+from enums import DETECTORS
+from services.pipeline import (
+    PRESENCE_CONFIDENCE, make_options, parse_detectors, parse_required, parse_thresholds
+)
+
+
+def test_parse_detectors_canonical_order_and_aliases():
+    assert parse_detectors(None) == DETECTORS
+    assert parse_detectors('stamps, qr-codes,stamps') == ('qr_codes', 'stamps')
+
+
+@pytest.mark.parametrize('value', ['tables', ',,', 'signatures,tables'])
+def test_parse_detectors_rejects_unknown_or_empty(value):
+    with pytest.raises(ValueError):
+        parse_detectors(value)
+
+
+def test_parse_thresholds_global_and_per_detector():
+    assert parse_thresholds(None) == {}
+    assert parse_thresholds('0.5', ('signatures', 'stamps')) == {'signatures': 0.5, 'stamps': 0.5}
+    # Значения по детекторам перекрывают общее, если идут после него
+    assert parse_thresholds('0.5,qr-codes:0.3') == {'signatures': 0.5, 'qr_codes': 0.3, 'stamps': 0.5}
+
+
+@pytest.mark.parametrize('value', ['abc', '1.5', 'stamps:-0.1', 'tables:0.5'])
+def test_parse_thresholds_rejects_invalid(value):
+    with pytest.raises(ValueError):
+        parse_thresholds(value)
+
+
+def test_parse_required():
+    assert parse_required('stamps:0.7,signatures') == {'signatures': PRESENCE_CONFIDENCE, 'stamps': 0.7}
+
+
+@pytest.mark.parametrize('value', [None, '', 'tables', 'stamps:x', 'stamps:2'])
+def test_parse_required_rejects_invalid(value):
+    with pytest.raises(ValueError):
+        parse_required(value)
+
+
+def test_make_options_from_query():
+    options = make_options('qr_codes,stamps', 'stamps:0.4', 'wbf:0.6', 'qr_codes@stamps:0.8',
+                           tier='fast', annotate='svg', deadline_ms='5000')
+    assert options.detectors == ('qr_codes', 'stamps')
+    assert options.thresholds == {'stamps': 0.4}
+    assert (options.fusion, options.fusion_iou) == ('wbf', 0.6)
+    assert options.containment == (('qr_codes', 'stamps', 0.8),)
+    assert (options.tier, options.annotate, options.deadline_ms) == ('fast', 'svg', 5000.0)
+    assert options.detector_timeout_ms is None
+
+
+@pytest.mark.parametrize('kwargs', [
+    {'qr_screen': 'always'},
+    {'signature_mode': 'crop'},
+    {'tier': 'huge'},
+    {'annotate': 'png'},
+    {'detector_timeout_ms': '0'},
+])
+def test_make_options_rejects_invalid(kwargs):
+    with pytest.raises(ValueError):
+        make_options(**kwargs)
@@ -0,0 +1,96 @@
+# test_registry.py - реестр детекторов и версии моделей для повторной обработки архива
+import json
+import os
+from dataclasses import replace
+
+import pytest
+
+from services import registry
+from services.archive import stale_detectors
+from services.pipeline import make_options
+from services.registry import DetectorSpec, load_registry, model_version, parse_tiers
+
+
+def spec(**changes):
+    return replace(DetectorSpec('stamps', 'balanced', 'ultralytics', 'models/best.pt'), **changes)
+
+
+@pytest.fixture
+def weights_root(tmp_path, monkeypatch):
+    """Локальные веса ищутся от корня проекта: подменяем его временным каталогом"""
+    monkeypatch.setattr(registry, 'PROJECT_ROOT', tmp_path)
+    (tmp_path / 'models').mkdir()
+    return tmp_path
+
+
+def test_model_version_is_stable_and_ignores_threshold(weights_root):
+    assert model_version(spec()) == model_version(spec())
+    assert model_version(spec(threshold=0.2)) == model_version(spec())
+    assert model_version(spec(tier='fast')) == model_version(spec())
+
+
+def test_model_version_changes_with_backend_weights_and_input_size(weights_root):
+    base = model_version(spec())
+    assert model_version(spec(input_size=1024)) != base
+    assert model_version(spec(weights='models/other.pt')) != base
+    assert model_version(spec(backend='yolos')) != base
+
+
+def test_model_version_tracks_local_weights_content(weights_root):
+    weights = weights_root / 'models' / 'best.pt'
+    missing = model_version(spec())
+    weights.write_bytes(b'weights v1')
+    first = model_version(spec())
+    assert first != missing
+    assert model_version(spec()) == first
+
+    weights.write_bytes(b'weights v2, retrained')
+    stat = weights.stat()
+    # Новый mtime, даже если файловая система округляет время записи
+    os.utime(weights, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert model_version(spec()) != first
+
+
+def test_load_registry(tmp_path):
+    path = tmp_path / 'detectors.json'
+    path.write_text(json.dumps({"default_tier": "fast", "detectors": [
+        {"name": "qr_codes", "tier": "fast", "backend": "qrdet", "weights": "n"},
+        {"name": "qr_codes", "tier": "accurate", "backend": "qrdet", "weights": "l", "threshold": 0.3},
+    ]}), encoding='utf-8')
+    loaded = load_registry(path)
+    assert loaded.get('qr_codes').weights == 'n'
+    assert loaded.get('qr_codes', 'accurate').threshold == 0.3
+    with pytest.raises(ValueError):
+        loaded.get('stamps')
+
+
+@pytest.mark.parametrize('item', [
+    {"name": "tables", "tier": "fast", "backend": "qrdet", "weights": "n"},
+    {"name": "qr_codes", "tier": "huge", "backend": "qrdet", "weights": "n"},
+    {"name": "qr_codes", "tier": "fast", "backend": "onnx", "weights": "n"},
+    {"name": "qr_codes", "tier": "fast", "backend": "qrdet", "weights": "n", "device": "cuda"},
+])
+def test_load_registry_rejects_invalid_entries(tmp_path, item):
+    path = tmp_path / 'detectors.json'
+    path.write_text(json.dumps({"detectors": [item]}), encoding='utf-8')
+    with pytest.raises(ValueError):
+        load_registry(path)
+
+
+def test_parse_tiers():
+    assert parse_tiers(None) is None
+    assert parse_tiers('accurate, fast') == ('fast', 'accurate')
+    with pytest.raises(ValueError):
+        parse_tiers('fast,huge')
+
+
+def test_stale_detectors_follow_model_versions():
+    options = make_options('signatures,stamps', signature_mode='roi')
+    page = {"versions": {"signatures": "a", "stamps": "b"}}
+    assert stale_detectors(page, {"signatures": "a", "stamps": "b"}, options) == ()
+    assert stale_detectors(page, {"signatures": "x", "stamps": "b"}, options) == ('signatures',)
+    # В roi-режиме новые штампы меняют области подписей
+    assert stale_detectors(page, {"signatures": "a", "stamps": "x"}, options) == ('signatures', 'stamps')
+    assert stale_detectors(page, {"signatures": "a", "stamps": "b"}, options, force=('stamps',)) == (
+        'signatures', 'stamps'
+    )
@@ -1,4 +1,4 @@
-import React, { useState } from 'react';
+import React, { useEffect, useState } from 'react';
 
 function App() {
   const [file, setFile] = useState(null);
@@ -6,15 +6,27 @@ function App() {
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState('');
   const [dragOver, setDragOver] = useState(false);
+  const [previewUrl, setPreviewUrl] = useState(null);
+
+  // Local copy of an uploaded image: SVG overlays (annotate=svg) are drawn on top of it
+  useEffect(() => {
+    if (!file || !file.type.startsWith('image/')) {
+      setPreviewUrl(null);
+      return undefined;
+    }
+    const url = URL.createObjectURL(file);
+    setPreviewUrl(url);
+    return () => URL.revokeObjectURL(url);
+  }, [file]);
 
   const API_BASE = 'http://localhost:8000';
 
   const handleFileChange = (e) => {
     const selectedFile = e.target.files[0];
     if (selectedFile) {
-      const allowedTypes = ['image/jpeg', 'image/png', 'image/jpg', 'application/pdf'];
+      const allowedTypes = ['image/jpeg', 'image/png', 'image/jpg', 'image/tiff', 'application/pdf'];
       if (!allowedTypes.includes(selectedFile.type) && !selectedFile.name.toLowerCase().endsWith('.pdf')) {
-        setError('Please select a valid file (JPEG, PNG, PDF)');
+        setError('Please select a valid file (JPEG, PNG, TIFF, PDF)');
         setFile(null);
         return;
       }
@@ -29,9 +41,9 @@ function App() {
     setDragOver(false);
     const droppedFile = e.dataTransfer.files[0];
     if (droppedFile) {
-      const allowedTypes = ['image/jpeg', 'image/png', 'image/jpg', 'application/pdf'];
+      const allowedTypes = ['image/jpeg', 'image/png', 'image/jpg', 'image/tiff', 'application/pdf'];
       if (!allowedTypes.includes(droppedFile.type) && !droppedFile.name.toLowerCase().endsWith('.pdf')) {
-        setError('Please select a valid file (JPEG, PNG, PDF)');
+        setError('Please select a valid file (JPEG, PNG, TIFF, PDF)');
         return;
       }
       setFile(droppedFile);
@@ -49,6 +61,42 @@ function App() {
     setDragOver(false);
   };
 
+  const applyEvent = (eventName, data) => {
+    if (eventName === 'started') {
+      setResult({
+        success: true,
+        file_type: data.file_type,
+        total_pages: data.total_pages,
+        pages: [],
+        complete: false,
+      });
+    } else if (eventName === 'detected' || eventName === 'persisted') {
+      setResult((prev) => {
+        if (!prev) return prev;
+        const page = { ...data, persisted: eventName === 'persisted' };
+        delete page.event;
+        const pages = prev.pages.filter((p) => p.page !== page.page);
+        pages.push({ ...prev.pages.find((p) => p.page === page.page), ...page });
+        pages.sort((a, b) => a.page - b.page);
+        const next = { ...prev, pages };
+        if (prev.file_type === 'image') {
+          next.detections = page.detections;
+          next.counts = page.counts;
+          next.timed_out = page.timed_out;
+          next.result_image_url = page.result_image_url || prev.result_image_url;
+          next.overlay_url = page.overlay_url || prev.overlay_url;
+        }
+        return next;
+      });
+    } else if (eventName === 'annotated') {
+      setResult((prev) => prev && { ...prev, annotated_pdf_url: data.annotated_pdf_url });
+    } else if (eventName === 'done') {
+      setResult((prev) => prev && { ...prev, total_counts: data.total_counts, complete: true });
+    } else if (eventName === 'error') {
+      setError(data.error || 'Detection failed');
+    }
+  };
+
   const detectAll = async () => {
     if (!file) return;
     
@@ -59,17 +107,36 @@ function App() {
     formData.append('file', file);
     
     try {
-      const response = await fetch(`${API_BASE}/api/detect/all`, {
+      const response = await fetch(`${API_BASE}/api/detect/stream`, {
         method: 'POST',
         body: formData,
       });
-      
-      const data = await response.json();
-      
-      if (data.success) {
-        setResult(data);
-      } else {
+
+      if (!response.ok) {
+        const data = await response.json();
         setError(data.error || 'Detection failed');
+        return;
+      }
+
+      // Server-Sent Events: "event: ...\ndata: {...}" blocks separated by a blank line
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      for (;;) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const blocks = buffer.split('\n\n');
+        buffer = blocks.pop();
+        for (const block of blocks) {
+          let eventName = 'message';
+          let payload = '';
+          for (const line of block.split('\n')) {
+            if (line.startsWith('event: ')) eventName = line.slice(7);
+            else if (line.startsWith('data: ')) payload += line.slice(6);
+          }
+          if (payload) applyEvent(eventName, JSON.parse(payload));
+        }
       }
     } catch (err) {
       setError('Connection error: ' + err.message);
@@ -87,7 +154,8 @@ function App() {
   const downloadJSON = () => {
     if (!result) return;
     
-    const json = JSON.stringify(result, null, 2);
+    const { complete, ...data } = result;
+    const json = JSON.stringify(data, null, 2);
     const blob = new Blob([json], { type: 'application/json' });
     const url = URL.createObjectURL(blob);
     const a = document.createElement('a');
@@ -163,7 +231,7 @@ function App() {
               type="file" 
               id="fileInput"
               onChange={handleFileChange} 
-              accept=".jpg,.jpeg,.png,.pdf,image/*,application/pdf"
+              accept=".jpg,.jpeg,.png,.tif,.tiff,.pdf,image/*,application/pdf"
               style={{ display: 'none' }}
             />
             <button 
@@ -188,7 +256,7 @@ function App() {
         )}
 
         {/* File Info */}
-        {file && !result && (
+        {file && (!result || (loading && result.pages.length === 0)) && (
           <div style={{
             background: 'white',
             padding: '30px',
@@ -232,10 +300,24 @@ function App() {
           </div>
         )}
 
+        {/* Progress */}
+        {result && !result.complete && result.file_type !== 'image' && (
+          <div style={{
+            background: 'white',
+            padding: '16px',
+            borderRadius: '8px',
+            marginTop: '20px',
+            textAlign: 'center',
+            color: '#2d3748',
+          }}>
+            Processed {result.pages.filter((p) => p.persisted).length} of {result.total_pages} pages...
+          </div>
+        )}
+
         {/* Results */}
-        {result && (
+        {result && result.pages.length > 0 && (
           <div style={{ marginTop: '40px' }}>
-            {result.file_type === 'pdf' ? (
+            {result.file_type !== 'image' ? (
               <>
                 {result.pages.map((page, index) => (
                   <div key={index} style={{
@@ -254,6 +336,11 @@ function App() {
                     }}>
                       Page {page.page}
                     </div>
+                    {page.timed_out?.length > 0 && (
+                      <div style={{ color: '#c05621', textAlign: 'center', marginBottom: '12px' }}>
+                        {page.skipped ? 'Skipped: time budget exceeded' : `Timed out: ${page.timed_out.join(', ')}`}
+                      </div>
+                    )}
                     <div style={{
                       width: '100%',
                       maxWidth: '600px',
@@ -262,12 +349,18 @@ function App() {
                       borderRadius: '8px',
                       overflow: 'hidden',
                     }}>
-                      {page.result_image_url && (
+                      {page.result_image_url ? (
                         <img 
                           src={`${API_BASE}${page.result_image_url}`} 
                           alt={`Page ${page.page}`}
                           style={{ width: '100%', height: 'auto', display: 'block' }}
                         />
+                      ) : page.overlay_url && (
+                        <img
+                          src={`${API_BASE}${page.overlay_url}`}
+                          alt={`Page ${page.page} boxes`}
+                          style={{ width: '100%', height: 'auto', display: 'block', background: 'white' }}
+                        />
                       )}
                     </div>
                   </div>
@@ -323,6 +416,19 @@ function App() {
                   </div>
                 </div>
 
+                {result.annotated_pdf_url && (
+                  <div style={{ textAlign: 'center', marginTop: '24px' }}>
+                    <a
+                      href={`${API_BASE}${result.annotated_pdf_url}`}
+                      target="_blank"
+                      rel="noreferrer"
+                      style={{ color: '#3498db', fontSize: '16px' }}
+                    >
+                      Download annotated PDF
+                    </a>
+                  </div>
+                )}
+
                 {/* Add Another File Button */}
                 <div style={{ textAlign: 'center', marginTop: '24px' }}>
                   <button 
@@ -361,6 +467,11 @@ function App() {
                   }}>
                     Detection Result
                   </div>
+                  {result.timed_out?.length > 0 && (
+                    <div style={{ color: '#c05621', textAlign: 'center', marginBottom: '12px' }}>
+                      Timed out: {result.timed_out.join(', ')}
+                    </div>
+                  )}
                   <div style={{
                     width: '100%',
                     maxWidth: '600px',
@@ -369,12 +480,25 @@ function App() {
                     borderRadius: '8px',
                     overflow: 'hidden',
                   }}>
-                    {result.result_image_url && (
+                    {result.result_image_url ? (
                       <img 
                         src={`${API_BASE}${result.result_image_url}`} 
                         alt="Detection result"
                         style={{ width: '100%', height: 'auto', display: 'block' }}
                       />
+                    ) : result.overlay_url && previewUrl && (
+                      <div style={{ position: 'relative' }}>
+                        <img
+                          src={previewUrl}
+                          alt="Uploaded file"
+                          style={{ width: '100%', height: 'auto', display: 'block' }}
+                        />
+                        <img
+                          src={`${API_BASE}${result.overlay_url}`}
+                          alt="Detection boxes"
+                          style={{ position: 'absolute', top: 0, left: 0, width: '100%', height: '100%' }}
+                        />
+                      </div>
                     )}
                   </div>
                 </div>
@@ -429,6 +553,19 @@ function App() {
                   </div>
                 </div>
 
+                {result.annotated_pdf_url && (
+                  <div style={{ textAlign: 'center', marginTop: '24px' }}>
+                    <a
+                      href={`${API_BASE}${result.annotated_pdf_url}`}
+                      target="_blank"
+                      rel="noreferrer"
+                      style={{ color: '#3498db', fontSize: '16px' }}
+                    >
+                      Download annotated PDF
+                    </a>
+                  </div>
+                )}
+
                 {/* Add Another File Button */}
                 <div style={{ textAlign: 'center', marginTop: '24px' }}>
                   <button 